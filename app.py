@@ -1,6 +1,12 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
-from src.persona_predictor import load_personas, extract_keywords, score_personas, classify_with_gpt
+from src.persona_predictor import predict_rule_based, classify_with_gpt, classify_with_gpt_stream
+from src.persona_registry import PersonaRegistry
 from src.ui_components import (
+    GptPersonaView,
+    PipelineProgress,
     show_loading_animation,
     show_intro_message,
     display_personas_sidebar,
@@ -9,36 +15,83 @@ from src.ui_components import (
     handle_default_values
 )
 from src.image_utils import get_image_base64
-from src.custom_logger import get_logger
+from src.custom_logger import get_logger, annotate_request, RequestLog
+from src.keyword_cache import KeywordAggregate
+from src.metrics import profile_request, timer
 
 # Initialize logger
 logger = get_logger()
 
-# Load personas once
-PERSONAS = load_personas('data/personas/personas.yaml')
+# Streamlit re-executes this script on every interaction, so shared resources
+# are created once per process through st.cache_resource
+@st.cache_resource(show_spinner=False)
+def get_persona_registry():
+    # Watches personas.yaml and swaps in edits without a restart
+    return PersonaRegistry('data/personas/personas.yaml').start()
+
+# Load personas once; each run takes the current set from the registry
+PERSONA_REGISTRY = get_persona_registry()
+
+# Progressive mode drives the progress bar from the real pipeline stages, shows the
+# rule-based results as soon as they are ready and runs GPT in the background.
+# Set PERSONA_PROGRESSIVE_UI=0 for the original timed animation and intro screen.
+PROGRESSIVE_UI = os.environ.get("PERSONA_PROGRESSIVE_UI", "1") != "0"
+# In progressive mode the GPT answer is streamed and shown as it is written;
+# PERSONA_GPT_STREAM=0 waits for the whole answer in the background instead
+STREAM_GPT = PROGRESSIVE_UI and os.environ.get("PERSONA_GPT_STREAM", "1") != "0"
+
+# Shared across sessions; GPT calls are I/O bound so threads are enough
+@st.cache_resource(show_spinner=False)
+def get_gpt_executor():
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="gpt")
 
 def process_persona_prediction(bio, posts):
-    """Main function to process persona prediction"""
-    # Show loading animation
-    show_loading_animation()
-    
-    # Join all posts with spaces
-    posts_text = " ".join(posts)
-    user_input = bio + " " + posts_text
-    
-    # Log the query
-    logger.info("------------------------------------")
-    logger.info(f"Query received - Bio: {bio}, Posts: {posts}")
+    """Main function to process persona prediction; the whole request is logged as one JSON line and timed per stage"""
+    with RequestLog(bio, posts, logger), profile_request("prediction"), timer("prediction"):
+        _predict_and_render(bio, posts)
+
+def _predict_and_render(bio, posts):
+    # One snapshot for the whole prediction, even if the personas are reloaded meanwhile
+    personas = PERSONA_REGISTRY.current()
+    annotate_request(personas_version=personas.version)
+    if PROGRESSIVE_UI:
+        progress = PipelineProgress()
+        progress.stage("parse")
+    else:
+        # Show loading animation
+        show_loading_animation()
     
-    tokens = extract_keywords(user_input)
-    top_personas = score_personas(PERSONAS, tokens, top_n=3)
+    # The bio and every post are parsed separately and only when new or edited;
+    # the session keeps the running keyword totals between predictions, per persona
+    # set, as lite mode lemmas depend on the persona vocabulary. Sessions submitting
+    # the same input at the same time share one computation
+    if st.session_state.get('keyword_aggregate_version') != personas.version:
+        st.session_state.keyword_aggregate = KeywordAggregate()
+        st.session_state.keyword_aggregate_version = personas.version
+    top_personas = predict_rule_based(personas, bio, posts, top_n=3, aggregate=st.session_state.keyword_aggregate)
+    if PROGRESSIVE_UI:
+        progress.stage("score")
+
+    # Start GPT right away so it runs while the rule-based results render; a
+    # streamed answer starts after them, as it is shown below them while it arrives.
+    # Posts go to GPT as a list so the prompt budget can drop repeats and sample them
+    openai_api_key = st.secrets["general"]["openai_api_key"] if "openai_api_key" in st.secrets["general"] else None
+    gpt_candidates = [p[0] for p in top_personas if p[1] > 0 and p[2]]
+    gpt_future = None
+    if openai_api_key and PROGRESSIVE_UI:
+        progress.stage("llm")
+        if not STREAM_GPT:
+            # Run in a copy of this context so the GPT call annotates this request's log line
+            gpt_future = get_gpt_executor().submit(contextvars.copy_context().run, classify_with_gpt,
+                                                   bio, posts, gpt_candidates, openai_api_key)
 
     # Log rule-based matches
-    for persona, score, matched_keywords, confidence in top_personas:
-        if score > 0 and matched_keywords:
-            logger.info(f"Rule-based match - Persona: {persona['display_name']}, "
-                       f"Score: {score}, Keywords: {matched_keywords}, "
-                       f"Confidence: {confidence:.1f}%")
+    annotate_request(rule_based=[
+        {"persona": persona['persona_name'], "score": score, "keywords": matched_keywords,
+         "confidence": round(confidence, 1)}
+        for persona, score, matched_keywords, confidence in top_personas
+        if score > 0 and matched_keywords
+    ])
 
     st.subheader(":sparkles: Top Rule-Based Personas :sparkles:")
     shown_any = False
@@ -54,29 +107,38 @@ def process_persona_prediction(bio, posts):
         st.info("No strong persona matches found for your input.")
 
     # GPT processing if API key is available
-    openai_api_key = st.secrets["general"]["openai_api_key"] if "openai_api_key" in st.secrets["general"] else None
     if openai_api_key:
-        gpt_persona, gpt_reasoning = classify_with_gpt(bio, posts_text, [p[0] for p in top_personas if p[1] > 0 and p[2]], openai_api_key)
+        if STREAM_GPT:
+            gpt_view = GptPersonaView(personas)
+            gpt_persona, gpt_reasoning = "", ""
+            for gpt_persona, gpt_reasoning in classify_with_gpt_stream(bio, posts, gpt_candidates, openai_api_key):
+                gpt_view.update(gpt_persona, gpt_reasoning)
+            progress.done()
+        elif gpt_future is not None:
+            with st.spinner("Asking GPT for a second opinion..."):
+                gpt_persona, gpt_reasoning = gpt_future.result()
+            progress.done()
+            gpt_view = GptPersonaView(personas)
+        else:
+            gpt_persona, gpt_reasoning = classify_with_gpt(bio, posts, gpt_candidates, openai_api_key)
+            gpt_view = GptPersonaView(personas)
         
         # Log GPT response
-        logger.info(f"GPT Analysis - Selected Persona: {gpt_persona}, Reasoning: {gpt_reasoning}")
+        annotate_request(gpt_persona=gpt_persona, gpt_reasoning=gpt_reasoning)
         
         if gpt_persona:        
-            matching_persona = next((p for p in PERSONAS if p['persona_name'] == gpt_persona), None)
-            matching_persona_display_name = matching_persona['display_name']
-            
-            st.subheader(":crystal_ball: GPT-Analyzed Persona :crystal_ball:")
-            st.markdown(f"<div style='font-size:2rem;'>{matching_persona_display_name}</div>", unsafe_allow_html=True)
-            st.markdown(f"<b>Reasoning:</b> {gpt_reasoning}", unsafe_allow_html=True)
-            
+            gpt_view.update(gpt_persona, gpt_reasoning, final=True)
+            matching_persona = next((p for p in personas if p['persona_name'] == gpt_persona), None)
             if matching_persona:
                 st.markdown("<hr>", unsafe_allow_html=True)
                 display_persona_images(matching_persona)
         else:
+            gpt_view.clear()
             st.info("GPT could not confidently select a persona.")
     else:
+        if PROGRESSIVE_UI:
+            progress.done()
         st.info("OpenAI API key not found in secrets.toml.")
-    logger.info("------------------------------------")
 
 def main():
     st.set_page_config(page_title="Digital Persona Predictor", page_icon="✨")
@@ -94,14 +156,14 @@ def main():
     if 'intro_shown' not in st.session_state:
         st.session_state.intro_shown = False
     
-    # Show intro message if it hasn't been shown yet
-    if not st.session_state.intro_shown:
+    # Show intro message if it hasn't been shown yet; it blocks the page, so progressive mode skips it
+    if not st.session_state.intro_shown and not PROGRESSIVE_UI:
         show_intro_message()
         st.session_state.intro_shown = True
         st.rerun()
     
     # Display personas in sidebar
-    display_personas_sidebar(PERSONAS)
+    display_personas_sidebar(PERSONA_REGISTRY.current())
     
     # Display main UI and get user inputs
     bio, post_values, predict_button, fill_defaults = display_main_ui()
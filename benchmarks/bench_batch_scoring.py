@@ -0,0 +1,99 @@
+'''
+Parity check and throughput benchmark for vectorized batch scoring.
+
+Scores the same token lists with PersonaIndex.score_many (one set of matrix
+operations per chunk of users) and with PersonaIndex.score called once per
+user, against the real personas and synthetic catalogues. Token lists are
+drawn from the persona keywords, their negative keywords and filler words,
+so every case has positive hits, negative penalties and all-zero users.
+Runs without spaCy.
+
+Run from the repository root:
+    python -m benchmarks.bench_batch_scoring [--users 20000] [--personas 100 1000] [--top-n 3]
+
+Exits with status 1 if the two paths disagree on any user.
+'''
+import argparse
+import random
+import sys
+import time
+
+from benchmarks.corpus import FILLER, generate_personas, read_personas
+from src.persona_index import PersonaIndex
+
+
+def make_token_lists(rng, personas, count):
+    positive = sorted({kw.lower() for p in personas for kw in p.get("keywords", []) or []})
+    negative = sorted({kw.lower() for p in personas for kw in p.get("negative_keywords", []) or []})
+    token_lists = []
+    for _ in range(count):
+        if rng.random() < 0.05:
+            token_lists.append(rng.choices(FILLER, k=rng.randint(0, 20)))
+            continue
+        tokens = rng.choices(positive, k=rng.randint(1, 30))
+        if negative and rng.random() < 0.5:
+            tokens += rng.choices(negative, k=rng.randint(1, 4))
+        tokens += rng.choices(FILLER, k=rng.randint(0, 20))
+        rng.shuffle(tokens)
+        token_lists.append(tokens)
+    return token_lists
+
+
+def comparable(results):
+    return [(p["persona_name"], type(score), score, matched, confidence)
+            for p, score, matched, confidence in results]
+
+
+def check_parity(index, token_lists, top_n):
+    batched = index.score_many(token_lists, top_n=top_n)
+    mismatches = 0
+    for user, (tokens, results) in enumerate(zip(token_lists, batched)):
+        expected = comparable(index.score(tokens, top_n=top_n))
+        if comparable(results) != expected:
+            mismatches += 1
+            if mismatches <= 3:
+                print(f"  user {user}: score_many {comparable(results)[:3]} != score {expected[:3]}")
+    return mismatches
+
+
+def time_call(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--personas", type=int, nargs="+", default=[100, 1000], help="synthetic persona counts")
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    base = read_personas()
+    catalogues = [("real", base)] + [(str(n), generate_personas(n, seed=n, base=base)) for n in args.personas]
+    failed = False
+
+    print(f"{'personas':>9} {'users':>7} {'loop users/s':>13} {'batch users/s':>14} {'speedup':>8}  parity")
+    for name, personas in catalogues:
+        rng = random.Random(args.seed)
+        index = PersonaIndex(personas)
+        token_lists = make_token_lists(rng, personas, args.users)
+
+        mismatches = check_parity(index, token_lists, args.top_n)
+        failed = failed or mismatches > 0
+        loop = time_call(lambda: [index.score(tokens, top_n=args.top_n) for tokens in token_lists], args.repeat)
+        batch = time_call(lambda: index.score_many(token_lists, top_n=args.top_n), args.repeat)
+        parity = "ok" if not mismatches else f"{mismatches} MISMATCHES"
+        print(f"{name:>9} {len(token_lists):>7} {len(token_lists) / loop:>13.0f} {len(token_lists) / batch:>14.0f} "
+              f"{loop / batch:>7.1f}x  {parity}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
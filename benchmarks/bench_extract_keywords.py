@@ -0,0 +1,43 @@
+'''
+Micro-benchmark of keyword extraction: tokens/sec of the single-parse
+`extract_keywords` against the original implementation (one extra `nlp()`
+call per unique word) on the sample inputs. Lemma-set parity of the two is
+checked by benchmarks/check_extract_keywords.py.
+
+Run from the repository root:
+    python -m benchmarks.bench_extract_keywords [--repeat 20]
+'''
+import argparse
+import time
+
+from benchmarks.check_extract_keywords import SAMPLES, legacy_extract_keywords
+from src.persona_predictor import extract_keywords, get_nlp, lemmatize_word
+
+
+def bench(name, fn, repeat):
+    n_tokens = sum(len(get_nlp().make_doc(text)) for text in SAMPLES) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in SAMPLES:
+            fn(text)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10} {elapsed:8.3f}s  {n_tokens / elapsed:10.0f} tokens/sec")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="passes over the sample set per implementation")
+    args = parser.parse_args()
+
+    # Warm up both paths so model loading isn't part of the measurement
+    for text in SAMPLES:
+        legacy_extract_keywords(text)
+        extract_keywords(text)
+
+    bench("legacy", legacy_extract_keywords, args.repeat)
+    bench("current", extract_keywords, args.repeat)
+    print(f"Lemma cache: {lemmatize_word.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
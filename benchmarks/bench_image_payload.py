@@ -0,0 +1,49 @@
+'''
+Measures the image payload of a result page, before and after thumbnails.
+
+A result page embeds every notable figure, influencer and related entity of
+the GPT-selected persona as a base64 data URI. This sums those URIs per
+persona using the full-size JPEGs (the old render path) and the thumbnails
+listed in data/thumbs/manifest.json (the current one).
+
+Build the thumbnails first, then run from the repository root:
+    python -m src.optimize_images
+    python -m benchmarks.bench_image_payload
+'''
+import base64
+import os
+
+import yaml
+
+from src.image_utils import IMAGE_DIR, get_image_data_uri, load_thumbnail_manifest
+from src.optimize_images import IMAGE_FIELDS
+
+
+def original_data_uri_bytes(name):
+    with open(os.path.join(IMAGE_DIR, f"{name}.jpeg"), "rb") as f:
+        return len("data:image/jpeg;base64,") + len(base64.b64encode(f.read()))
+
+
+def main():
+    with open("data/personas/personas.yaml", "r") as f:
+        personas = yaml.safe_load(f)
+    if not load_thumbnail_manifest()["names"]:
+        print("No thumbnail manifest found; run `python -m src.optimize_images` first.")
+
+    print(f"{'persona':<24} {'images':>6} {'before KB':>10} {'after KB':>9} {'saved':>6}")
+    total_before = total_after = 0
+    for persona in personas:
+        names = [name for field in IMAGE_FIELDS for name in persona.get(field, []) or []]
+        before = sum(original_data_uri_bytes(name) for name in names)
+        after = sum(len(get_image_data_uri(name)) for name in names)
+        total_before += before
+        total_after += after
+        print(f"{persona['persona_name']:<24} {len(names):>6} {before / 1024:>10.1f} {after / 1024:>9.1f} "
+              f"{(1 - after / before) * 100:>5.1f}%")
+
+    print(f"{'average per result page':<31} {total_before / len(personas) / 1024:>10.1f} "
+          f"{total_after / len(personas) / 1024:>9.1f} {(1 - total_after / total_before) * 100:>5.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+'''
+Benchmark of incremental per-segment keyword extraction across reruns.
+
+Replays Streamlit-style editing sessions: a user predicts, edits one post,
+adds a post, predicts again unchanged, and so on. Each prediction is
+extracted twice: with extract_keywords on the joined text (every post
+parsed again) and with extract_segment_keywords, which keeps a
+KeywordAggregate per session and only parses new or edited segments. Users
+are synthetic profiles from benchmarks.corpus.
+
+Also checks that the incrementally merged keywords equal those of parsing
+every segment from scratch, and reports how close they are to the
+whole-text parse, which can differ where spaCy's parse crosses a post
+boundary.
+
+Run from the repository root:
+    python -m benchmarks.bench_incremental_keywords [--sessions 20] [--posts 5] [--steps 6]
+
+Exits with status 1 if incremental and from-scratch keywords differ.
+'''
+import argparse
+import random
+import sys
+import time
+from collections import Counter
+
+from benchmarks.corpus import generate_users, read_personas
+from src.keyword_cache import KeywordAggregate, KeywordCache
+from src.persona_predictor import extract_keywords, extract_segment_keywords, join_user_input, load_personas
+
+
+def editing_session(rng, user, pool, steps):
+    '''
+    The (bio, posts) states of one session: the initial profile, then one
+    edit, added post or unchanged rerun per step.
+    '''
+    bio, posts = user["bio"], list(user["posts"])
+    states = [(bio, list(posts))]
+    for _ in range(steps):
+        action = rng.random()
+        if action < 0.5:
+            posts[rng.randrange(len(posts))] = rng.choice(pool)
+        elif action < 0.8:
+            posts.append(rng.choice(pool))
+        states.append((bio, list(posts)))
+    return states
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--posts", type=int, default=5)
+    parser.add_argument("--steps", type=int, default=6, help="reruns per session after the first prediction")
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    personas = load_personas("data/personas/personas.yaml")
+    phrases = personas.index.phrases
+    users = generate_users(read_personas(), args.sessions * 2, seed=args.seed, posts=args.posts)
+    pool = [post for user in users[args.sessions:] for post in user["posts"]]
+    rng = random.Random(args.seed)
+    sessions = [editing_session(rng, user, pool, args.steps) for user in users[:args.sessions]]
+
+    # Warm up the pipeline so the first timed parse doesn't pay for loading it
+    extract_keywords(join_user_input(*sessions[0][0]), phrases)
+
+    full_time = 0.0
+    incremental_time = 0.0
+    predictions = 0
+    mismatches = 0
+    overlap = []
+    cache = KeywordCache()
+    for states in sessions:
+        aggregate = KeywordAggregate()
+        for bio, posts in states:
+            start = time.perf_counter()
+            full = extract_keywords(join_user_input(bio, posts), phrases)
+            full_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            incremental = extract_segment_keywords([bio, *posts], phrases, aggregate, cache)
+            incremental_time += time.perf_counter() - start
+            predictions += 1
+
+            scratch = extract_segment_keywords([bio, *posts], phrases, KeywordAggregate(), KeywordCache())
+            if Counter(incremental) != Counter(scratch):
+                mismatches += 1
+            union = set(full) | set(incremental)
+            overlap.append(len(set(full) & set(incremental)) / len(union) if union else 1.0)
+
+    stats = cache.stats()
+    print(f"{predictions} predictions in {len(sessions)} sessions")
+    print(f"whole text:   {full_time / predictions * 1000:8.2f} ms per prediction")
+    print(f"incremental:  {incremental_time / predictions * 1000:8.2f} ms per prediction "
+          f"({full_time / incremental_time:.1f}x), segment cache hit rate {stats['hit_rate']:.0%}")
+    print(f"keyword overlap with whole-text parse: {sum(overlap) / len(overlap):.1%} (Jaccard, mean)")
+    print(f"incremental vs from-scratch mismatches: {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+'''
+Per-request logging overhead under concurrent sessions.
+
+  legacy  what the app used to do: ~12 free-text lines per request (query,
+          rule-based matches, full GPT prompt and raw response), written
+          synchronously through a FileHandler by the request thread
+  queued  the current path: one compact JSON line per request, put on a
+          queue and written by the background listener
+
+Each simulated session is a thread issuing requests back to back; only the
+time spent inside logging calls is measured. Logs go to a temporary directory.
+
+Run from the repository root:
+    python -m benchmarks.bench_logging [--requests 2000] [--sessions 1 8 32]
+'''
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from src import custom_logger
+from src.custom_logger import RequestLog, annotate_request, annotate_request_text
+from src.metrics import percentile
+
+BIO = "Adventurer, Traveler, Tech Enthusiast, Roaming the world"
+POSTS = [
+    "Visited Naples today. Was fun.",
+    "Here are the 10 reasons why you should go to Black Forest",
+    "I just released a vlog on my stay in Maldives. Go check it out.",
+]
+PROMPT = ("You are an expert in digital personas. " * 30) + f"Bio: {BIO}\nPosts: {' '.join(POSTS)}"
+RAW_RESPONSE = "Persona: travel_adventurer\nReasoning: The user travels often and shares travel content."
+MATCHES = [
+    ("travel_adventurer", 5, ["travel", "vlog", "visit", "world", "roam"], 62.5),
+    ("tech_enthusiast", 2, ["tech", "enthusiast"], 25.0),
+    ("food_lover", 1, ["fun"], 12.5),
+]
+
+
+def legacy_logger(path):
+    logger = logging.getLogger("bench.legacy")
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', '%Y-%m-%d %H:%M:%S'))
+    logger.handlers = [handler]
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger
+
+
+def legacy_request(logger):
+    logger.info("------------------------------------")
+    logger.info(f"Query received - Bio: {BIO}, Posts: {POSTS}")
+    logger.info("********************")
+    logger.info(f"GPT Prompt : {PROMPT}")
+    logger.info("********************")
+    logger.info("+++++++++++++++++++++++++++++++++++++")
+    logger.info(f"Raw GPT Response:\n{RAW_RESPONSE}")
+    logger.info("+++++++++++++++++++++++++++++++++++++")
+    for name, score, keywords, confidence in MATCHES:
+        logger.info(f"Rule-based match - Persona: {name}, Score: {score}, Keywords: {keywords}, "
+                    f"Confidence: {confidence:.1f}%")
+    logger.info(f"GPT Analysis - Selected Persona: travel_adventurer, Reasoning: {RAW_RESPONSE}")
+    logger.info("------------------------------------")
+
+
+def queued_request(logger):
+    with RequestLog(BIO, POSTS, logger):
+        annotate_request_text("gpt_prompt", PROMPT)
+        annotate_request_text("gpt_raw_response", RAW_RESPONSE)
+        annotate_request(rule_based=[
+            {"persona": name, "score": score, "keywords": keywords, "confidence": confidence}
+            for name, score, keywords, confidence in MATCHES
+        ])
+        annotate_request(gpt_persona="travel_adventurer", gpt_reasoning=RAW_RESPONSE)
+
+
+def run(fn, logger, sessions, requests):
+    per_session = max(1, requests // sessions)
+    latencies = []
+    lock = threading.Lock()
+
+    def session():
+        local = []
+        for _ in range(per_session):
+            start = time.perf_counter()
+            fn(logger)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=session) for _ in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return sorted(latencies), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per run, split across sessions")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.log")
+        custom_logger.LOG_PATH = os.path.join(tmp, "queued.jsonl")
+        loggers = {"legacy": (legacy_request, legacy_logger(legacy_path)),
+                   "queued": (queued_request, custom_logger.get_logger())}
+
+        print(f"{'mode':<8} {'sessions':>8} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9} {'mean us':>9}")
+        for sessions in args.sessions:
+            for mode, (fn, logger) in loggers.items():
+                latencies, _ = run(fn, logger, sessions, args.requests)
+                print(f"{mode:<8} {sessions:>8} {percentile(latencies, 0.5) * 1e6:>9.1f} "
+                      f"{percentile(latencies, 0.95) * 1e6:>9.1f} {percentile(latencies, 0.99) * 1e6:>9.1f} "
+                      f"{statistics.mean(latencies) * 1e6:>9.1f}")
+
+        custom_logger.stop_logging()
+        for handler in loggers["legacy"][1].handlers:
+            handler.close()
+        for mode, path in (("legacy", legacy_path), ("queued", custom_logger.LOG_PATH)):
+            with open(path, "rb") as f:
+                data = f.read()
+            total = sum(max(1, args.requests // s) * s for s in args.sessions)
+            lines = data.count(b"\n")
+            print(f"{mode:<8} {lines:>8} lines, {len(data) / total:8.0f} bytes/request on disk")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+'''
+Overhead of the metrics layer and a per-stage breakdown of the pipeline.
+
+1. Cost of a timed no-op call with metrics enabled and disabled, against a
+   plain call.
+2. Runs extract_keywords / score_personas / classify_with_gpt over sample
+   inputs (GPT against the local fake endpoint, cache disabled) and prints
+   the per-stage p50/p95/p99, token counters and the Prometheus export.
+
+Run from the repository root:
+    python -m benchmarks.bench_metrics [--calls 200000] [--requests 50]
+'''
+import argparse
+import tempfile
+import time
+
+from src.fake_openai import FakeOpenAIServer
+from src.metrics import MetricsRegistry, get_metrics, to_prometheus
+from src.openai_client import OpenAIClientManager, set_client_manager
+from src.persona_predictor import classify_with_gpt, extract_keywords, load_personas, score_personas
+from src.response_cache import ResponseCache
+from benchmarks.check_extract_keywords import SAMPLES
+
+
+def per_call_ns(fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def overhead(calls):
+    def noop():
+        pass
+
+    enabled = MetricsRegistry(enabled=True)
+    disabled = MetricsRegistry(enabled=False)
+
+    def timed_enabled():
+        with enabled.timer("noop"):
+            pass
+
+    def timed_disabled():
+        with disabled.timer("noop"):
+            pass
+
+    base = per_call_ns(noop, calls)
+    print(f"{'plain call':<20} {base:8.0f} ns")
+    print(f"{'timer, disabled':<20} {per_call_ns(timed_disabled, calls):8.0f} ns")
+    print(f"{'timer, enabled':<20} {per_call_ns(timed_enabled, calls):8.0f} ns")
+
+
+def pipeline(requests):
+    personas = load_personas("data/personas/personas.yaml")
+    registry = get_metrics()
+    registry.reset()
+    with FakeOpenAIServer(delay=0.02) as server, tempfile.TemporaryDirectory() as tmp:
+        set_client_manager(OpenAIClientManager(base_url=server.base_url))
+        # TTL 0 so every call goes upstream and token usage is recorded
+        cache = ResponseCache(f"{tmp}/cache.sqlite3", ttl_seconds=0)
+        for i in range(requests):
+            text = SAMPLES[i % len(SAMPLES)]
+            tokens = extract_keywords(text, personas.index.phrases)
+            top = score_personas(personas, tokens, top_n=3)
+            classify_with_gpt(text, text, [p[0] for p in top], "sk-fake", cache=cache)
+
+    snapshot = registry.snapshot()
+    print(f"\n{'stage':<20} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for h in sorted(snapshot["histograms"], key=lambda h: -h["sum"]):
+        print(f"{h['labels'].get('stage', h['name']):<20} {h['count']:>6} "
+              f"{h['p50'] * 1000:>9.3f} {h['p95'] * 1000:>9.3f} {h['p99'] * 1000:>9.3f}")
+    print("\n" + to_prometheus(snapshot))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+    overhead(args.calls)
+    pipeline(args.requests)
+
+
+if __name__ == "__main__":
+    main()
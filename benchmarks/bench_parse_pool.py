@@ -0,0 +1,111 @@
+'''
+Concurrency benchmark of keyword extraction: in-process parsing vs the spaCy
+worker process pool (PERSONA_PARSE_WORKERS, src/parse_pool.py).
+
+Simulates N simultaneous sessions, each a thread calling extract_keywords on
+synthetic users back to back, as Streamlit sessions in one server process
+would. Reports p50/p95 latency per call and total throughput for each
+number of sessions. Each backend runs in its own subprocess, after a
+warm-up call that loads the model (in every worker, for the pool).
+
+Parsing is CPU-bound, so the pool can only help when there are spare cores:
+with one core it adds the cost of sending texts and results between
+processes.
+
+Run from the repository root:
+    python -m benchmarks.bench_parse_pool [--sessions 1 2 4 8 16] [--calls 20] [--workers N]
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.corpus import generate_users, read_personas
+from src.metrics import percentile
+
+
+def run_worker(sessions_arg, calls, out_path):
+    '''
+    Runs inside the subprocess: the session sweep with the backend set by the environment.
+    '''
+    from src.persona_predictor import extract_keywords, get_parse_pool, join_user_input, load_personas
+    personas = load_personas("data/personas/personas.yaml")
+    texts = [join_user_input(u["bio"], u["posts"]) for u in generate_users(read_personas(), 200, seed=3)]
+    # Warm-up: loads the model here or in the workers
+    pool = get_parse_pool()
+    if pool is not None:
+        for _ in range(pool.workers * 2):
+            extract_keywords(texts[0], personas.index.phrases)
+    extract_keywords(texts[0], personas.index.phrases)
+
+    results = []
+    for sessions in map(int, sessions_arg.split(",")):
+        latencies = []
+        lock = threading.Lock()
+
+        def session(offset):
+            own = []
+            for i in range(calls):
+                text = texts[(offset * calls + i) % len(texts)]
+                start = time.perf_counter()
+                extract_keywords(text, personas.index.phrases)
+                own.append(time.perf_counter() - start)
+            with lock:
+                latencies.extend(own)
+
+        threads = [threading.Thread(target=session, args=(s,)) for s in range(sessions)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        results.append({"sessions": sessions, "p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95),
+                        "throughput": len(latencies) / elapsed})
+    if pool is not None:
+        pool.close()
+    with open(out_path, "w") as f:
+        json.dump(results, f)
+
+
+def run_backend(workers, sessions, calls, tmp):
+    out_path = os.path.join(tmp, f"workers-{workers}.json")
+    env = dict(os.environ, PERSONA_PARSE_WORKERS=str(workers), PERSONA_METRICS="0")
+    subprocess.run([sys.executable, "-m", "benchmarks.bench_parse_pool", "--worker",
+                    ",".join(map(str, sessions)), str(calls), out_path], env=env, check=True)
+    with open(out_path) as f:
+        return json.load(f)
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == "--worker":
+        run_worker(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+        return 0
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_parse_pool", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--calls", type=int, default=20, help="extract_keywords calls per session")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parse worker processes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        in_process = run_backend(0, args.sessions, args.calls, tmp)
+        pooled = run_backend(args.workers, args.sessions, args.calls, tmp)
+
+    print(f"{os.cpu_count()} CPU(s), pool of {args.workers} worker(s), {args.calls} calls per session\n")
+    print(f"{'sessions':>8}   {'in-process p50':>14} {'p95':>8} {'calls/s':>8}   {'pool p50':>9} {'p95':>8} {'calls/s':>8}")
+    for local, pool in zip(in_process, pooled):
+        print(f"{local['sessions']:>8}   {local['p50'] * 1000:>11.1f} ms {local['p95'] * 1000:>5.1f} ms "
+              f"{local['throughput']:>8.0f}   {pool['p50'] * 1000:>6.1f} ms {pool['p95'] * 1000:>5.1f} ms "
+              f"{pool['throughput']:>8.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
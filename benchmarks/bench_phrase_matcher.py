@@ -0,0 +1,73 @@
+'''
+Benchmark of phrase keyword matching as the number of keywords grows.
+
+Compares the compiled KeywordPhraseMatcher (one pass over the input words)
+with a per-keyword loop that checks every phrase against the input on its
+own. Runs without spaCy or the persona files; keywords and input text are
+generated from a fixed random seed.
+
+Run from the repository root:
+    python -m benchmarks.bench_phrase_matcher [--sizes 100 1000 10000 50000]
+'''
+import argparse
+import random
+import time
+
+from src.phrase_matcher import KeywordPhraseMatcher, phrase_words
+
+VOCABULARY_SIZE = 5000
+INPUT_WORDS = 300
+
+
+# The straightforward alternative: test each phrase against the input separately
+def per_keyword_loop(phrases, words):
+    text = " " + " ".join(words) + " "
+    return [phrase for phrase in phrases if " " + " ".join(phrase_words(phrase)) + " " in text]
+
+
+def make_phrases(rng, vocabulary, n):
+    phrases = set()
+    while len(phrases) < n:
+        separator = "-" if rng.random() < 0.3 else " "
+        phrases.add(separator.join(rng.sample(vocabulary, rng.randint(2, 3))))
+    return sorted(phrases)
+
+
+def time_call(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = [f"w{i}" for i in range(VOCABULARY_SIZE)]
+    words = rng.choices(vocabulary, k=INPUT_WORDS)
+
+    print(f"{'keywords':>9} {'build ms':>9} {'matcher ms':>11} {'loop ms':>9} {'speedup':>8}")
+    for size in args.sizes:
+        phrases = make_phrases(rng, vocabulary, size)
+        # Plant a few phrases in the input so both paths have hits to report
+        planted = words + [w for phrase in rng.sample(phrases, 5) for w in phrase_words(phrase)]
+
+        start = time.perf_counter()
+        matcher = KeywordPhraseMatcher(phrases)
+        build = time.perf_counter() - start
+
+        matcher_time, matcher_hits = time_call(lambda: matcher.find(planted), args.repeat)
+        loop_time, loop_hits = time_call(lambda: per_keyword_loop(phrases, planted), args.repeat)
+        assert set(matcher_hits) == set(loop_hits), "matcher and loop disagree"
+
+        print(f"{size:>9} {build * 1000:>9.1f} {matcher_time * 1000:>11.3f} {loop_time * 1000:>9.3f} "
+              f"{loop_time / matcher_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
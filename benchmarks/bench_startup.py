@@ -0,0 +1,80 @@
+'''
+Cold-start benchmark: time until personas are ready and latency of the first
+prediction, each in a fresh interpreter.
+
+  eager   what the app used to do: parse personas.yaml and load the full
+          spaCy pipeline before serving anything
+  bundle  the current path: load the compiled persona bundle at startup and
+          load spaCy lazily on the first prediction
+
+Import cost of src.persona_predictor is read from `python -X importtime`.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup [--runs 3]
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SNIPPET = """
+import json, os, time
+start = time.perf_counter()
+from src import persona_predictor as pp
+imported = time.perf_counter()
+personas = pp.load_personas('data/personas/personas.yaml')
+if os.environ.get('BENCH_EAGER') == '1':
+    pp.get_nlp()
+ready = time.perf_counter()
+tokens = pp.extract_keywords('Adventurer and tech enthusiast. Visited Naples today, was fun.', personas.index.phrases)
+pp.score_personas(personas, tokens)
+predicted = time.perf_counter()
+print(json.dumps({'import': imported - start, 'ready': ready - start, 'first_prediction': predicted - ready}))
+"""
+
+MODES = {
+    "eager": {"PERSONA_BUNDLE": "0", "BENCH_EAGER": "1"},
+    "bundle": {"PERSONA_BUNDLE": "1", "BENCH_EAGER": "0"},
+}
+
+
+def import_time_ms(stderr):
+    '''
+    Cumulative import time of src.persona_predictor from -X importtime output.
+    '''
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and line.rstrip().endswith(" src.persona_predictor"):
+            return int(line.split("|")[1]) / 1000
+    return float("nan")
+
+
+def run_once(mode):
+    env = dict(os.environ, **MODES[mode])
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", SNIPPET],
+                            capture_output=True, text=True, env=env, check=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["importtime_ms"] = import_time_ms(result.stderr)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    # Make sure the bundle exists so "bundle" measures a warm artifact, not its first build
+    run_once("bundle")
+
+    print(f"{'mode':<8} {'import ms':>10} {'ready ms':>10} {'first prediction ms':>20} {'total ms':>10}")
+    for mode in MODES:
+        runs = [run_once(mode) for _ in range(args.runs)]
+        importtime = statistics.median(r["importtime_ms"] for r in runs)
+        ready = statistics.median(r["ready"] for r in runs) * 1000
+        first = statistics.median(r["first_prediction"] for r in runs) * 1000
+        print(f"{mode:<8} {importtime:>10.1f} {ready:>10.1f} {first:>20.1f} {ready + first:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+'''
+Offline check of bulk GPT classification against the local fake endpoint.
+
+Packed calls (classify_bulk):
+  - every user is answered with the persona the fixture picked for them,
+    although the fixture returns results shuffled and inside a code fence
+  - users are packed up to --max-users per call and within the token budget
+  - a dropped user, a persona outside the candidates and an unreadable
+    answer are retried in a second round; a user the fixture never answers
+    ends up with ("", "")
+  - a second run is answered from the cache; only the unanswered user is sent again
+Batch API files:
+  - request lines have the Batch API shape with unique custom_ids
+  - a fixture output file (shuffled, with a failed request) maps back by custom_id
+
+Finally compares the wall time and number of upstream calls of packed
+classification with one classify_with_gpt call per user.
+
+Run from the repository root:
+    python -m benchmarks.check_bulk_classify [--users 60] [--delay 0.2]
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from src.bulk_classify import (
+    build_bulk_prompt, classify_bulk, estimate_tokens, load_bulk_prompt_template, read_batch_results,
+    write_batch_requests
+)
+from src.fake_openai import FakeOpenAIServer, completion_body, packed_users
+from src.openai_client import OpenAIClientManager, set_client_manager
+from src.persona_predictor import classify_with_gpt, load_personas
+from src.response_cache import ResponseCache
+
+# Never answered by the fixture, so it must come back empty after the retries
+UNANSWERED_BIO = "Nobody answers me"
+
+
+def make_users(personas, count, seed):
+    rng = random.Random(seed)
+    users = []
+    for i in range(count):
+        candidates = rng.sample(list(personas), 3)
+        users.append({
+            "id": f"user-{i}",
+            "bio": f"Bio number {i} about {candidates[0]['persona_name']}",
+            "posts": " ".join(rng.choice(candidates[0].get("keywords", []) or ["posts"]) for _ in range(20)),
+            "candidates": candidates,
+        })
+    users.append({"id": "unanswered", "bio": UNANSWERED_BIO, "posts": "", "candidates": users[0]["candidates"]})
+    return users
+
+
+def expected_persona(user):
+    # The fixture picks a candidate from the bio, so the mapping can be checked per user
+    return user["candidates"][sum(map(ord, user["bio"])) % len(user["candidates"])]
+
+
+class Fixture:
+    '''
+    Packed-prompt replies in the first round: shuffled results in a code
+    fence, one user dropped, one given a persona outside their candidates
+    and, on the second call, no JSON at all. Later rounds answer properly.
+    '''
+
+    def __init__(self, users, first_round_calls):
+        self.by_bio = {user["bio"]: user for user in users}
+        self.first_round_calls = first_round_calls
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        with self.lock:
+            self.calls += 1
+            call_number = self.calls
+        sent = packed_users(request)
+        results = []
+        for user in sent:
+            if user["bio"] == UNANSWERED_BIO:
+                continue
+            persona = expected_persona(self.by_bio[user["bio"]])["persona_name"]
+            results.append({"id": user["id"], "persona": persona.upper(), "reasoning": f"You are {persona}."})
+        if call_number <= self.first_round_calls:
+            if call_number == 2:
+                return "Sorry, I can't help with that."
+            results = results[1:]
+            if results:
+                results[0]["persona"] = "not_a_persona"
+            random.Random(call_number).shuffle(results)
+        return "```json\n" + json.dumps({"results": results}) + "\n```"
+
+
+def batch_output_fixture(requests, users):
+    '''
+    A Batch API output file for the request lines: shuffled, the first request failed.
+    '''
+    by_id = {str(user["id"]): user for user in users}
+    lines = []
+    for i, request in enumerate(requests):
+        custom_id = request["custom_id"]
+        if i == 0:
+            lines.append({"id": f"batch_req_{i}", "custom_id": custom_id, "response": None,
+                          "error": {"code": "server_error", "message": "Simulated failure"}})
+            continue
+        persona = expected_persona(by_id[custom_id])["persona_name"]
+        body = completion_body(f"Persona: {persona}\nReasoning: You are {persona}.", request["body"]["model"],
+                               request["body"]["messages"][0]["content"])
+        lines.append({"id": f"batch_req_{i}", "custom_id": custom_id,
+                      "response": {"status_code": 200, "request_id": f"req_{i}", "body": body}, "error": None})
+    random.Random(0).shuffle(lines)
+    return lines
+
+
+def check_packed(users, args, failures):
+    cache = ResponseCache(":memory:")
+    n_packs = -(-len(users) // args.max_users)
+    fixture = Fixture(users, first_round_calls=n_packs)
+    with FakeOpenAIServer(reply=fixture, delay=args.delay) as server:
+        set_client_manager(OpenAIClientManager(base_url=server.base_url))
+        start = time.perf_counter()
+        results = classify_bulk(users, "sk-fake", cache=cache, max_users=args.max_users,
+                                token_budget=args.token_budget, retries=1)
+        packed_time = time.perf_counter() - start
+        calls = server.calls
+        requests = list(server.requests)
+
+        classify_bulk(users, "sk-fake", cache=cache, max_users=args.max_users, token_budget=args.token_budget)
+        second_run_calls = server.calls - calls
+        second_run_users = [user["bio"] for request in server.requests[calls:] for user in packed_users(request)]
+
+    for user, (persona, reasoning) in zip(users, results):
+        expected = "" if user["bio"] == UNANSWERED_BIO else expected_persona(user)["persona_name"]
+        if persona != expected:
+            failures.append(f"{user['id']}: got {persona!r}, expected {expected!r}")
+    template = load_bulk_prompt_template()
+    for request in requests:
+        sent = packed_users(request)
+        if len(sent) > args.max_users:
+            failures.append(f"a call packed {len(sent)} users, more than {args.max_users}")
+        if len(sent) > 1 and estimate_tokens(request["messages"][0]["content"]) > args.token_budget:
+            failures.append(f"a call of {len(sent)} users exceeded the token budget")
+    if set(second_run_users) - {UNANSWERED_BIO}:
+        failures.append(f"second run sent {len(second_run_users)} users instead of using the cache")
+    prompt, _ = build_bulk_prompt(template, users[:1])
+    if "Your tasks:" not in prompt:
+        failures.append("packed prompt lacks the tasks of data/gpt_prompt.txt")
+    print(f"packed: {len(users)} users in {calls} calls ({n_packs} first-round packs + retries), "
+          f"{packed_time:.2f}s; second run {second_run_calls} calls")
+    return packed_time, calls
+
+
+def check_batch_files(users, failures):
+    with tempfile.TemporaryDirectory() as tmp:
+        requests_path = os.path.join(tmp, "requests.jsonl")
+        count = write_batch_requests(users, requests_path)
+        with open(requests_path) as f:
+            requests = [json.loads(line) for line in f]
+        if count != len(users) or len({r["custom_id"] for r in requests}) != count:
+            failures.append("Batch API requests are missing users or repeat custom_ids")
+        for request in requests:
+            if request["method"] != "POST" or request["url"] != "/v1/chat/completions" or \
+                    not request["body"]["messages"] or "model" not in request["body"]:
+                failures.append(f"malformed Batch API request {request['custom_id']}")
+                break
+
+        output_path = os.path.join(tmp, "output.jsonl")
+        with open(output_path, "w") as f:
+            for line in batch_output_fixture(requests, users):
+                f.write(json.dumps(line) + "\n")
+        answers, errors = read_batch_results(output_path)
+
+    failed_id = requests[0]["custom_id"]
+    if set(errors) != {failed_id}:
+        failures.append(f"expected exactly {failed_id} to fail, got {sorted(errors)}")
+    for user in users:
+        custom_id = str(user["id"])
+        if custom_id != failed_id and answers.get(custom_id, ("",))[0] != expected_persona(user)["persona_name"]:
+            failures.append(f"Batch API result for {custom_id} mapped wrongly: {answers.get(custom_id)}")
+    print(f"batch files: {count} requests written, {len(answers)} answers and {len(errors)} errors read back")
+
+
+def compare_single(users, args, packed_time, packed_calls):
+    cache = ResponseCache(":memory:")
+    with FakeOpenAIServer(delay=args.delay) as server:
+        set_client_manager(OpenAIClientManager(base_url=server.base_url))
+        start = time.perf_counter()
+        for user in users:
+            classify_with_gpt(user["bio"], user["posts"], user["candidates"], "sk-fake", cache=cache)
+        single_time = time.perf_counter() - start
+    print(f"one call per user: {server.calls} calls, {single_time:.2f}s; "
+          f"packed: {packed_calls} calls, {packed_time:.2f}s ({single_time / packed_time:.1f}x faster)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=60)
+    parser.add_argument("--max-users", type=int, default=20)
+    parser.add_argument("--token-budget", type=int, default=6000)
+    parser.add_argument("--delay", type=float, default=0.2, help="simulated upstream latency in seconds")
+    args = parser.parse_args()
+
+    personas = load_personas("data/personas/personas.yaml")
+    users = make_users(personas, args.users, seed=5)
+    failures = []
+    packed_time, packed_calls = check_packed(users, args, failures)
+    check_batch_files(users[:-1], failures)
+    compare_single(users[:-1], args, packed_time, packed_calls)
+
+    for failure in failures[:20]:
+        print(f"FAIL {failure}")
+    print("OK" if not failures else f"{len(failures)} failure(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
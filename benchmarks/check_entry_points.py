@@ -0,0 +1,92 @@
+'''
+Parity check of the rule-based prediction across entry points: the app
+(predict_rule_based), the HTTP server's micro-batched scoring
+(PredictionService.predict) and batch prediction (src.batch predict) must
+give every user the same top personas, scores and matched keywords. All
+three extract keywords per segment (the bio and each post); the corpus is:
+  - every query recorded in the query log (real user input)
+  - seeded synthetic users from benchmarks.corpus
+
+Run from the repository root:
+    python -m benchmarks.check_entry_points [--log logs/digital_persona_queries.log] [--users 200]
+
+Exits with status 1 if any user gets a different result from any entry point.
+'''
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from benchmarks.corpus import generate_users, read_personas
+from src import batch
+from src.keyword_cache import KeywordAggregate
+from src.persona_predictor import load_personas, predict_rule_based
+from src.query_log import read_query_log
+from src.server import PredictionService
+
+PERSONAS_PATH = "data/personas/personas.yaml"
+
+
+def corpus_users(log_path, users):
+    records = []
+    if log_path and os.path.exists(log_path):
+        records.extend(("log", {"bio": r["bio"], "posts": r["posts"]}) for r in read_query_log(log_path))
+    records.extend(("synthetic", {"bio": u["bio"], "posts": u["posts"]})
+                   for u in generate_users(read_personas(), users, seed=5))
+    return records
+
+
+def summarize(persona_name, score, keywords):
+    return persona_name, round(score, 6), sorted(keywords)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default="logs/digital_persona_queries.log", help="query log to take real input from")
+    parser.add_argument("--users", type=int, default=200, help="synthetic users")
+    args = parser.parse_args()
+
+    records = [(source, user) for source, user in corpus_users(args.log, args.users)
+               if user["bio"].strip() or any(post.strip() for post in user["posts"])]
+    users = [user for _, user in records]
+    personas = load_personas(PERSONAS_PATH)
+
+    app = [[summarize(p["persona_name"], score, matched) for p, score, matched, _ in
+            predict_rule_based(personas, user["bio"], user["posts"], aggregate=KeywordAggregate())]
+           for user in users]
+
+    service = PredictionService(PERSONAS_PATH, max_batch=32, queue_size=max(1024, len(users)))
+    try:
+        server = [[summarize(p["persona_name"], p["score"], p["matched_keywords"]) for p in result["personas"]]
+                  for result in service.predict(users)]
+    finally:
+        service.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        in_path, out_path = os.path.join(tmp, "in.jsonl"), os.path.join(tmp, "out.jsonl")
+        with open(in_path, "w", encoding="utf-8") as f:
+            for i, user in enumerate(users):
+                f.write(json.dumps({"id": i, **user}) + "\n")
+        batch.predict(in_path, out_path, PERSONAS_PATH)
+        with open(out_path, encoding="utf-8") as f:
+            batched = [[summarize(p["persona_name"], p["score"], p["matched_keywords"]) for p in
+                        json.loads(line)["top_personas"]] for line in f]
+
+    failures = []
+    checked = {}
+    for (source, user), expected, *others in zip(records, app, server, batched):
+        checked[source] = checked.get(source, 0) + 1
+        for entry_point, actual in zip(("server", "batch"), others):
+            if actual != expected:
+                failures.append(f"{source} user {user['bio'][:40]!r}: app {expected}, {entry_point} {actual}")
+
+    print("checked " + ", ".join(f"{count} {source}" for source, count in checked.items()) + " users")
+    for failure in failures[:20]:
+        print(f"FAIL {failure}")
+    print("OK" if not failures else f"{len(failures)} failure(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
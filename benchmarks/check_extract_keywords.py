@@ -0,0 +1,95 @@
+'''
+Parity check of keyword extraction against the original implementation.
+
+The original extract_keywords ran the whole pipeline once per unique word
+to lemmatize it. The current one parses each text once and lemmatizes each
+word on its own through a cached lemmatizer. Both must return the same
+lemma set. The corpus is:
+  - the sample inputs below
+  - every query recorded in the query log (real user input)
+  - seeded synthetic users from benchmarks.corpus
+
+Needs the spaCy model (en_core_web_sm).
+
+Run from the repository root:
+    python -m benchmarks.check_extract_keywords [--log logs/digital_persona_queries.log] [--users 200]
+
+Exits with status 1 if any text produces a different lemma set.
+'''
+import argparse
+import os
+import sys
+
+from benchmarks.corpus import generate_users, read_personas
+from src.persona_predictor import extract_keywords, get_nlp, join_user_input
+from src.query_log import read_query_log
+
+SAMPLES = [
+    "Adventurer, Traveler, Tech Enthusiast, Roaming the world "
+    "Visited Naples today. Was fun. Here are the 10 reasons why you should go to Black Forest "
+    "I just released a vlog on my stay in Maldives. Go check it out.",
+    "love tech, gadgets and technology Recently checked out Google pixel 7. it was amazing",
+    "Love food, going out to resturants and trying out new dishes Talked to the chef of Pizza Italia, "
+    "What an amazing experience Somehow i always have cravings for noodles "
+    "The Pasta from Goti Pasta has amazing flavour",
+    "Mental Health Expert, Influencer of youth Here are the 10 reasons i suggest doing Yoga every day "
+    "Self-care and routine are the two most imp things in daily life A happy mind results in a happy mood",
+    "Love to see everyone dressed. fashion designer by birth Here are the 10 sweetest dresses for christmas "
+    "this year The designer clothes of zara are the best I love the new collection by",
+    "Full-stack developer and open-source maintainer. Shipping a beta-feature for our AI startup this week, "
+    "then meal prep and a long run before the hackathon on Saturday.",
+]
+
+
+# The implementation extract_keywords replaced, kept here as the parity reference
+def legacy_extract_keywords(text):
+    nlp = get_nlp()
+    doc = nlp(text)
+    keywords = set([ent.text.lower() for ent in doc.ents])
+    keywords.update(chunk.text.lower() for chunk in doc.noun_chunks)
+    keywords.update([token.lemma_.lower() for token in doc if not token.is_stop and not token.is_punct])
+
+    keywords_update = []
+    for keyword in keywords:
+        keywords_update.extend(keyword.split())
+
+    keywords_lemmatized = []
+    for keyword in set(keywords_update):
+        keywords_lemmatized.append(nlp(keyword)[0].lemma_)
+    return keywords_lemmatized
+
+
+def corpus_texts(log_path, users):
+    texts = [("sample", text) for text in SAMPLES]
+    if log_path and os.path.exists(log_path):
+        texts.extend(("log", join_user_input(r["bio"], r["posts"])) for r in read_query_log(log_path))
+    texts.extend(("synthetic", join_user_input(u["bio"], u["posts"]))
+                 for u in generate_users(read_personas(), users, seed=11))
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default="logs/digital_persona_queries.log", help="query log to take real input from")
+    parser.add_argument("--users", type=int, default=200, help="synthetic users")
+    args = parser.parse_args()
+
+    failures = []
+    checked = {}
+    for source, text in corpus_texts(args.log, args.users):
+        checked[source] = checked.get(source, 0) + 1
+        expected = {k.lower() for k in legacy_extract_keywords(text)}
+        actual = {k.lower() for k in extract_keywords(text)}
+        if expected != actual:
+            failures.append(f"{source} text {text[:60]!r}: only in legacy {sorted(expected - actual)}, "
+                            f"only in current {sorted(actual - expected)}")
+
+    print("checked " + ", ".join(f"{count} {source}" for source, count in checked.items()) + " texts")
+    for failure in failures[:20]:
+        print(f"FAIL {failure}")
+    print("OK" if not failures else f"{len(failures)} failure(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
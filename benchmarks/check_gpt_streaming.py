@@ -0,0 +1,193 @@
+'''
+Offline check of streamed GPT classification and the prompt budget against
+the local fake endpoint.
+
+Prompt budget (budget_gpt_input):
+  - input within the budget is sent unchanged
+  - repeated posts (ignoring case and spacing) are dropped
+  - an overlong post is cut at a word boundary
+  - hundreds of posts are sampled down to fit, keeping the first and last in order
+Streaming (classify_with_gpt_stream):
+  - the persona is known before the reasoning has finished arriving
+  - the final answer equals the one classify_with_gpt returns
+  - token usage is recorded from the stream
+  - a cached answer is yielded once, without an upstream call
+  - the time the consumer spends on each update is left out of the
+    classify_with_gpt_stream stage time
+  - StreamingAnswer, fed an answer in random pieces, ends with the same
+    reasoning as parse_gpt_response, including "reasoning:" inside a line
+
+Finally compares time to first token, time to the persona line and total
+time of streamed calls with the latency of classify_with_gpt, which shows
+nothing until the whole answer is in.
+
+Run from the repository root:
+    python -m benchmarks.check_gpt_streaming [--runs 10] [--delay 0.3] [--token-delay 0.02]
+'''
+import argparse
+import random
+import sys
+import time
+
+from src.fake_openai import FakeOpenAIServer
+from src.metrics import get_metrics, percentile
+from src.openai_client import OpenAIClientManager, set_client_manager
+from src.persona_predictor import (
+    StreamingAnswer, budget_gpt_input, build_gpt_prompt, classify_with_gpt, classify_with_gpt_stream,
+    load_gpt_prompt_template, load_personas, parse_gpt_response
+)
+from src.prompt_budget import ELLIPSIS, MAX_POST_TOKENS, PROMPT_TOKEN_BUDGET, estimate_tokens
+from src.response_cache import ResponseCache
+
+REPLY = (
+    "Persona: tech_enthusiast\n"
+    "Reasoning: You light up whenever a new gadget lands on your desk, and your posts read like a running "
+    "changelog of everything you have taken apart, rebuilt and shipped at the last hackathon you joined."
+)
+# Answers whose reasoning line is easy to get wrong while streaming
+ODD_REPLIES = [
+    REPLY,
+    "Persona: tech_enthusiast, my reasoning: gadgets\nReasoning: You ship at every hackathon.\n",
+    "persona: tech_enthusiast\nREASONING: Upper case still counts\r\nThanks!",
+    "Reasoning: a first try\nPersona: tech_enthusiast\nReasoning: the last line wins",
+    "Persona: tech_enthusiast\nThe reasoning: is only mentioned mid-line",
+]
+
+
+def check_budget(candidates, failures):
+    template = load_gpt_prompt_template()
+    posts = ["Unboxing a new gadget today", "Shipping my side project"]
+    if budget_gpt_input(template, "Tech lover", posts, candidates) != ("Tech lover", " ".join(posts)):
+        failures.append("input within the budget was changed")
+
+    _, sent = budget_gpt_input(template, "bio", ["Same post", "  same   POST ", "Other post"], candidates)
+    if sent != "Same post Other post":
+        failures.append(f"repeated posts were not dropped: {sent!r}")
+
+    _, sent = budget_gpt_input(template, "bio", ["word " * 2000], candidates)
+    if len(sent) > MAX_POST_TOKENS * 4 or not sent.endswith(ELLIPSIS):
+        failures.append(f"overlong post not cut to {MAX_POST_TOKENS} tokens ({len(sent)} characters)")
+
+    many = [f"post {i} about gadgets, code and the latest hackathon we joined together" for i in range(500)]
+    bio, sent = budget_gpt_input(template, "bio", many, candidates)
+    prompt_tokens = estimate_tokens(build_gpt_prompt(template, bio, sent, candidates))
+    if prompt_tokens > PROMPT_TOKEN_BUDGET:
+        failures.append(f"prompt of {prompt_tokens} tokens exceeds the budget of {PROMPT_TOKEN_BUDGET}")
+    if not sent.startswith(many[0]) or not sent.endswith(many[-1]):
+        failures.append("sampled posts lost the first or last post")
+    positions = [int(post.split()[0]) for post in sent.split("post ")[1:]]
+    if positions != sorted(positions):
+        failures.append("sampled posts are out of order")
+    print(f"budget: 500 posts -> {len(positions)} sent, {prompt_tokens} of {PROMPT_TOKEN_BUDGET} prompt tokens")
+
+
+def llm_tokens():
+    return sum(c["value"] for c in get_metrics().snapshot()["counters"] if c["name"] == "llm_tokens_total")
+
+
+def stage_seconds(stage):
+    return sum(h["sum"] for h in get_metrics().snapshot()["histograms"]
+               if h["name"] == "stage_seconds" and h["labels"].get("stage") == stage)
+
+
+def check_answer_parsing(failures, splits=200):
+    rng = random.Random(0)
+    for reply in ODD_REPLIES:
+        _, expected = parse_gpt_response(reply)
+        for _ in range(splits):
+            cuts = sorted(rng.sample(range(1, len(reply)), rng.randint(0, min(8, len(reply) - 1))))
+            answer = StreamingAnswer()
+            for start, end in zip([0] + cuts, cuts + [len(reply)]):
+                answer.feed(reply[start:end])
+            if answer.reasoning != expected:
+                failures.append(f"streamed reasoning {answer.reasoning!r} of {reply!r} (cut at {cuts}) "
+                                f"differs from {expected!r}")
+                break
+
+
+def check_streaming(candidates, args, failures):
+    cache = ResponseCache(":memory:")
+    ttft, persona_times, stream_times, full_times = [], [], [], []
+    with FakeOpenAIServer(reply=REPLY, delay=args.delay, token_delay=args.token_delay) as server:
+        set_client_manager(OpenAIClientManager(base_url=server.base_url))
+        # Warm up the client so the first run doesn't pay for importing openai
+        classify_with_gpt("warm-up", "warm-up", candidates, "sk-fake", cache=cache)
+
+        for run in range(args.runs):
+            tokens_before = llm_tokens()
+            start = time.perf_counter()
+            updates = []
+            for persona, reasoning in classify_with_gpt_stream(f"Tech lover {run}", ["New gadget"], candidates,
+                                                               "sk-fake", cache=cache):
+                elapsed = time.perf_counter() - start
+                if not updates:
+                    ttft.append(elapsed)
+                if persona and not any(p for p, _, _ in updates):
+                    persona_times.append(elapsed)
+                updates.append((persona, reasoning, elapsed))
+            stream_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            full = classify_with_gpt(f"Tech lover {run} again", ["New gadget"], candidates, "sk-fake", cache=cache)
+            full_times.append(time.perf_counter() - start)
+
+            final = updates[-1][:2]
+            if final != full:
+                failures.append(f"run {run}: streamed answer {final} differs from {full}")
+            first_with_persona = next(i for i, (p, _, _) in enumerate(updates) if p)
+            if len(updates[first_with_persona][1]) >= len(final[1]):
+                failures.append(f"run {run}: persona only known once the reasoning was complete")
+            if llm_tokens() <= tokens_before:
+                failures.append(f"run {run}: no token usage recorded for the stream")
+
+        # A slow consumer, e.g. a UI redrawing on every update
+        timed = stage_seconds("classify_with_gpt_stream")
+        start = time.perf_counter()
+        updates = 0
+        for _ in classify_with_gpt_stream("Slow reader", ["New gadget"], candidates, "sk-fake", cache=cache):
+            updates += 1
+            time.sleep(0.01)
+        consumer = updates * 0.01
+        timed = stage_seconds("classify_with_gpt_stream") - timed
+        if get_metrics().enabled and timed > time.perf_counter() - start - consumer / 2:
+            failures.append(f"stream stage timed {timed * 1000:.0f} ms, including the consumer's "
+                            f"{consumer * 1000:.0f} ms")
+
+        calls = server.calls
+        cached = list(classify_with_gpt_stream("Tech lover 0", ["New gadget"], candidates, "sk-fake", cache=cache))
+        if len(cached) != 1 or server.calls != calls:
+            failures.append(f"cached answer took {len(cached)} updates and {server.calls - calls} upstream calls")
+        streamed = [r for r in server.requests if r.get("stream")]
+        if len(streamed) != args.runs + 1 or not all(r.get("stream_options", {}).get("include_usage") for r in streamed):
+            failures.append("streamed requests were not sent with stream and include_usage")
+
+    ttft, persona_times, stream_times, full_times = map(sorted, (ttft, persona_times, stream_times, full_times))
+    print(f"{'':<24} {'p50 ms':>8} {'p95 ms':>8}")
+    for label, values in (("stream: first token", ttft), ("stream: persona line", persona_times),
+                          ("stream: complete", stream_times), ("non-streamed answer", full_times)):
+        print(f"{label:<24} {percentile(values, 0.5) * 1000:>8.1f} {percentile(values, 0.95) * 1000:>8.1f}")
+    if percentile(ttft, 0.5) >= percentile(full_times, 0.5):
+        failures.append("time to first token is not below the non-streamed latency")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.3, help="simulated latency to the first token, in seconds")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="simulated latency per word, in seconds")
+    args = parser.parse_args()
+
+    candidates = load_personas("data/personas/personas.yaml")[:3]
+    failures = []
+    check_budget(candidates, failures)
+    check_answer_parsing(failures)
+    check_streaming(candidates, args, failures)
+
+    for failure in failures[:20]:
+        print(f"FAIL {failure}")
+    print("OK" if not failures else f"{len(failures)} failure(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+'''
+Offline checks of the pooled OpenAI client against local stub servers that
+simulate slow and failing upstreams:
+
+  keep-alive   sequential classifications share one connection
+  retries      transient 500s are retried with backoff and then succeed
+  timeout      a hung upstream fails after the configured timeout
+  fan-out      asyncio.gather over the async path respects the concurrency limit
+
+Run from the repository root:
+    python -m benchmarks.check_openai_client
+'''
+import asyncio
+import sys
+import time
+
+import openai
+
+from src.fake_openai import FakeOpenAIServer
+from src.openai_client import OpenAIClientManager, set_client_manager
+from src.persona_predictor import load_personas, classify_with_gpt, classify_with_gpt_async
+from src.response_cache import ResponseCache
+
+API_KEY = "sk-fake"
+
+
+def check_keep_alive(candidates):
+    with FakeOpenAIServer() as server:
+        set_client_manager(OpenAIClientManager(base_url=server.base_url))
+        for i in range(10):
+            classify_with_gpt(f"bio {i}", "post", candidates, API_KEY, cache=ResponseCache(":memory:"))
+    print(f"keep-alive: {server.calls} calls over {len(server.connections)} connection(s)")
+    return len(server.connections) == 1
+
+
+def check_retries(candidates):
+    with FakeOpenAIServer(failures=2) as server:
+        set_client_manager(OpenAIClientManager(base_url=server.base_url, max_retries=2))
+        persona, _ = classify_with_gpt("bio", "post", candidates, API_KEY, cache=ResponseCache(":memory:"))
+    print(f"retries: {server.calls} upstream calls, persona={persona!r}")
+    return server.calls == 3 and persona != ""
+
+
+def check_timeout(candidates):
+    with FakeOpenAIServer(delay=3) as server:
+        set_client_manager(OpenAIClientManager(base_url=server.base_url, timeout=0.5, max_retries=0))
+        start = time.perf_counter()
+        try:
+            classify_with_gpt("bio", "post", candidates, API_KEY, cache=ResponseCache(":memory:"))
+            timed_out = False
+        except openai.APITimeoutError:
+            timed_out = True
+        elapsed = time.perf_counter() - start
+    print(f"timeout: raised={timed_out} after {elapsed:.2f}s")
+    return timed_out and elapsed < 2
+
+
+def check_fan_out(candidates, n_requests=20, max_concurrency=4, delay=0.2):
+    async def run():
+        cache = ResponseCache(":memory:")
+        return await asyncio.gather(*[
+            classify_with_gpt_async(f"bio {i}", "post", candidates, API_KEY, cache=cache)
+            for i in range(n_requests)
+        ])
+
+    with FakeOpenAIServer(delay=delay) as server:
+        set_client_manager(OpenAIClientManager(base_url=server.base_url, max_concurrency=max_concurrency))
+        start = time.perf_counter()
+        results = asyncio.run(run())
+        elapsed = time.perf_counter() - start
+    print(f"fan-out: {len(results)} results in {elapsed:.2f}s, "
+          f"max in flight {server.max_in_flight} (limit {max_concurrency})")
+    return all(persona for persona, _ in results) and server.max_in_flight <= max_concurrency
+
+
+def main():
+    candidates = load_personas("data/personas/personas.yaml")[:3]
+    checks = [check_keep_alive, check_retries, check_timeout, check_fan_out]
+    failed = [check.__name__ for check in checks if not check(candidates)]
+    for name in failed:
+        print(f"FAIL: {name}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
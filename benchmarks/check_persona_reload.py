@@ -0,0 +1,186 @@
+'''
+Offline check of persona hot reload (src/persona_registry.py).
+
+Works on a copy of the persona file in a temporary directory, with the
+background watcher running and reader threads scoring continuously:
+  - adding a persona is picked up by the watcher, and its keyword scores
+  - every reader's snapshot stays consistent while the file is swapped:
+    scoring the same tokens twice on one snapshot gives the same result,
+    and every persona in a result belongs to that snapshot
+  - an invalid persona set (duplicate persona_name) and broken YAML are
+    rejected, and the previous set stays in place
+  - touching the file without changing it does not reload
+  - server results carry the persona set version they were scored with
+
+Reports reload time and the delay until the watcher noticed the edit.
+
+Run from the repository root:
+    python -m benchmarks.check_persona_reload [--interval 0.05] [--readers 4]
+'''
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import yaml
+
+from src.metrics import get_metrics
+from src.persona_predictor import score_personas
+from src.persona_registry import PersonaRegistry
+from src.server import PredictionService
+
+PERSONAS_PATH = "data/personas/personas.yaml"
+NEW_PERSONA = {
+    "persona_name": "extreme_sports_fan",
+    "display_name": "Extreme Sports Fan 🪂",
+    "description": "Lives for adrenaline: skydiving, zorbing and anything with a helmet.",
+    "keywords": ["skydiving", "zorbing", "helmet"],
+}
+
+
+def counter(name, **labels):
+    return sum(c["value"] for c in get_metrics().snapshot()["counters"]
+               if c["name"] == name and all(c["labels"].get(k) == v for k, v in labels.items()))
+
+
+def write_personas(path, personas):
+    # Write and rename, as editors do, so the watcher never reads a half-written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        yaml.safe_dump(personas, f, allow_unicode=True, sort_keys=False)
+    os.replace(tmp_path, path)
+
+
+def wait_for(condition, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if condition():
+            return True
+        time.sleep(0.005)
+    return condition()
+
+
+class Readers:
+    '''
+    Threads scoring the same tokens twice on each snapshot until stopped.
+    '''
+
+    def __init__(self, registry, count, tokens):
+        self.registry = registry
+        self.tokens = tokens
+        self.failures = []
+        self.versions = set()
+        self.rounds = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.threads = [threading.Thread(target=self.run, daemon=True) for _ in range(count)]
+
+    def run(self):
+        while not self.stopped.is_set():
+            personas = self.registry.current()
+            first = score_personas(personas, self.tokens, top_n=len(personas))
+            second = score_personas(personas, self.tokens, top_n=len(personas))
+            names = {p["persona_name"] for p in personas}
+            with self.lock:
+                self.rounds += 1
+                self.versions.add(personas.version)
+                if [(p["persona_name"], score) for p, score, _, _ in first] != \
+                        [(p["persona_name"], score) for p, score, _, _ in second]:
+                    self.failures.append(f"snapshot {personas.version} scored differently twice")
+                if any(p["persona_name"] not in names or not any(p is q for q in personas) for p, _, _, _ in first):
+                    self.failures.append(f"snapshot {personas.version} returned a persona from another set")
+
+    def __enter__(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interval", type=float, default=0.05, help="watcher interval in seconds")
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args()
+
+    failures = []
+    with open(PERSONAS_PATH) as f:
+        original = yaml.safe_load(f)
+    with tempfile.TemporaryDirectory() as tmp:
+        # Its own file name, so its compiled bundle doesn't replace the one of the real personas.yaml
+        path = os.path.join(tmp, "reload_check_personas.yaml")
+        shutil.copy(PERSONAS_PATH, path)
+        registry = PersonaRegistry(path, interval=args.interval).start()
+        first_version = registry.version
+        tokens = ["zorbing", "skydiving", "gadget", "yoga"]
+
+        with Readers(registry, args.readers, tokens) as readers:
+            edited = time.perf_counter()
+            write_personas(path, original + [NEW_PERSONA])
+            if not wait_for(lambda: registry.version != first_version, timeout=5):
+                failures.append("the watcher did not pick up the added persona")
+            noticed = time.perf_counter() - edited
+            top = score_personas(registry.current(), tokens, top_n=1)
+            if top[0][0]["persona_name"] != NEW_PERSONA["persona_name"]:
+                failures.append(f"added persona not scored: top is {top[0][0]['persona_name']}")
+            added_version = registry.version
+
+            invalid_before = counter("persona_reloads_total", result="invalid")
+            write_personas(path, original + [NEW_PERSONA, dict(NEW_PERSONA, display_name="Duplicate")])
+            if not wait_for(lambda: counter("persona_reloads_total", result="invalid") > invalid_before, timeout=5):
+                failures.append("a duplicate persona_name was not rejected")
+            with open(path + ".tmp", "w") as f:
+                f.write("- persona_name: [unclosed\n")
+            os.replace(path + ".tmp", path)
+            if not wait_for(lambda: counter("persona_reloads_total", result="invalid") > invalid_before + 1, timeout=5):
+                failures.append("broken YAML was not rejected")
+            if registry.version != added_version:
+                failures.append("an invalid file replaced the persona set")
+
+            write_personas(path, original + [NEW_PERSONA])
+            wait_for(lambda: registry.check() or registry.version == added_version, timeout=5)
+            reloads = counter("persona_reloads_total", result="ok")
+            os.utime(path)
+            time.sleep(args.interval * 4)
+            if counter("persona_reloads_total", result="ok") != reloads:
+                failures.append("touching the file without changing it reloaded the personas")
+
+            # Back to the original personas (a new version: the dump differs from the file byte for byte)
+            write_personas(path, original)
+            if not wait_for(lambda: registry.version != added_version, timeout=5):
+                failures.append("the watcher did not pick up the removed persona")
+        registry.stop()
+        failures.extend(readers.failures[:5])
+        if not {first_version, added_version} <= readers.versions:
+            failures.append(f"readers saw versions {sorted(readers.versions)}, not both persona sets")
+
+        service = PredictionService(path)
+        try:
+            result = service.predict([{"bio": "zorbing", "posts": ["helmet"]}])[0]
+            if result.get("personas_version") != service.registry.version:
+                failures.append(f"server result version {result.get('personas_version')!r} "
+                                f"is not {service.registry.version!r}")
+        finally:
+            service.close()
+
+    reload_times = [h for h in get_metrics().snapshot()["histograms"] if h["name"] == "persona_reload_seconds"]
+    if reload_times:
+        print(f"reloads: {reload_times[0]['count']}, p50 {reload_times[0]['p50'] * 1000:.1f} ms, "
+              f"p99 {reload_times[0]['p99'] * 1000:.1f} ms")
+    print(f"edit noticed after {noticed * 1000:.0f} ms (watcher interval {args.interval * 1000:.0f} ms); "
+          f"{readers.rounds} reader rounds over persona set versions {', '.join(sorted(readers.versions))}")
+    for failure in failures[:20]:
+        print(f"FAIL {failure}")
+    print("OK" if not failures else f"{len(failures)} failure(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+'''
+Offline check of the GPT response cache against the local fake endpoint.
+
+Sends the same classification twice (the second time with different casing
+and spacing) and verifies the fake endpoint saw one request, the cache
+recorded one miss and one hit, and the cached answer matched. Then it changes
+the candidate set, which must miss again. Also reports the latency of a miss
+and a hit.
+
+Run from the repository root:
+    python -m benchmarks.check_response_cache [--delay 0.3]
+'''
+import argparse
+import os
+import sys
+import time
+
+from src.fake_openai import FakeOpenAIServer
+from src.persona_predictor import load_personas, classify_with_gpt
+from src.response_cache import ResponseCache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delay", type=float, default=0.3, help="simulated upstream latency in seconds")
+    args = parser.parse_args()
+
+    personas = load_personas("data/personas/personas.yaml")
+    candidates = personas[:2]
+    cache = ResponseCache(":memory:")
+
+    with FakeOpenAIServer(delay=args.delay) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+
+        start = time.perf_counter()
+        first = classify_with_gpt("Adventurer, Traveler", "Visited Naples today.", candidates, "sk-fake", cache=cache)
+        miss_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        second = classify_with_gpt("  adventurer,  TRAVELER ", "visited naples today.", candidates, "sk-fake", cache=cache)
+        hit_time = time.perf_counter() - start
+
+        classify_with_gpt("Adventurer, Traveler", "Visited Naples today.", personas[:3], "sk-fake", cache=cache)
+
+    print(f"miss: {miss_time * 1000:.1f} ms, hit: {hit_time * 1000:.1f} ms")
+    print(f"upstream calls: {server.calls}, cache: {cache.stats()}")
+
+    failures = []
+    if first != second:
+        failures.append("cached answer differs from the original")
+    if server.calls != 2:
+        failures.append(f"expected 2 upstream calls, got {server.calls}")
+    if (cache.hits, cache.misses) != (1, 2):
+        failures.append(f"expected 1 hit / 2 misses, got {cache.hits} / {cache.misses}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
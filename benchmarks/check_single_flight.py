@@ -0,0 +1,213 @@
+'''
+Offline check of single-flight coalescing (src/single_flight.py) against the
+local fake endpoint, with the response cache disabled so that only
+coalescing can save upstream calls:
+  - N concurrent identical classify_with_gpt calls make exactly one
+    upstream call and all get its answer
+  - the same holds for classify_with_gpt_async under asyncio.gather, and for
+    streamed calls joined by non-streamed ones
+  - different inputs are not coalesced, and a finished call is not reused
+  - an upstream error reaches every waiting caller, from one upstream call
+  - a streamed call closed early hands over to a waiting caller
+  - N concurrent identical rule-based predictions extract keywords once
+
+Finally times the N identical calls with coalescing turned off.
+
+Run from the repository root:
+    python -m benchmarks.check_single_flight [--requests 16] [--delay 0.3]
+'''
+import argparse
+import asyncio
+import sys
+import threading
+import time
+
+from src import persona_predictor
+from src.fake_openai import FakeOpenAIServer
+from src.openai_client import OpenAIClientManager, set_client_manager
+from src.persona_predictor import (
+    GPT_FLIGHT, RULE_BASED_FLIGHT, classify_with_gpt, classify_with_gpt_async, classify_with_gpt_stream,
+    load_personas, predict_rule_based
+)
+from src.response_cache import ResponseCache
+
+API_KEY = "sk-fake"
+BIO = "Tech lover, gadget collector"
+POSTS = ["Unboxing the new phone today", "Shipping my side project"]
+
+
+def no_cache():
+    return ResponseCache(":memory:", ttl_seconds=0)
+
+
+def run_together(count, fn):
+    '''
+    fn(i) in count threads released at once; returns (results, errors) by thread.
+    '''
+    barrier = threading.Barrier(count)
+    results, errors = [None] * count, [None] * count
+
+    def call(i):
+        barrier.wait()
+        try:
+            results[i] = fn(i)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def check_gpt(candidates, args, failures):
+    n = args.requests
+    with FakeOpenAIServer(delay=args.delay, token_delay=0.01) as server:
+        set_client_manager(OpenAIClientManager(base_url=server.base_url, max_concurrency=n))
+        classify_with_gpt("warm-up", "warm-up", candidates, API_KEY, cache=no_cache())
+
+        calls = server.calls
+        coalesced = GPT_FLIGHT.coalesced
+        start = time.perf_counter()
+        results, errors = run_together(n, lambda i: classify_with_gpt(BIO, POSTS, candidates, API_KEY,
+                                                                      cache=no_cache()))
+        coalesced_time = time.perf_counter() - start
+        if server.calls - calls != 1:
+            failures.append(f"{n} identical calls made {server.calls - calls} upstream calls, not 1")
+        if any(errors) or len(set(results)) != 1 or not results[0][0]:
+            failures.append(f"identical calls got different answers or errors: {set(results)} {errors}")
+        if GPT_FLIGHT.coalesced - coalesced != n - 1:
+            failures.append(f"{GPT_FLIGHT.coalesced - coalesced} calls counted as coalesced, not {n - 1}")
+
+        calls = server.calls
+        classify_with_gpt(BIO, POSTS, candidates, API_KEY, cache=no_cache())
+        if server.calls - calls != 1:
+            failures.append("a call after the identical ones were done did not go upstream")
+
+        calls = server.calls
+        run_together(n, lambda i: classify_with_gpt(f"{BIO} {i}", POSTS, candidates, API_KEY, cache=no_cache()))
+        if server.calls - calls != n:
+            failures.append(f"{n} different inputs made {server.calls - calls} upstream calls")
+
+        async def gather():
+            return await asyncio.gather(*[classify_with_gpt_async("Async " + BIO, POSTS, candidates, API_KEY,
+                                                                  cache=no_cache()) for _ in range(n)])
+
+        calls = server.calls
+        answers = asyncio.run(gather())
+        if server.calls - calls != 1 or len(set(answers)) != 1:
+            failures.append(f"{n} identical async calls made {server.calls - calls} upstream calls")
+
+        # Half stream, half wait for the whole answer
+        calls = server.calls
+        results, errors = run_together(n, lambda i: list(classify_with_gpt_stream(
+            "Stream " + BIO, POSTS, candidates, API_KEY, cache=no_cache()))[-1] if i % 2 else classify_with_gpt(
+            "Stream " + BIO, POSTS, candidates, API_KEY, cache=no_cache()))
+        if server.calls - calls != 1 or any(errors) or len(set(results)) != 1:
+            failures.append(f"{n} identical streamed and plain calls made {server.calls - calls} upstream calls, "
+                            f"answers {set(results)}, errors {[e for e in errors if e]}")
+
+        # A streamed leader closed early: the caller waiting on it makes its own call
+        calls = server.calls
+        stream = classify_with_gpt_stream("Closed " + BIO, POSTS, candidates, API_KEY, cache=no_cache())
+        next(stream)
+        coalesced = GPT_FLIGHT.coalesced
+        follower = {}
+        thread = threading.Thread(target=lambda: follower.update(answer=classify_with_gpt(
+            "Closed " + BIO, POSTS, candidates, API_KEY, cache=no_cache())))
+        thread.start()
+        wait_for(lambda: GPT_FLIGHT.coalesced > coalesced)
+        stream.close()
+        thread.join()
+        if not follower.get("answer", ("",))[0] or server.calls - calls != 2:
+            failures.append(f"closing a streamed leader left its follower with {follower} "
+                            f"after {server.calls - calls} upstream calls")
+
+        GPT_FLIGHT.enabled = False
+        calls = server.calls
+        start = time.perf_counter()
+        run_together(n, lambda i: classify_with_gpt(BIO, POSTS, candidates, API_KEY, cache=no_cache()))
+        separate_time = time.perf_counter() - start
+        separate_calls = server.calls - calls
+        GPT_FLIGHT.enabled = True
+
+    with FakeOpenAIServer(delay=args.delay, failures=n * 10, failure_status=400) as server:
+        set_client_manager(OpenAIClientManager(base_url=server.base_url, max_concurrency=n))
+        results, errors = run_together(n, lambda i: classify_with_gpt("Failing " + BIO, POSTS, candidates, API_KEY,
+                                                                      cache=no_cache()))
+        if server.calls != 1 or not all(errors):
+            failures.append(f"a failing call made {server.calls} upstream calls and reached "
+                            f"{sum(e is not None for e in errors)} of {n} callers")
+
+    print(f"{n} identical GPT calls: 1 upstream call in {coalesced_time * 1000:.0f} ms coalesced, "
+          f"{separate_calls} in {separate_time * 1000:.0f} ms without coalescing")
+
+
+def check_rule_based(args, failures):
+    personas = load_personas("data/personas/personas.yaml")
+    n = args.requests
+    extract = persona_predictor.extract_segment_keywords
+    extractions = []
+
+    # Slowed down so the identical calls overlap however fast parsing is here
+    def slow_extract(*a, **kw):
+        extractions.append(a[0])
+        time.sleep(args.delay)
+        return extract(*a, **kw)
+
+    persona_predictor.extract_segment_keywords = slow_extract
+    try:
+        coalesced = RULE_BASED_FLIGHT.coalesced
+        results, errors = run_together(n, lambda i: predict_rule_based(personas, BIO, POSTS))
+        if any(errors):
+            failures.append(f"identical rule-based predictions raised {[repr(e) for e in errors if e]}")
+        if len(extractions) != 1:
+            failures.append(f"{n} identical rule-based predictions extracted keywords {len(extractions)} times")
+        if any(r is not results[0] for r in results):
+            failures.append("identical rule-based predictions got different results")
+        if RULE_BASED_FLIGHT.coalesced - coalesced != n - 1:
+            failures.append(f"{RULE_BASED_FLIGHT.coalesced - coalesced} rule-based calls counted as coalesced")
+
+        del extractions[:]
+        _, different_errors = run_together(n, lambda i: predict_rule_based(personas, BIO, [*POSTS, f"post {i}"]))
+        if any(different_errors):
+            failures.append(f"different rule-based inputs raised {[repr(e) for e in different_errors if e]}")
+        if len(extractions) != n:
+            failures.append(f"{n} different rule-based inputs were extracted {len(extractions)} times")
+    finally:
+        persona_predictor.extract_segment_keywords = extract
+    # Without a coalesced result (every call raised) there is nothing to compare
+    if results[0] is not None and [(p["persona_name"], s) for p, s, _, _ in results[0]] != \
+            [(p["persona_name"], s) for p, s, _, _ in predict_rule_based(personas, BIO, POSTS)]:
+        failures.append("a coalesced rule-based result differs from computing it alone")
+    print(f"{n} identical rule-based predictions: keywords extracted once")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=16, help="concurrent identical requests")
+    parser.add_argument("--delay", type=float, default=0.3, help="simulated upstream latency, in seconds")
+    args = parser.parse_args()
+
+    candidates = load_personas("data/personas/personas.yaml")[:3]
+    failures = []
+    check_gpt(candidates, args, failures)
+    check_rule_based(args, failures)
+
+    for failure in failures[:20]:
+        print(f"FAIL {failure}")
+    print("OK" if not failures else f"{len(failures)} failure(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
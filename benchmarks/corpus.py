@@ -0,0 +1,174 @@
+'''
+Synthetic data for benchmarks: creator profiles (bio + posts) built from the
+persona vocabulary, and persona files with hundreds to thousands of personas.
+
+Everything is seeded, so the same arguments always produce the same data.
+
+Run from the repository root:
+    python -m benchmarks.corpus users out.jsonl [--count 1000] [--posts 5] [--post-words 30] [--bio-words 15]
+    python -m benchmarks.corpus personas out.yaml [--count 1000] [--keywords 20] [--negatives 8]
+
+The users file is in the input format of `python -m src.batch predict`.
+'''
+import argparse
+import json
+import random
+from typing import Dict, List, Optional
+
+import yaml
+
+DEFAULT_PERSONAS_PATH = "data/personas/personas.yaml"
+
+# Sentence shapes seen in the sample bios and posts; {kw} is filled with a persona keyword
+POST_TEMPLATES = [
+    "Just tried {kw} for the first time and it was amazing.",
+    "Here are the 10 reasons why you should care about {kw}.",
+    "Spent the whole weekend on {kw} and {kw}.",
+    "I just released a video on {kw}. Go check it out!",
+    "Can't stop thinking about {kw} lately.",
+    "My honest review of {kw} after a month.",
+    "Anyone else obsessed with {kw}?",
+    "Today was all about {kw}, tomorrow is {kw}.",
+]
+BIO_TEMPLATES = [
+    "{kw} lover",
+    "{kw} and {kw} enthusiast",
+    "Full-time {kw}",
+    "Sharing my {kw} journey",
+    "Obsessed with {kw}",
+]
+FILLER = (
+    "today really the best new little week people always time good day love life morning "
+    "friends world thing great back home first last still every make know think feel"
+).split()
+SYLLABLES = "ba be bi bo bu ka ke ki ko ku la le li lo lu ma me mi mo mu na ne ni no nu ra re ri ro ru ta te ti to tu".split()
+
+
+def load_vocabulary(personas: List[Dict]) -> Dict[str, List[str]]:
+    '''
+    persona_name -> positive keywords.
+    '''
+    return {p["persona_name"]: list(p.get("keywords", []) or []) for p in personas}
+
+
+def _sentence(rng: random.Random, template: str, keywords: List[str], other: List[str]) -> str:
+    # Mostly the user's own persona, sometimes someone else's
+    parts = template.split("{kw}")
+    words = [rng.choice(keywords if rng.random() < 0.8 or not other else other) for _ in parts[1:]]
+    sentence = parts[0] + "".join(w + p for w, p in zip(words, parts[1:]))
+    return sentence[0].upper() + sentence[1:]
+
+
+def _text(rng: random.Random, templates: List[str], n_words: int, keywords: List[str], other: List[str]) -> str:
+    sentences = []
+    words = 0
+    while words < n_words:
+        if rng.random() < 0.6:
+            sentence = _sentence(rng, rng.choice(templates), keywords, other)
+        else:
+            sentence = " ".join(rng.choice(FILLER) for _ in range(rng.randint(3, 8))).capitalize() + "."
+        sentences.append(sentence)
+        words += len(sentence.split())
+    return " ".join(sentences)
+
+
+def generate_users(personas: List[Dict], count: int, seed: int = 0, posts: int = 5,
+                   post_words: int = 30, bio_words: int = 15) -> List[Dict]:
+    '''
+    count profiles, each leaning towards one randomly chosen persona, with
+    roughly bio_words words in the bio and post_words words per post.
+    '''
+    rng = random.Random(seed)
+    vocabulary = {name: kws for name, kws in load_vocabulary(personas).items() if kws}
+    names = sorted(vocabulary)
+    all_keywords = [kw for name in names for kw in vocabulary[name]]
+    users = []
+    for i in range(count):
+        name = rng.choice(names)
+        keywords = vocabulary[name]
+        users.append({
+            "id": i,
+            "persona": name,
+            "bio": _text(rng, BIO_TEMPLATES, bio_words, keywords, all_keywords),
+            "posts": [_text(rng, POST_TEMPLATES, post_words, keywords, all_keywords) for _ in range(posts)],
+        })
+    return users
+
+
+def _pseudo_word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def generate_personas(count: int, seed: int = 0, keywords: int = 20, negatives: int = 8,
+                      base: Optional[List[Dict]] = None) -> List[Dict]:
+    '''
+    count personas in the personas.yaml layout. Keywords mix the real
+    vocabulary with generated words, so the index grows the way a larger
+    catalogue would; about one keyword in ten is a multi-word phrase.
+    '''
+    rng = random.Random(seed)
+    real = sorted({kw for kws in load_vocabulary(base or []).values() for kw in kws})
+    personas = []
+    for i in range(count):
+        def keyword():
+            if real and rng.random() < 0.5:
+                return rng.choice(real)
+            if rng.random() < 0.1:
+                return f"{_pseudo_word(rng)} {_pseudo_word(rng)}"
+            return _pseudo_word(rng)
+        positive = list(dict.fromkeys(keyword() for _ in range(keywords)))
+        negative = [kw for kw in dict.fromkeys(keyword() for _ in range(negatives)) if kw not in positive]
+        personas.append({
+            "persona_name": f"synthetic_{i:05d}",
+            "description": f"Synthetic persona {i} for benchmarks.",
+            "display_name": f"Synthetic {i}",
+            "icon": "",
+            "keywords": positive,
+            "negative_keywords": negative,
+            "notable_figures": [],
+            "notable_influencers": [],
+            "related_entities": [],
+        })
+    return personas
+
+
+def read_personas(path: str = DEFAULT_PERSONAS_PATH) -> List[Dict]:
+    with open(path, "r") as f:
+        return yaml.safe_load(f) or []
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.corpus", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    users = sub.add_parser("users", help="write a JSONL file of synthetic profiles")
+    users.add_argument("out")
+    users.add_argument("--personas", default=DEFAULT_PERSONAS_PATH, help="vocabulary source")
+    users.add_argument("--count", type=int, default=1000)
+    users.add_argument("--posts", type=int, default=5)
+    users.add_argument("--post-words", type=int, default=30)
+    users.add_argument("--bio-words", type=int, default=15)
+    users.add_argument("--seed", type=int, default=0)
+    personas = sub.add_parser("personas", help="write a synthetic persona YAML file")
+    personas.add_argument("out")
+    personas.add_argument("--count", type=int, default=1000)
+    personas.add_argument("--keywords", type=int, default=20)
+    personas.add_argument("--negatives", type=int, default=8)
+    personas.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "users":
+        records = generate_users(read_personas(args.personas), args.count, args.seed,
+                                 args.posts, args.post_words, args.bio_words)
+        with open(args.out, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+    else:
+        records = generate_personas(args.count, args.seed, args.keywords, args.negatives, read_personas())
+        with open(args.out, "w") as f:
+            yaml.dump(records, f, sort_keys=False)
+    print(f"Wrote {len(records)} {args.command} to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
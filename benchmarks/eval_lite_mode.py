@@ -0,0 +1,149 @@
+'''
+Evaluation of the lite (spaCy-free) extraction mode against the full mode.
+
+Each mode runs in its own subprocess with PERSONA_EXTRACTION_MODE set, so
+startup time and peak memory are those of a fresh process in that mode.
+Every user of the corpus is extracted and scored with top_n=3, and the
+resulting persona rankings are compared:
+
+  top-1 agreement     the lite top persona equals the full one
+  top-3 exact         same personas in the same order
+  top-3 overlap       mean Jaccard overlap of the top-3 persona sets
+  label accuracy      top persona equals the persona the synthetic user was generated from
+
+Only personas with a positive score and matched keywords count as ranked,
+as in the app. The corpus is synthetic users from benchmarks.corpus, or
+a JSONL file in the `python -m src.batch predict` input format.
+
+Run from the repository root:
+    python -m benchmarks.eval_lite_mode [--users 500] [--input users.jsonl] [--min-agreement 0.9]
+
+Exits with status 1 if top-1 agreement is below --min-agreement.
+'''
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import generate_users, read_personas
+from src.metrics import percentile
+
+DEFAULT_PERSONAS_PATH = "data/personas/personas.yaml"
+
+
+def run_worker(users_path, personas_path, out_path):
+    '''
+    Runs inside the subprocess: scores every user in the mode set by the environment.
+    '''
+    start = time.perf_counter()
+    from src.keyword_cache import KeywordCache
+    from src.persona_predictor import (EXTRACTION_MODE, extract_segment_keywords, load_personas, score_personas,
+                                       user_segments)
+    personas = load_personas(personas_path)
+    # Keeps nothing: every user's segments are extracted, as on a first visit
+    no_cache = KeywordCache(max_entries=0)
+    with open(users_path, "r", encoding="utf-8") as f:
+        users = [json.loads(line) for line in f if line.strip()]
+
+    rankings = []
+    latencies = []
+    for i, user in enumerate(users):
+        t = time.perf_counter()
+        posts = [user["posts"]] if isinstance(user["posts"], str) else user["posts"]
+        segments = user_segments(user["bio"], posts)
+        top = score_personas(personas, extract_segment_keywords(segments, personas.index.phrases, cache=no_cache),
+                             top_n=3)
+        elapsed = time.perf_counter() - t
+        if i == 0:
+            # The first call includes loading the model in full mode
+            startup = time.perf_counter() - start
+        else:
+            latencies.append(elapsed)
+        rankings.append([p["persona_name"] for p, score, matched, _ in top if score > 0 and matched])
+
+    with open(out_path, "w") as f:
+        json.dump({
+            "mode": EXTRACTION_MODE,
+            "startup_s": startup,
+            "latencies": latencies,
+            "rankings": rankings,
+            "labels": [user.get("persona") for user in users],
+            # ru_maxrss is in kilobytes on Linux
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "spacy_imported": "spacy" in sys.modules,
+        }, f)
+
+
+def run_mode(mode, users_path, personas_path, tmp):
+    out_path = os.path.join(tmp, f"{mode}.json")
+    env = dict(os.environ, PERSONA_EXTRACTION_MODE=mode, PERSONA_METRICS="0")
+    subprocess.run([sys.executable, "-m", "benchmarks.eval_lite_mode", "--worker", users_path, personas_path, out_path],
+                   env=env, check=True)
+    with open(out_path) as f:
+        return json.load(f)
+
+
+def compare(full, lite):
+    pairs = list(zip(full["rankings"], lite["rankings"]))
+    ranked = [(f, l) for f, l in pairs if f]
+    top1 = sum(1 for f, l in ranked if l and l[0] == f[0]) / len(ranked) if ranked else 1.0
+    exact = sum(1 for f, l in pairs if f == l) / len(pairs) if pairs else 1.0
+    overlaps = [len(set(f) & set(l)) / len(set(f) | set(l)) if f or l else 1.0 for f, l in pairs]
+    return {"top1": top1, "exact": exact, "overlap": sum(overlaps) / len(overlaps) if overlaps else 1.0}
+
+
+def label_accuracy(result):
+    labelled = [(ranking, label) for ranking, label in zip(result["rankings"], result["labels"]) if label]
+    if not labelled:
+        return float("nan")
+    return sum(1 for ranking, label in labelled if ranking and ranking[0] == label) / len(labelled)
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == "--worker":
+        run_worker(*sys.argv[2:])
+        return 0
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.eval_lite_mode", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500, help="synthetic users, unless --input is given")
+    parser.add_argument("--input", help="JSONL corpus with bio/posts (and optionally persona) per line")
+    parser.add_argument("--personas", default=DEFAULT_PERSONAS_PATH)
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--min-agreement", type=float, default=0.0, help="minimum top-1 agreement")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        users_path = args.input
+        if users_path is None:
+            users_path = os.path.join(tmp, "users.jsonl")
+            with open(users_path, "w", encoding="utf-8") as f:
+                for user in generate_users(read_personas(args.personas), args.users, seed=args.seed):
+                    f.write(json.dumps(user) + "\n")
+        full = run_mode("full", users_path, args.personas, tmp)
+        lite = run_mode("lite", users_path, args.personas, tmp)
+
+    print(f"{'mode':<6} {'p50 ms':>8} {'p95 ms':>8} {'users/s':>9} {'startup s':>10} {'max RSS MB':>11} "
+          f"{'label acc':>10}  spaCy imported")
+    for result in (full, lite):
+        latencies = sorted(result["latencies"])
+        throughput = len(latencies) / sum(latencies) if latencies else float("nan")
+        print(f"{result['mode']:<6} {percentile(latencies, 0.5) * 1000:>8.3f} {percentile(latencies, 0.95) * 1000:>8.3f} "
+              f"{throughput:>9.0f} {result['startup_s']:>10.2f} {result['max_rss_mb']:>11.1f} "
+              f"{label_accuracy(result):>10.1%}  {result['spacy_imported']}")
+
+    agreement = compare(full, lite)
+    print(f"\n{len(full['rankings'])} users: top-1 agreement {agreement['top1']:.1%}, "
+          f"top-3 exact {agreement['exact']:.1%}, top-3 overlap {agreement['overlap']:.1%}")
+    if agreement["top1"] < args.min_agreement:
+        print(f"Top-1 agreement below {args.min_agreement:.1%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
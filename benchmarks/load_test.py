@@ -0,0 +1,146 @@
+'''
+Load test for the inference server (src/server.py).
+
+Starts a server in-process (or targets --url) and drives it from
+--concurrency client threads, each on its own keep-alive connection, for
+--duration seconds. Request bodies are synthetic users from
+benchmarks.corpus. Reports requests/sec, latency percentiles and the
+status code mix (429s show where backpressure kicks in).
+
+Run from the repository root:
+    python -m benchmarks.load_test [--concurrency 1 8 32] [--duration 10] [--gpt] [--batch-users 0] [--parse-workers 0]
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --concurrency 16
+
+Parsing runs on the server's batcher thread, so on one core. With
+--parse-workers N (in-process server only) it is split across N worker
+processes (PERSONA_PARSE_WORKERS); compare runs with 0, 2, 4, ... up to the
+number of cores to see throughput grow with the workers.
+
+With --gpt, GPT classification goes to the local fake endpoint (in-process
+server only) with the response cache disabled.
+'''
+import argparse
+import http.client
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+from benchmarks.corpus import generate_users, read_personas
+from src.metrics import percentile
+
+
+def run_clients(url, bodies, path, concurrency, duration):
+    parsed = urlparse(url)
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(worker):
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=60)
+        local_latencies = []
+        local_statuses = Counter()
+        i = worker
+        while time.perf_counter() < stop_at:
+            body = bodies[i % len(bodies)]
+            i += concurrency
+            start = time.perf_counter()
+            try:
+                conn.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=60)
+                status = "error"
+            local_statuses[status] += 1
+            if status == 200:
+                local_latencies.append(time.perf_counter() - start)
+            elif status == 429:
+                # Honour backpressure briefly instead of spinning on the server
+                time.sleep(0.01)
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+
+    threads = [threading.Thread(target=client, args=(w,)) for w in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return latencies, statuses, elapsed
+
+
+def make_bodies(count, batch_users, gpt):
+    users = generate_users(read_personas(), count, seed=1)
+    if batch_users:
+        return "/predict/batch", [
+            json.dumps({"users": users[i:i + batch_users], "gpt": gpt}).encode("utf-8")
+            for i in range(0, len(users), batch_users)
+        ]
+    return "/predict", [json.dumps({"bio": u["bio"], "posts": u["posts"], "gpt": gpt}).encode("utf-8") for u in users]
+
+
+def report(concurrency, latencies, statuses, elapsed):
+    ok = statuses.get(200, 0)
+    print(f"{concurrency:>11} {ok / elapsed:>9.1f} {percentile(latencies, 0.5) * 1000:>9.1f} "
+          f"{percentile(latencies, 0.95) * 1000:>9.1f} {percentile(latencies, 0.99) * 1000:>9.1f}  "
+          f"{dict(sorted(statuses.items(), key=str))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="existing server; default starts one in-process")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--users", type=int, default=500, help="distinct synthetic users to cycle through")
+    parser.add_argument("--batch-users", type=int, default=0, help="send /predict/batch with this many users")
+    parser.add_argument("--gpt", action="store_true")
+    parser.add_argument("--window-ms", type=float)
+    parser.add_argument("--max-batch", type=int)
+    parser.add_argument("--queue-size", type=int)
+    parser.add_argument("--parse-workers", type=int, help="spaCy worker processes of the in-process server")
+    args = parser.parse_args()
+
+    path, bodies = make_bodies(args.users, args.batch_users, args.gpt)
+
+    def run_all(url):
+        print(f"{'concurrency':>11} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  statuses")
+        for concurrency in args.concurrency:
+            report(concurrency, *run_clients(url, bodies, path, concurrency, args.duration))
+
+    if args.url:
+        run_all(args.url)
+        return
+
+    if args.parse_workers is not None:
+        # Read when src.persona_predictor is first imported, below
+        os.environ["PERSONA_PARSE_WORKERS"] = str(args.parse_workers)
+    from src import server as server_module
+    from src.fake_openai import FakeOpenAIServer
+    from src.openai_client import OpenAIClientManager, set_client_manager
+    from src.response_cache import ResponseCache
+
+    options = {k: v for k, v in (("window_ms", args.window_ms), ("max_batch", args.max_batch),
+                                  ("queue_size", args.queue_size)) if v is not None}
+    with FakeOpenAIServer(delay=0.2) as fake, tempfile.TemporaryDirectory() as tmp:
+        set_client_manager(OpenAIClientManager(base_url=fake.base_url))
+        # TTL 0: every GPT call goes upstream, as it would for first-time visitors
+        cache = ResponseCache(f"{tmp}/cache.sqlite3", ttl_seconds=0)
+        service = server_module.PredictionService(openai_api_key="sk-load-test" if args.gpt else None,
+                                                  cache=cache, **options)
+        with server_module.PredictionServer(service, port=0) as server:
+            run_all(server.url)
+
+
+if __name__ == "__main__":
+    main()
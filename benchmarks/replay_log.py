@@ -0,0 +1,306 @@
+'''
+Replays recorded queries from the app's logs against the prediction
+pipeline, to measure it under real inputs and to catch behavioural drift.
+
+The recorded predictions are read with src/query_log.py, streaming, from
+the plain-text log of earlier versions and the JSON-lines request log (only
+sampled requests carry the full bio and posts). `corpus` writes them to a
+corpus file that `run` reads like a log.
+
+`run` sends each recorded request through the pipeline the app runs:
+keyword extraction, rule-based scoring and GPT classification. OpenAI is
+replaced by the local fake endpoint, answering each prompt with the GPT
+answer recorded for the same bio and posts after the recorded upstream
+latency (the median of the corpus where none was recorded). Requests are
+sent by --concurrency workers back to back or, with --rate, at a fixed rate
+(latency then counts from the scheduled send, so queueing shows).
+
+Reports throughput, latency percentiles and mismatches with the logged
+decisions:
+  rule_based_top       the top rule-based persona differs
+  rule_based_ranking   the rule-based personas or their scores differ
+  gpt_persona          the GPT persona is none of those logged for the input
+A mismatch is drift in the personas, the extraction or the scoring since
+the request was logged, or a persona renamed since (the old log has
+display names).
+
+Run from the repository root:
+    python -m benchmarks.replay_log corpus logs/digital_persona_queries.log [more logs] --out corpus.jsonl
+    python -m benchmarks.replay_log run logs/digital_persona_queries.log [--concurrency 4] [--rate 0] [--loops 1]
+        [--limit 0] [--latency-scale 1.0] [--gpt-cache] [--show 5] [--fail-on-mismatch]
+'''
+import argparse
+import json
+import re
+import statistics
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from src.fake_openai import FakeOpenAIServer
+from src.metrics import percentile
+from src.openai_client import OpenAIClientManager, set_client_manager
+from src.persona_predictor import classify_with_gpt, load_personas, predict_rule_based
+from src.prompt_budget import dedupe_posts
+from src.query_log import read_query_log
+from src.response_cache import ResponseCache
+
+PERSONAS_PATH = "data/personas/personas.yaml"
+API_KEY = "sk-replay"
+# The bio and the posts are the first two triple-quoted blocks of the prompt (data/gpt_prompt.txt)
+PROMPT_BLOCK = re.compile(r'"""\n(.*?)\n"""', re.S)
+
+
+def normalize(text):
+    return " ".join(text.lower().split())
+
+
+def input_key(bio, posts_text):
+    return normalize(bio), normalize(posts_text)
+
+
+def record_key(record):
+    # As the prompt shows it: repeated posts dropped, the rest joined with spaces
+    return input_key(record["bio"], " ".join(dedupe_posts(record["posts"])))
+
+
+def recorded_answer(record):
+    if record["gpt_response"]:
+        return record["gpt_response"]
+    if record["gpt_persona"] is not None:
+        return f"Persona: {record['gpt_persona']}\nReasoning: {record['gpt_reasoning'] or ''}"
+    return None
+
+
+def load_corpus(paths, personas, limit=0):
+    skipped = Counter()
+    records = []
+    for path in paths:
+        for record in read_query_log(path, personas, skipped):
+            records.append(record)
+            if limit and len(records) >= limit:
+                return records, skipped
+    return records, skipped
+
+
+class RecordedAnswers:
+    '''
+    Reply callable for the fake endpoint: the recorded GPT answer for the
+    bio and posts in the prompt, returned after its recorded latency.
+    Answers recorded for the same input are handed out in turn; a prompt
+    matching no recorded bio is answered without a persona.
+    '''
+
+    def __init__(self, records, latency_scale=1.0):
+        known = [r["gpt_latency_ms"] for r in records if r["gpt_latency_ms"] is not None]
+        default_ms = statistics.median(known) if known else 0.0
+        self.latency_scale = latency_scale
+        self.answers = defaultdict(list)
+        self.by_bio = defaultdict(list)
+        for record in records:
+            content = recorded_answer(record)
+            if content is None:
+                continue
+            latency_ms = record["gpt_latency_ms"] if record["gpt_latency_ms"] is not None else default_ms
+            key = record_key(record)
+            self.answers[key].append((content, latency_ms))
+            self.by_bio[key[0]].append((content, latency_ms))
+        self.turns = Counter()
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        blocks = PROMPT_BLOCK.findall(request["messages"][-1]["content"])
+        key = input_key(*blocks[:2]) if len(blocks) >= 2 else ("", "")
+        # The prompt budget may have cut the posts; the bio alone then picks the answer
+        answers = self.answers.get(key) or self.by_bio.get(key[0])
+        with self.lock:
+            if not answers:
+                self.misses += 1
+                return "Persona: \nReasoning: no recorded answer for this input"
+            content, latency_ms = answers[self.turns[key] % len(answers)]
+            self.turns[key] += 1
+        time.sleep(latency_ms / 1000 * self.latency_scale)
+        return content
+
+
+def replay_one(record, personas, cache):
+    '''
+    One request through the pipeline of the app: extraction, scoring and,
+    if the request was classified by GPT when logged, GPT classification.
+    '''
+    bio, posts = record["bio"], record["posts"]
+    top_personas = predict_rule_based(personas, bio, posts, top_n=3)
+    matches = [(persona, score) for persona, score, matched_keywords, _ in top_personas
+               if score > 0 and matched_keywords]
+    gpt_persona = None
+    if recorded_answer(record) is not None:
+        gpt_persona, _ = classify_with_gpt(bio, posts, [persona for persona, _ in matches], API_KEY, cache=cache)
+    return {"rule_based": [(persona["persona_name"], round(float(score), 3)) for persona, score in matches],
+            "gpt_persona": gpt_persona}
+
+
+def compare(record, result, gpt_personas):
+    logged = [(m["persona"], round(float(m["score"]), 3)) for m in record["rule_based"]]
+    kinds = []
+    if (logged[0][0] if logged else None) != (result["rule_based"][0][0] if result["rule_based"] else None):
+        kinds.append("rule_based_top")
+    if logged != result["rule_based"]:
+        kinds.append("rule_based_ranking")
+    if result["gpt_persona"] is not None and result["gpt_persona"] not in gpt_personas[record_key(record)]:
+        kinds.append("gpt_persona")
+    return kinds
+
+
+def run_replay(records, personas, concurrency, rate, cache_factory):
+    '''
+    Replays records with `concurrency` workers, back to back or at `rate`
+    requests per second. Returns (results, latencies, errors, elapsed).
+    '''
+    results = [None] * len(records)
+    latencies = []
+    errors = Counter()
+    lock = threading.Lock()
+    cache = cache_factory()
+
+    def send(i, scheduled):
+        try:
+            result = replay_one(records[i], personas, cache)
+        except Exception as e:
+            with lock:
+                errors[type(e).__name__] += 1
+            return
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            results[i] = result
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    if rate > 0:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for i in range(len(records)):
+                scheduled = start + i / rate
+                time.sleep(max(0.0, scheduled - time.perf_counter()))
+                executor.submit(send, i, scheduled)
+    else:
+        next_index = iter(range(len(records)))
+
+        def worker():
+            while True:
+                with lock:
+                    i = next(next_index, None)
+                if i is None:
+                    return
+                send(i, time.perf_counter())
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return results, latencies, errors, time.perf_counter() - start
+
+
+def write_corpus(args):
+    personas = load_personas(PERSONAS_PATH)
+    records, skipped = load_corpus(args.logs, personas, args.limit)
+    with open(args.out, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"{len(records)} recorded requests written to {args.out}"
+          + "".join(f", {count} skipped ({reason})" for reason, count in skipped.items()))
+    return 0
+
+
+def run(args):
+    personas = load_personas(PERSONAS_PATH)
+    records, skipped = load_corpus(args.logs, personas, args.limit)
+    if not records:
+        print("no replayable requests in " + ", ".join(args.logs)
+              + "".join(f"; {count} skipped ({reason})" for reason, count in skipped.items()))
+        return 1
+    gpt_personas = defaultdict(set)
+    for record in records:
+        if record["gpt_persona"] is not None:
+            gpt_personas[record_key(record)].add(record["gpt_persona"])
+    replayed = records * args.loops
+
+    answers = RecordedAnswers(records, args.latency_scale)
+    if args.gpt_cache:
+        def cache_factory():
+            return ResponseCache(":memory:")
+    else:
+        # Every GPT call goes to the stub, except identical ones in progress at once (coalesced)
+        def cache_factory():
+            return ResponseCache(":memory:", ttl_seconds=0)
+    with FakeOpenAIServer(reply=answers) as server:
+        set_client_manager(OpenAIClientManager(base_url=server.base_url))
+        # Warm-up: loads the model and the OpenAI client outside the measurement
+        replay_one(dict(records[0], gpt_response=None, gpt_persona=None), personas, cache_factory())
+        classify_with_gpt("warm-up", "warm-up", [], API_KEY, cache=cache_factory())
+        calls_before, answers.misses = server.calls, 0
+        results, latencies, errors, elapsed = run_replay(replayed, personas, args.concurrency, args.rate,
+                                                         cache_factory)
+        upstream_calls = server.calls - calls_before
+
+    mismatches = Counter()
+    examples = []
+    for record, result in zip(replayed, results):
+        if result is None:
+            continue
+        kinds = compare(record, result, gpt_personas)
+        mismatches.update(kinds)
+        if kinds and len(examples) < args.show:
+            examples.append((record, result, kinds))
+
+    mode = f"{args.rate:g} requests/s" if args.rate > 0 else "back to back"
+    print(f"{len(records)} recorded requests" + "".join(f", {count} skipped ({reason})" for reason, count in
+                                                        skipped.items())
+          + f"; replayed {len(replayed)} with {args.concurrency} worker(s), {mode}, "
+            f"GPT latency x{args.latency_scale:g}")
+    print(f"throughput: {len(latencies) / elapsed:.1f} requests/s ({elapsed:.1f} s)")
+    latencies.sort()
+    print(f"latency: p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p95 {percentile(latencies, 0.95) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms, max {max(latencies, default=0) * 1000:.1f} ms")
+    print(f"GPT stub: {upstream_calls} calls, {answers.misses} without a recorded answer")
+    if errors:
+        print("errors: " + ", ".join(f"{name} x{count}" for name, count in errors.items()))
+    compared = sum(result is not None for result in results)
+    for kind in ("rule_based_top", "rule_based_ranking", "gpt_persona"):
+        print(f"{kind:<20} {mismatches[kind]:>5} of {compared} mismatched")
+    for record, result, kinds in examples:
+        logged = [(m["persona"], m["score"]) for m in record["rule_based"]]
+        print(f"\n[{', '.join(kinds)}] bio {record['bio'][:60]!r}\n"
+              f"  logged:   {logged}, GPT {record['gpt_persona']!r}\n"
+              f"  replayed: {result['rule_based']}, GPT {result['gpt_persona']!r}")
+    return 1 if args.fail_on_mismatch and (sum(mismatches.values()) or errors) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.replay_log", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    corpus = commands.add_parser("corpus", help="write the recorded requests of logs to a corpus file")
+    corpus.add_argument("logs", nargs="+", help="query logs (either format) or corpus files")
+    corpus.add_argument("--out", required=True)
+    corpus.add_argument("--limit", type=int, default=0, help="stop after this many requests (0: all)")
+
+    replay = commands.add_parser("run", help="replay recorded requests against the pipeline")
+    replay.add_argument("logs", nargs="+", help="query logs (either format) or corpus files")
+    replay.add_argument("--concurrency", type=int, default=4, help="worker threads sending requests")
+    replay.add_argument("--rate", type=float, default=0, help="requests per second (0: back to back)")
+    replay.add_argument("--loops", type=int, default=1, help="replay the corpus this many times")
+    replay.add_argument("--limit", type=int, default=0, help="replay only the first requests (0: all)")
+    replay.add_argument("--latency-scale", type=float, default=1.0, help="multiplies the recorded GPT latency")
+    replay.add_argument("--gpt-cache", action="store_true", help="cache GPT answers during the replay")
+    replay.add_argument("--show", type=int, default=5, help="mismatches to print in full")
+    replay.add_argument("--fail-on-mismatch", action="store_true", help="exit with status 1 on any mismatch")
+    args = parser.parse_args()
+    return write_corpus(args) if args.command == "corpus" else run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
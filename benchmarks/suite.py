@@ -0,0 +1,267 @@
+'''
+Offline benchmark suite with a stored baseline.
+
+Every case runs on seeded synthetic data from benchmarks.corpus; GPT calls go
+to the local fake endpoint. For each case the suite reports per-item latency
+(p50/p95), throughput and peak Python memory (tracemalloc, measured in a
+separate pass so tracing doesn't skew the timings).
+
+  load_yaml[N]        parse a synthetic N-persona YAML and build its keyword index
+  load_bundle[N]      load the same personas from a warm compiled bundle
+  extract_keywords    spaCy keyword extraction per user, per segment as in the app (no cache)
+  score[real]         score_personas against data/personas/personas.yaml
+  score[N]            score_personas against N synthetic personas
+  predict             extract + score + classify_with_gpt (fake endpoint, no cache)
+
+Run from the repository root:
+    python -m benchmarks.suite                      # compare with benchmarks/baseline.json
+    python -m benchmarks.suite --save-baseline      # record a new baseline
+    python -m benchmarks.suite --cases score load   # only cases whose name starts with these
+    python -m benchmarks.suite --allow-no-baseline  # report only, when no baseline has been recorded
+
+Exits with status 1 if any metric is worse than the baseline by more than
+the tolerance, or if there is no baseline to compare with (unless
+--allow-no-baseline is given, e.g. for a first run that only reports).
+Cases missing from the baseline are listed; they fail the run when
+--baseline is given explicitly. Baselines are machine specific: record one
+on the machine that runs the comparison, and raise --tolerance on noisy
+shared hosts.
+'''
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+from benchmarks.corpus import generate_personas, generate_users, read_personas
+from src.metrics import percentile
+
+DEFAULT_BASELINE = "benchmarks/baseline.json"
+# Relative slack before a metric counts as a regression
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_MEMORY_TOLERANCE = 0.10
+
+
+class Case:
+    '''
+    A named benchmark: setup() runs once, run(item) is timed per item.
+    '''
+
+    def __init__(self, name, items, run, setup=None):
+        self.name = name
+        self.items = items
+        self.run = run
+        self.setup = setup
+
+
+def measure(case, repeat):
+    if case.setup:
+        case.setup()
+    for item in case.items[:3]:
+        case.run(item)
+
+    # Each repeat is a full pass; the best pass is reported, like timeit, so
+    # noise from the rest of the machine doesn't read as a regression
+    passes = []
+    for _ in range(repeat):
+        gc.collect()
+        latencies = []
+        start = time.perf_counter()
+        for item in case.items:
+            t = time.perf_counter()
+            case.run(item)
+            latencies.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        passes.append({
+            "p50_ms": statistics.median(latencies) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "throughput": len(latencies) / elapsed,
+        })
+
+    gc.collect()
+    tracemalloc.start()
+    for item in case.items:
+        case.run(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "p50_ms": min(p["p50_ms"] for p in passes),
+        "p95_ms": min(p["p95_ms"] for p in passes),
+        "throughput": max(p["throughput"] for p in passes),
+        "peak_kb": peak / 1024,
+    }
+
+
+def build_cases(args, tmp):
+    from src.persona_bundle import compile_bundle, load_persona_bundle
+    from src.keyword_cache import KeywordCache
+    from src.persona_predictor import (classify_with_gpt, extract_segment_keywords, load_personas, score_personas,
+                                       user_segments)
+    from src.response_cache import ResponseCache
+
+    real = load_personas("data/personas/personas.yaml")
+    users = generate_users(read_personas(), args.users, seed=0, posts=args.posts, post_words=args.post_words)
+    texts = [user_segments(u["bio"], u["posts"]) for u in users]
+    # A cache that keeps nothing, so every pass parses every segment
+    no_cache = KeywordCache(max_entries=0)
+
+    def extract(segments):
+        return extract_segment_keywords(segments, real.index.phrases, cache=no_cache)
+
+    cases = []
+    synthetic = {}
+    for n in args.personas:
+        path = os.path.join(tmp, f"synthetic_{n}.yaml")
+        with open(path, "w") as f:
+            yaml.dump(generate_personas(n, seed=n, base=read_personas()), f, sort_keys=False)
+        with open(path, "rb") as f:
+            source = f.read()
+        bundle_path = os.path.join(tmp, f"synthetic_{n}.bundle.pkl")
+        load_persona_bundle(path, None, bundle_path)
+        synthetic[n] = compile_bundle(source)["personas"]
+        cases.append(Case(f"load_yaml[{n}]", [source] * 3, lambda s: compile_bundle(s)))
+        cases.append(Case(f"load_bundle[{n}]", [path] * 3, lambda p, b=bundle_path: load_persona_bundle(p, None, b)))
+
+    cases.append(Case("extract_keywords", texts, extract))
+
+    # Scoring cases reuse one extraction per user, so they measure scoring only
+    tokens = {}
+
+    def extract_all():
+        if not tokens:
+            for i, text in enumerate(texts):
+                tokens[i] = extract(text)
+
+    cases.append(Case("score[real]", list(range(len(texts))),
+                      lambda i: score_personas(real, tokens[i], top_n=3), setup=extract_all))
+    for n, personas in synthetic.items():
+        cases.append(Case(f"score[{n}]", list(range(len(texts))),
+                          lambda i, p=personas: score_personas(p, tokens[i], top_n=3), setup=extract_all))
+
+    cache = ResponseCache(os.path.join(tmp, "gpt_cache.sqlite3"), ttl_seconds=0)
+
+    def predict(user):
+        top = score_personas(real, extract(user_segments(user["bio"], user["posts"])))
+        return classify_with_gpt(user["bio"], " ".join(user["posts"]), [p[0] for p in top], "sk-bench", cache=cache)
+
+    cases.append(Case("predict", users[:args.predict_users], predict))
+    return cases
+
+
+def compare(results, baseline, tolerance, memory_tolerance):
+    '''
+    Returns (regression messages, cases the baseline has no entry for);
+    lower is better except for throughput.
+    '''
+    regressions = []
+    unchecked = []
+    for name, metrics in results.items():
+        expected = baseline.get("results", {}).get(name)
+        if expected is None:
+            unchecked.append(name)
+            continue
+        for metric, value in metrics.items():
+            base = expected.get(metric)
+            if not base:
+                continue
+            slack = memory_tolerance if metric == "peak_kb" else tolerance
+            if metric == "throughput":
+                worse = value < base / (1 + slack)
+            else:
+                worse = value > base * (1 + slack)
+            if worse:
+                regressions.append(f"{name}: {metric} {value:.3f} vs baseline {base:.3f} (tolerance {slack:.0%})")
+    return regressions, unchecked
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", nargs="*", help="run only cases whose name starts with one of these")
+    parser.add_argument("--users", type=int, default=200, help="synthetic users per case")
+    parser.add_argument("--posts", type=int, default=5)
+    parser.add_argument("--post-words", type=int, default=30)
+    parser.add_argument("--personas", type=int, nargs="+", default=[100, 1000], help="synthetic persona counts")
+    parser.add_argument("--predict-users", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5, help="timed passes per case; the best is reported")
+    parser.add_argument("--baseline", help=f"baseline file (default {DEFAULT_BASELINE}); every case run must be in it")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--allow-no-baseline", action="store_true",
+                        help="report without comparing when there is no baseline, instead of failing")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--memory-tolerance", type=float, default=DEFAULT_MEMORY_TOLERANCE)
+    parser.add_argument("--output", help="also write this run's results here as JSON")
+    args = parser.parse_args()
+    # A baseline named explicitly must cover every case; the default one may predate new cases
+    explicit_baseline = args.baseline is not None
+    args.baseline = args.baseline or DEFAULT_BASELINE
+
+    # Fail before running anything: a gate with nothing to compare against would always pass
+    missing_baseline = not args.save_baseline and not os.path.exists(args.baseline)
+    if missing_baseline and not args.allow_no_baseline:
+        print(f"No baseline at {args.baseline}; record one with --save-baseline "
+              f"(or pass --allow-no-baseline to only report)")
+        return 1
+
+    from src.fake_openai import FakeOpenAIServer
+    from src.openai_client import OpenAIClientManager, set_client_manager
+
+    results = {}
+    with FakeOpenAIServer() as server, tempfile.TemporaryDirectory() as tmp:
+        set_client_manager(OpenAIClientManager(base_url=server.base_url))
+        print(f"{'case':<20} {'p50 ms':>9} {'p95 ms':>9} {'items/s':>10} {'peak KB':>10}")
+        for case in build_cases(args, tmp):
+            if args.cases and not any(case.name.startswith(prefix) for prefix in args.cases):
+                continue
+            metrics = measure(case, args.repeat)
+            results[case.name] = metrics
+            print(f"{case.name:<20} {metrics['p50_ms']:>9.3f} {metrics['p95_ms']:>9.3f} "
+                  f"{metrics['throughput']:>10.1f} {metrics['peak_kb']:>10.1f}")
+
+    run = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "settings": {k: v for k, v in vars(args).items() if k in ("users", "posts", "post_words", "personas", "repeat")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if missing_baseline:
+        print(f"No baseline at {args.baseline}; not compared (--allow-no-baseline)")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("settings") != run["settings"]:
+        print(f"Baseline was recorded with different settings {baseline.get('settings')}; not comparing")
+        return 1
+    regressions, unchecked = compare(results, baseline, args.tolerance, args.memory_tolerance)
+    for name in unchecked:
+        print(f"No baseline for case {name}; not compared")
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    print(f"{len(regressions)} regression(s) against {args.baseline}")
+    if unchecked and explicit_baseline:
+        print(f"{len(unchecked)} case(s) missing from {args.baseline}; record it again with --save-baseline")
+        return 1
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
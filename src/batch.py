@@ -0,0 +1,247 @@
+'''
+Headless batch prediction for large exports of creator profiles.
+
+Usage (from the repository root):
+    python -m src.batch predict in.jsonl out.jsonl [--batch-size 64] [--n-process 2]
+    python -m src.batch classify in.jsonl out.jsonl [--max-users 20] [--token-budget 6000] [--concurrency 4]
+    python -m src.batch batch-api-write in.jsonl requests.jsonl
+    python -m src.batch batch-api-read in.jsonl batch_output.jsonl out.jsonl
+
+Each input line is a JSON object with a "bio" string and a "posts" list (a
+plain string is accepted too); an optional "id" is copied to the output.
+Keywords are extracted per segment (the bio and each post) as in the app
+and the server, so a record gets the same scores everywhere. Records are
+read SCORE_CHUNK at a time, their segments parsed together with `nlp.pipe`
+(or the lite extractor when PERSONA_EXTRACTION_MODE=lite), scored with
+the vectorized `score_personas_batch` and written out as JSON lines, so
+memory stays flat regardless of the input size. Throughput is reported on
+stderr.
+
+The other commands add GPT classification (see src/bulk_classify.py) for
+the records, with the rule-based top 3 with a positive score as candidate
+personas, as in the app. `classify` packs several users into each
+chat-completions call. `batch-api-write` writes an OpenAI Batch API
+request file instead; upload it (Files API, purpose "batch"), create a
+batch on /v1/chat/completions and pass its output file to
+`batch-api-read`.
+'''
+import argparse
+import json
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.bulk_classify import (
+    DEFAULT_MAX_USERS, DEFAULT_TOKEN_BUDGET, classify_bulk, match_candidate, read_batch_results, write_batch_requests
+)
+from src.persona_predictor import extract_users_keywords_stream, load_personas, score_personas_batch, user_segments
+
+DEFAULT_PERSONAS_PATH = "data/personas/personas.yaml"
+PROGRESS_EVERY = 1000
+# Records scored together in one score_personas_batch call
+SCORE_CHUNK = 1024
+
+# Read JSONL records lazily, yielding (segments, context) pairs for keyword extraction
+def read_records(path: str) -> Iterator[Tuple[List[str], Dict]]:
+    for record in read_users(path):
+        yield user_segments(record["bio"], record["posts"]), {"id": record["id"]}
+
+# Read JSONL records lazily as {"id", "bio", "posts"} dicts, skipping unreadable lines and malformed records
+def read_users(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                bio = record.get("bio", "") or ""
+                posts = record.get("posts", []) or []
+            except (json.JSONDecodeError, AttributeError) as e:
+                print(f"Skipping line {line_no}: {e}", file=sys.stderr)
+                continue
+            if isinstance(posts, str):
+                posts = [posts]
+            if not isinstance(bio, str):
+                print(f"Skipping line {line_no}: bio is not a string", file=sys.stderr)
+                continue
+            if not isinstance(posts, list) or not all(isinstance(post, str) for post in posts):
+                print(f"Skipping line {line_no}: posts is not a list of strings", file=sys.stderr)
+                continue
+            yield {"id": record.get("id", line_no), "bio": bio, "posts": posts}
+
+# Turn score_personas output into a JSON-serializable list
+def serialize_scores(scores: List[Tuple[Dict, float, List[str], float]]) -> List[Dict]:
+    return [
+        {
+            "persona_name": persona["persona_name"],
+            "display_name": persona["display_name"],
+            "score": score,
+            "matched_keywords": matched_keywords,
+            "confidence": round(confidence, 2),
+        }
+        for persona, score, matched_keywords, confidence in scores
+    ]
+
+def predict(in_path: str, out_path: str, personas_path: str = DEFAULT_PERSONAS_PATH,
+            top_n: int = 3, batch_size: int = 64, n_process: int = 1) -> int:
+    '''
+    Scores every record of in_path and writes one result line per record to out_path.
+    Returns the number of records written.
+    '''
+    personas = load_personas(personas_path)
+    keyword_lists = extract_users_keywords_stream(read_records(in_path), personas.index.phrases, as_tuples=True,
+                                                  chunk_size=SCORE_CHUNK, batch_size=batch_size, n_process=n_process)
+
+    count = 0
+    start = time.perf_counter()
+    with open(out_path, "w", encoding="utf-8") as out:
+        def flush(ids, token_lists):
+            nonlocal count
+            for record_id, scores in zip(ids, score_personas_batch(personas, token_lists, top_n=top_n)):
+                result = {"id": record_id, "top_personas": serialize_scores(scores),
+                          "personas_version": personas.version}
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                count += 1
+                if count % PROGRESS_EVERY == 0:
+                    elapsed = time.perf_counter() - start
+                    print(f"{count} records, {count / elapsed:.1f} records/sec", file=sys.stderr)
+
+        ids, token_lists = [], []
+        for tokens, context in keyword_lists:
+            ids.append(context["id"])
+            token_lists.append(tokens)
+            if len(ids) == SCORE_CHUNK:
+                flush(ids, token_lists)
+                ids, token_lists = [], []
+        flush(ids, token_lists)
+
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"Done: {count} records in {elapsed:.2f}s ({rate:.1f} records/sec)", file=sys.stderr)
+    return count
+
+# Records with their GPT candidates: the rule-based top 3 with a positive score and matched keywords, as in the app
+def read_users_with_candidates(in_path: str, personas_path: str = DEFAULT_PERSONAS_PATH) -> List[Dict]:
+    personas = load_personas(personas_path)
+    users = list(read_users(in_path))
+    keyword_lists = list(extract_users_keywords_stream((user_segments(u["bio"], u["posts"]) for u in users),
+                                                       personas.index.phrases, chunk_size=SCORE_CHUNK))
+    return [
+        {
+            "id": user["id"],
+            "bio": user["bio"],
+            "posts": " ".join(user["posts"]),
+            "candidates": [persona for persona, score, matched, _ in top if score > 0 and matched],
+        }
+        for user, top in zip(users, score_personas_batch(personas, keyword_lists, top_n=3))
+    ]
+
+def write_classifications(users: List[Dict], answers: List[Tuple[str, str]], out_path: str,
+                          errors: Optional[List[Optional[str]]] = None) -> int:
+    with open(out_path, "w", encoding="utf-8") as out:
+        for i, (user, (persona, reasoning)) in enumerate(zip(users, answers)):
+            result = {
+                "id": user["id"],
+                "candidates": [p["persona_name"] for p in user["candidates"]],
+                "gpt_persona": persona,
+                "gpt_reasoning": reasoning,
+            }
+            if errors and errors[i]:
+                result["error"] = errors[i]
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+    return len(users)
+
+def classify(in_path: str, out_path: str, personas_path: str = DEFAULT_PERSONAS_PATH, **options) -> int:
+    '''
+    GPT classification of every record, several users per call (see classify_bulk for the options).
+    '''
+    from src.server import read_openai_api_key
+    openai_api_key = read_openai_api_key()
+    if not openai_api_key:
+        raise SystemExit("No OpenAI API key: set OPENAI_API_KEY or add it to .streamlit/secrets.toml")
+    users = read_users_with_candidates(in_path, personas_path)
+    start = time.perf_counter()
+    answers = classify_bulk(users, openai_api_key, **options)
+    elapsed = time.perf_counter() - start
+    answered = sum(1 for persona, _ in answers if persona)
+    print(f"Done: {answered}/{len(users)} records classified in {elapsed:.2f}s", file=sys.stderr)
+    return write_classifications(users, answers, out_path)
+
+def batch_api_write(in_path: str, requests_path: str, personas_path: str = DEFAULT_PERSONAS_PATH) -> int:
+    count = write_batch_requests(read_users_with_candidates(in_path, personas_path), requests_path)
+    print(f"Wrote {count} Batch API requests to {requests_path}", file=sys.stderr)
+    return count
+
+def batch_api_read(in_path: str, results_path: str, out_path: str, personas_path: str = DEFAULT_PERSONAS_PATH) -> int:
+    '''
+    Maps a Batch API output file back to the input records by custom_id.
+    '''
+    users = read_users_with_candidates(in_path, personas_path)
+    results, failures = read_batch_results(results_path)
+    answers = []
+    errors = []
+    for user in users:
+        custom_id = str(user["id"])
+        persona, reasoning = results.get(custom_id, ("", ""))
+        error = failures.get(custom_id)
+        if custom_id in results:
+            matched = match_candidate(persona, user["candidates"])
+            if not matched:
+                reasoning, error = "", f"persona {persona!r} is not one of the candidates"
+            persona = matched
+        elif user["candidates"] and error is None:
+            error = "no result in the batch output"
+        answers.append((persona, reasoning))
+        errors.append(error)
+    missing = sum(1 for error in errors if error)
+    print(f"Done: {len(users) - missing}/{len(users)} records without errors", file=sys.stderr)
+    return write_classifications(users, answers, out_path, errors)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.batch", description="Offline persona prediction")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    predict_parser = subparsers.add_parser("predict", help="score a JSONL file of bio/posts records")
+    predict_parser.add_argument("input", help="input JSONL with bio/posts records")
+    predict_parser.add_argument("output", help="output JSONL, one result per input record")
+    predict_parser.add_argument("--personas", default=DEFAULT_PERSONAS_PATH, help="persona definitions YAML")
+    predict_parser.add_argument("--top-n", type=int, default=3)
+    predict_parser.add_argument("--batch-size", type=int, default=64, help="texts per nlp.pipe batch")
+    predict_parser.add_argument("--n-process", type=int, default=1, help="spaCy worker processes")
+
+    classify_parser = subparsers.add_parser("classify", help="GPT classification, several users per call")
+    classify_parser.add_argument("input", help="input JSONL with bio/posts records")
+    classify_parser.add_argument("output", help="output JSONL, one result per input record")
+    classify_parser.add_argument("--personas", default=DEFAULT_PERSONAS_PATH, help="persona definitions YAML")
+    classify_parser.add_argument("--max-users", type=int, default=DEFAULT_MAX_USERS, help="users per GPT call")
+    classify_parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET,
+                                 help="estimated prompt tokens per GPT call")
+    classify_parser.add_argument("--concurrency", type=int, default=4, help="GPT calls in flight")
+    classify_parser.add_argument("--retries", type=int, default=1, help="rounds for users without a usable answer")
+
+    write_parser = subparsers.add_parser("batch-api-write", help="write an OpenAI Batch API request file")
+    write_parser.add_argument("input", help="input JSONL with bio/posts records")
+    write_parser.add_argument("requests", help="Batch API request JSONL to write")
+    write_parser.add_argument("--personas", default=DEFAULT_PERSONAS_PATH, help="persona definitions YAML")
+
+    read_parser = subparsers.add_parser("batch-api-read", help="map a Batch API output file back to the records")
+    read_parser.add_argument("input", help="the input JSONL the requests were written from")
+    read_parser.add_argument("results", help="Batch API output JSONL")
+    read_parser.add_argument("output", help="output JSONL, one result per input record")
+    read_parser.add_argument("--personas", default=DEFAULT_PERSONAS_PATH, help="persona definitions YAML")
+
+    args = parser.parse_args(argv)
+    if args.command == "predict":
+        predict(args.input, args.output, personas_path=args.personas, top_n=args.top_n,
+                batch_size=args.batch_size, n_process=args.n_process)
+    elif args.command == "classify":
+        classify(args.input, args.output, personas_path=args.personas, max_users=args.max_users,
+                 token_budget=args.token_budget, concurrency=args.concurrency, retries=args.retries)
+    elif args.command == "batch-api-write":
+        batch_api_write(args.input, args.requests, personas_path=args.personas)
+    elif args.command == "batch-api-read":
+        batch_api_read(args.input, args.results, args.output, personas_path=args.personas)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+import json
+from string import Formatter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from src.custom_logger import get_logger
+from src.metrics import get_metrics, record_llm_usage, timed
+from src.openai_client import get_client_manager
+from src.prompt_budget import estimate_tokens
+from src.persona_predictor import (
+    GPT_MODEL_PARAMS, build_gpt_prompt, load_gpt_prompt_template, parse_gpt_response
+)
+from src.response_cache import ResponseCache, get_response_cache, make_cache_key
+
+logger = get_logger()
+
+BULK_PROMPT_PATH = "data/gpt_bulk_prompt.txt"
+# Users per packed call, and the prompt size a packed call may grow to
+DEFAULT_MAX_USERS = 20
+DEFAULT_TOKEN_BUDGET = 6000
+# Completion tokens reserved per user of a packed call
+COMPLETION_TOKENS_PER_USER = 200
+# Same model and temperature as classify_with_gpt, but answers must be a JSON object
+BULK_MODEL_PARAMS = {
+    "model": GPT_MODEL_PARAMS["model"],
+    "temperature": GPT_MODEL_PARAMS["temperature"],
+    "response_format": {"type": "json_object"},
+}
+
+def load_bulk_prompt_template(path: str = BULK_PROMPT_PATH, single_template: Optional[str] = None) -> str:
+    '''
+    The packed prompt template with the "Your tasks:" section of
+    data/gpt_prompt.txt filled in, so both prompts give the same instructions.
+    '''
+    if single_template is None:
+        single_template = load_gpt_prompt_template()
+    start = single_template.find("Your tasks:")
+    end = single_template.find("Respond only", start)
+    if start < 0 or end < 0:
+        raise ValueError("The GPT prompt template has no 'Your tasks:' section followed by 'Respond only'")
+    # The section is str.format text: render its literals the way the single prompt does ({{ -> {), then
+    # escape them again for the packed template's own str.format. Placeholders can't be filled per pack.
+    literals = []
+    for literal, field, _, _ in Formatter().parse(single_template[start:end].strip()):
+        if field is not None:
+            raise ValueError(f"The 'Your tasks:' section uses {{{field}}}, which the packed prompt cannot fill")
+        literals.append(literal)
+    tasks = "".join(literals).replace("{", "{{").replace("}", "}}")
+    with open(path, "r") as f:
+        return f.read().replace("{tasks}", tasks)
+
+def _user_entry(local_id: str, user: Dict) -> Dict:
+    return {
+        "id": local_id,
+        "bio": user["bio"],
+        "posts": user["posts"],
+        "candidates": [p["persona_name"] for p in user["candidates"]],
+    }
+
+def build_bulk_prompt(template: str, users: List[Dict]) -> Tuple[str, Dict[str, int]]:
+    '''
+    Fills the packed prompt with users, each with a dict of bio, posts (one
+    string) and candidate persona dicts. Users get short ids by position;
+    returns the prompt and the id -> position map for reading the answer.
+    '''
+    descriptions = {}
+    entries = []
+    ids = {}
+    for position, user in enumerate(users):
+        local_id = str(position + 1)
+        ids[local_id] = position
+        entries.append(_user_entry(local_id, user))
+        for persona in user["candidates"]:
+            descriptions.setdefault(persona["persona_name"], persona["description"])
+    prompt = template.format(
+        persona_descriptions="\n".join(f"{name}: {description}" for name, description in descriptions.items()),
+        users_json=json.dumps(entries, ensure_ascii=False, indent=1),
+    )
+    return prompt, ids
+
+# Estimated prompt tokens a user adds to a pack whose candidate descriptions are already in `described`
+def _pack_cost(user: Dict, described: set) -> int:
+    entry = estimate_tokens(json.dumps(_user_entry("00", user), ensure_ascii=False))
+    return entry + sum(estimate_tokens(f"{p['persona_name']}: {p['description']}")
+                       for p in user["candidates"] if p["persona_name"] not in described)
+
+def pack_users(template: str, users: List[Dict], max_users: int = DEFAULT_MAX_USERS,
+               token_budget: int = DEFAULT_TOKEN_BUDGET) -> List[List[int]]:
+    '''
+    Splits users (by position) into packs of at most max_users whose
+    estimated prompt stays within token_budget. A user too large for the
+    budget on their own gets a pack of one.
+    '''
+    base = estimate_tokens(template)
+    packs = []
+    pack, size, described = [], base, set()
+    for position, user in enumerate(users):
+        if pack and (len(pack) >= max_users or size + _pack_cost(user, described) > token_budget):
+            packs.append(pack)
+            pack, size, described = [], base, set()
+        size += _pack_cost(user, described)
+        pack.append(position)
+        described.update(p["persona_name"] for p in user["candidates"])
+    if pack:
+        packs.append(pack)
+    return packs
+
+def parse_bulk_response(content: str) -> Dict[str, Tuple[str, str]]:
+    '''
+    id -> (persona, reasoning) from a packed answer. Tolerates code fences
+    and text around the JSON, and a bare list instead of {"results": [...]};
+    anything unreadable yields no results.
+    '''
+    starts = [i for i in (content.find("{"), content.find("[")) if i >= 0]
+    end = max(content.rfind("}"), content.rfind("]"))
+    if not starts or end < min(starts):
+        return {}
+    start = min(starts)
+    try:
+        data = json.loads(content[start:end + 1])
+    except ValueError:
+        return {}
+    results = data.get("results", []) if isinstance(data, dict) else data
+    answers = {}
+    for item in results if isinstance(results, list) else []:
+        if isinstance(item, dict) and item.get("id") is not None:
+            answers[str(item["id"]).strip()] = (str(item.get("persona") or "").strip(),
+                                                str(item.get("reasoning") or "").strip())
+    return answers
+
+def match_candidate(persona: str, candidates: List[Dict]) -> str:
+    '''
+    The candidate's persona_name if the answer names one of them (ignoring
+    case and surrounding whitespace), otherwise "".
+    '''
+    wanted = persona.strip().lower()
+    return next((p["persona_name"] for p in candidates if p["persona_name"].lower() == wanted), "")
+
+def _classify_pack(template: str, users: List[Dict], openai_api_key: str) -> Dict[int, Tuple[str, str]]:
+    prompt, ids = build_bulk_prompt(template, users)
+    metrics = get_metrics()
+    try:
+        response = get_client_manager().chat_completion(
+            openai_api_key,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=COMPLETION_TOKENS_PER_USER * len(users),
+            **BULK_MODEL_PARAMS
+        )
+    except Exception as e:
+        # The client manager has already retried; the users of this pack are retried in the next round
+        logger.warning("Packed GPT call for %d users failed: %s", len(users), e)
+        metrics.inc("bulk_gpt_calls_total", result="error")
+        return {}
+    metrics.inc("bulk_gpt_calls_total", result="ok")
+    record_llm_usage(response, BULK_MODEL_PARAMS["model"])
+
+    answers = {}
+    for local_id, (persona, reasoning) in parse_bulk_response(response.choices[0].message.content).items():
+        position = ids.get(local_id)
+        if position is None:
+            continue
+        persona = match_candidate(persona, users[position]["candidates"])
+        if persona:
+            answers[position] = (persona, reasoning)
+    return answers
+
+@timed("classify_bulk")
+def classify_bulk(users: List[Dict], openai_api_key: str, cache: Optional[ResponseCache] = None,
+                  max_users: int = DEFAULT_MAX_USERS, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                  concurrency: int = 4, retries: int = 1) -> List[Tuple[str, str]]:
+    '''
+    (persona, reasoning) for every user, several users per GPT call.
+
+    Each user is a dict with "bio", "posts" (one string, as for
+    classify_with_gpt) and "candidates" (persona dicts); users without
+    candidates get ("", ""). Cached answers are reused per user. Users whose
+    answer is missing, names a persona outside their candidates or whose
+    call failed are sent again, in packs half the size, up to retries times;
+    after that they get ("", "").
+    '''
+    if cache is None:
+        cache = get_response_cache()
+    template = load_bulk_prompt_template()
+    metrics = get_metrics()
+    results = [("", "")] * len(users)
+    keys = {}
+    pending = []
+    for position, user in enumerate(users):
+        if not user["candidates"]:
+            continue
+        keys[position] = make_cache_key(user["bio"], user["posts"], [p["persona_name"] for p in user["candidates"]],
+                                        template, BULK_MODEL_PARAMS)
+        cached = cache.get(keys[position])
+        if cached is not None:
+            results[position] = cached
+            metrics.inc("bulk_gpt_users_total", result="cached")
+        else:
+            pending.append(position)
+
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+        pack_size = max(1, max_users >> attempt)
+        packs = [[pending[i] for i in pack]
+                 for pack in pack_users(template, [users[p] for p in pending], pack_size, token_budget)]
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="bulk-gpt") as pool:
+            answers = list(pool.map(lambda pack: _classify_pack(template, [users[p] for p in pack], openai_api_key),
+                                    packs))
+        missing = []
+        for pack, pack_answers in zip(packs, answers):
+            for i, position in enumerate(pack):
+                if i in pack_answers:
+                    results[position] = pack_answers[i]
+                    cache.set(keys[position], *pack_answers[i])
+                    metrics.inc("bulk_gpt_users_total", result="answered")
+                else:
+                    missing.append(position)
+        if missing:
+            logger.info("%d users without a usable answer after round %d", len(missing), attempt + 1)
+        pending = missing
+    metrics.inc("bulk_gpt_users_total", len(pending), result="unanswered")
+    return results
+
+def batch_requests(users: Iterable[Dict], prompt_template: Optional[str] = None) -> Iterator[Dict]:
+    '''
+    OpenAI Batch API request lines, one chat completion per user with
+    candidates, using the single-user prompt of classify_with_gpt. Users are
+    dicts with "id", "bio", "posts" and "candidates"; the id becomes the
+    custom_id the results are matched on.
+    '''
+    if prompt_template is None:
+        prompt_template = load_gpt_prompt_template()
+    seen = set()
+    for user in users:
+        if not user["candidates"]:
+            continue
+        custom_id = str(user["id"])
+        if custom_id in seen:
+            raise ValueError(f"Duplicate id {custom_id!r}: Batch API custom_ids must be unique")
+        seen.add(custom_id)
+        prompt = build_gpt_prompt(prompt_template, user["bio"], user["posts"], user["candidates"])
+        yield {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"messages": [{"role": "user", "content": prompt}], **GPT_MODEL_PARAMS},
+        }
+
+def write_batch_requests(users: Iterable[Dict], path: str) -> int:
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for request in batch_requests(users):
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+def read_batch_results(path: str) -> Tuple[Dict[str, Tuple[str, str]], Dict[str, str]]:
+    '''
+    Reads a Batch API output (or error) file. Returns custom_id ->
+    (persona, reasoning) for successful requests and custom_id -> error
+    message for failed ones. Lines come in any order.
+    '''
+    answers = {}
+    errors = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                custom_id = str(record["custom_id"])
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning("Skipping unreadable batch result line %d: %s", line_no, e)
+                continue
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                error = record.get("error") or (response.get("body") or {}).get("error") or {}
+                errors[custom_id] = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+                continue
+            try:
+                response_body = response["body"]
+                content = response_body["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError):
+                errors[custom_id] = "response without a message"
+                continue
+            answers[custom_id] = parse_gpt_response(content)
+            usage = response_body.get("usage") or {}
+            registry = get_metrics()
+            model = response_body.get("model", GPT_MODEL_PARAMS["model"])
+            registry.inc("llm_tokens_total", usage.get("prompt_tokens", 0), kind="prompt", model=model)
+            registry.inc("llm_tokens_total", usage.get("completion_tokens", 0), kind="completion", model=model)
+    return answers, errors
@@ -1,17 +1,199 @@
+import atexit
+import contextvars
+import hashlib
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+import uuid
 
+# Configuration, overridable through the environment
+LOG_PATH = os.environ.get("PERSONA_LOG_PATH", "logs/digital_persona_queries.jsonl")
+LOG_LEVEL = os.environ.get("PERSONA_LOG_LEVEL", "INFO").upper()
+# Size-based rotation by default; set PERSONA_LOG_ROTATE_WHEN (e.g. "midnight", "H") for time-based
+LOG_MAX_BYTES = int(os.environ.get("PERSONA_LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_ROTATE_WHEN = os.environ.get("PERSONA_LOG_ROTATE_WHEN", "")
+LOG_BACKUP_COUNT = int(os.environ.get("PERSONA_LOG_BACKUP_COUNT", 5))
+# Fraction of requests logged with full bio/posts, GPT prompt and raw response
+LOG_FULL_SAMPLE_RATE = float(os.environ.get("PERSONA_LOG_FULL_SAMPLE_RATE", 0.01))
+# Characters of each free-text payload kept in the log; 0 keeps only the hash and length
+LOG_PREVIEW_CHARS = int(os.environ.get("PERSONA_LOG_PREVIEW_CHARS", 80))
 
-# define a function that will return a logger object
+LOGGER_NAME = "digital_persona"
+
+class JsonLineFormatter(logging.Formatter):
+    """One compact JSON object per record; structured events are merged in as fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        event = getattr(record, "event", None)
+        if event is not None:
+            entry.update(event)
+        else:
+            entry["msg"] = record.getMessage()
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str)
+
+_listener = None
+_setup_lock = threading.Lock()
+
+def _file_handler(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if LOG_ROTATE_WHEN:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    handler.setFormatter(JsonLineFormatter())
+    return handler
+
+def stop_logging():
+    """Flush queued records and stop the background writer"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
 
+# Set in worker processes, whose records go to the parent instead of the log file
+_to_parent = False
+
+def _set_level(logger):
+    # An unknown level name must not take the app down: log at INFO and say so
+    level = logging.getLevelName(LOG_LEVEL)
+    logger.setLevel(level if isinstance(level, int) else logging.INFO)
+    return isinstance(level, int)
+
+# define a function that will return a logger object
 def get_logger():
-    # Set up logging configuration
-    logging.basicConfig(
-        filename='logs/digital_persona_queries.log',
-        level=logging.DEBUG,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-
-    # Create a logger instance
-    logger = logging.getLogger(__name__)
+    """
+    Return the app logger. Records are put on an in-memory queue and written
+    to a rotating JSON-lines file by a background thread, so request threads
+    never wait on disk I/O. Safe to call repeatedly (e.g. on Streamlit reruns).
+    """
+    global _listener
+    logger = logging.getLogger(LOGGER_NAME)
+    with _setup_lock:
+        if _listener is None and not _to_parent:
+            log_queue = queue.SimpleQueue()
+            _listener = logging.handlers.QueueListener(log_queue, _file_handler(LOG_PATH), respect_handler_level=True)
+            _listener.start()
+            logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+            known_level = _set_level(logger)
+            logger.propagate = False
+            atexit.register(stop_logging)
+            if not known_level:
+                logger.warning("Unknown PERSONA_LOG_LEVEL %r, logging at INFO", LOG_LEVEL)
     return logger
+
+class _ParentHandler(logging.Handler):
+    """Hands records received from worker processes to the app logger"""
+
+    def emit(self, record):
+        logging.getLogger(LOGGER_NAME).handle(record)
+
+def forward_worker_logs(log_queue):
+    """
+    Start writing the records worker processes put on log_queue (a
+    multiprocessing queue, see log_to_parent) to this process's log.
+    Returns the listener; stop it once the workers are gone.
+    """
+    get_logger()
+    listener = logging.handlers.QueueListener(log_queue, _ParentHandler())
+    listener.start()
+    return listener
+
+def log_to_parent(log_queue):
+    """
+    In a worker process: send the app logger's records to the parent
+    through log_queue instead of writing the log file, so only one process
+    ever writes (and rotates) it. A file writer already started by imports
+    in the worker is stopped before it writes anything.
+    """
+    global _listener, _to_parent
+    logger = logging.getLogger(LOGGER_NAME)
+    with _setup_lock:
+        _to_parent = True
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+        logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+        _set_level(logger)
+        logger.propagate = False
+
+def summarize_text(text):
+    """Hash, length and a short preview of a free-text payload"""
+    summary = {
+        "sha": hashlib.sha256(text.encode("utf-8")).hexdigest()[:16],
+        "len": len(text),
+    }
+    if LOG_PREVIEW_CHARS:
+        summary["preview"] = text[:LOG_PREVIEW_CHARS]
+    return summary
+
+_current_request = contextvars.ContextVar("current_request", default=None)
+
+class RequestLog:
+    """
+    Collects everything about one prediction and emits it as a single JSON
+    line when the `with` block ends. Code running inside the block (including
+    threads started with contextvars.copy_context()) adds fields through
+    annotate_request().
+    """
+
+    def __init__(self, bio, posts, logger=None):
+        self.logger = logger or get_logger()
+        self.full = random.random() < LOG_FULL_SAMPLE_RATE
+        self.fields = {
+            "event": "prediction",
+            "request_id": uuid.uuid4().hex[:12],
+            "sampled": self.full,
+            "bio": bio if self.full else summarize_text(bio),
+            "posts": posts if self.full else [summarize_text(post) for post in posts],
+        }
+        self._start = None
+        self._token = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self._token = _current_request.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_request.reset(self._token)
+        self.fields["duration_ms"] = round((time.perf_counter() - self._start) * 1000, 1)
+        # A copy goes on the queue: a background GPT call may still annotate this request
+        # while the writer thread serializes the record
+        if exc is not None:
+            self.fields["error"] = f"{exc_type.__name__}: {exc}"
+            self.logger.error("prediction failed", extra={"event": dict(self.fields)})
+        else:
+            self.logger.info("prediction", extra={"event": dict(self.fields)})
+        return False
+
+def current_request():
+    return _current_request.get()
+
+def annotate_request(**fields):
+    """Add fields to the request being logged, if any"""
+    request = _current_request.get()
+    if request is not None:
+        request.fields.update(fields)
+
+def annotate_request_text(name, text):
+    """Add a free-text field: in full on sampled requests, summarized otherwise"""
+    request = _current_request.get()
+    if request is not None:
+        request.fields[name] = text if request.full else summarize_text(text)
@@ -0,0 +1,269 @@
+'''
+Local stand-in for the OpenAI chat-completions endpoint, for offline checks
+and benchmarks of the GPT code paths.
+
+Point the OpenAI client at it with OPENAI_BASE_URL (or base_url=...):
+    python -m src.fake_openai --port 8765 --delay 0.3
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 streamlit run app.py
+
+Or from Python:
+    with FakeOpenAIServer(reply="Persona: tech_enthusiast\\nReasoning: ...") as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+
+With --bulk (reply=bulk_reply) it answers the packed JSON prompts of
+src/bulk_classify.py instead, picking each user's first candidate.
+
+Requests with "stream": true are answered with server-sent events, one
+word per chunk, like the real endpoint; --token-delay spaces the chunks
+out (and adds the same total to answers that aren't streamed).
+'''
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+DEFAULT_REPLY = (
+    "Persona: travel_adventurer\n"
+    "Reasoning: You clearly love exploring new places and sharing what you find along the way."
+)
+
+# Marks the users JSON at the end of a packed prompt (data/gpt_bulk_prompt.txt)
+BULK_USERS_MARKER = "Users (JSON):"
+
+def packed_users(request: Dict) -> List[Dict]:
+    '''
+    The users of a packed classification request, as sent: id, bio, posts, candidates.
+    '''
+    prompt = request["messages"][-1]["content"]
+    return json.loads(prompt.split(BULK_USERS_MARKER, 1)[1])
+
+def bulk_reply(request: Dict) -> str:
+    return json.dumps({"results": [
+        {"id": user["id"], "persona": user["candidates"][0],
+         "reasoning": "You keep coming back to the same topics in your posts."}
+        for user in packed_users(request) if user["candidates"]
+    ]})
+
+# Rough token count used for the fake usage numbers
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+# The pieces a streamed answer is sent in: words with the whitespace before them
+def split_tokens(content: str) -> List[str]:
+    return re.findall(r"\s*\S+|\s+", content)
+
+def completion_chunk(completion_id: str, model: str, delta: Dict, finish_reason: Optional[str] = None) -> Dict:
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+def completion_body(content: str, model: str, prompt: str) -> Dict:
+    prompt_tokens = count_tokens(prompt)
+    completion_tokens = count_tokens(content)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+class FakeOpenAIServer:
+    '''
+    Threaded HTTP server answering POST /v1/chat/completions.
+
+    reply is either a fixed string or a callable taking the request JSON and
+    returning the completion text. delay adds latency to every answer and
+    token_delay to every word of it: streamed answers send their first word
+    after delay and one word per token_delay after that. The first
+    `failures` requests are answered with failure_status instead. Every
+    request is counted in `calls` and kept in `requests`; `connections` holds
+    the client addresses seen (one per keep-alive connection) and
+    `max_in_flight` the highest number of requests handled at once.
+    '''
+
+    def __init__(self, reply: Union[str, Callable[[Dict], str]] = DEFAULT_REPLY, delay: float = 0.0,
+                 failures: int = 0, failure_status: int = 500, host: str = "127.0.0.1", port: int = 0,
+                 token_delay: float = 0.0):
+        self.reply = reply
+        self.delay = delay
+        self.token_delay = token_delay
+        self.failures = failures
+        self.failure_status = failure_status
+        self.calls = 0
+        self.requests = []
+        self.connections = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def respond(self, request: Dict):
+        '''
+        Returns (status, body) for a chat-completions request. The body of a
+        successful streamed request is an iterator of chunks, sent as they come.
+        '''
+        with self._lock:
+            self.calls += 1
+            call_number = self.calls
+            self.requests.append(request)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        streaming = False
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            if call_number <= self.failures:
+                return self.failure_status, {"error": {"message": "Simulated upstream failure", "type": "server_error"}}
+            content = self.reply(request) if callable(self.reply) else self.reply
+            prompt = " ".join(message.get("content", "") for message in request.get("messages", []))
+            body = completion_body(content, request.get("model", "gpt-3.5-turbo"), prompt)
+            if request.get("stream"):
+                streaming = True
+                include_usage = (request.get("stream_options") or {}).get("include_usage", False)
+                return 200, self._stream(body, include_usage)
+            if self.token_delay:
+                time.sleep(self.token_delay * len(split_tokens(content)))
+            return 200, body
+        finally:
+            if not streaming:
+                self._finish_request()
+
+    def _finish_request(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _stream(self, body: Dict, include_usage: bool) -> Iterator[Dict]:
+        try:
+            completion_id, model = body["id"], body["model"]
+            yield completion_chunk(completion_id, model, {"role": "assistant", "content": ""})
+            for i, token in enumerate(split_tokens(body["choices"][0]["message"]["content"])):
+                if i and self.token_delay:
+                    time.sleep(self.token_delay)
+                yield completion_chunk(completion_id, model, {"content": token})
+            yield completion_chunk(completion_id, model, {}, finish_reason="stop")
+            if include_usage:
+                yield {**completion_chunk(completion_id, model, {}), "choices": [], "usage": body["usage"]}
+        finally:
+            self._finish_request()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1 so clients can keep connections alive between requests
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; without TCP_NODELAY small
+            # responses wait on the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                with server._lock:
+                    server.connections.add(self.client_address)
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                status, body = server.respond(request)
+                if isinstance(body, dict):
+                    self._send(status, body)
+                else:
+                    self._send_events(body)
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            # Server-sent events in a chunked response, so the connection stays reusable
+            def _send_events(self, chunks):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for chunk in chunks:
+                        self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self._write_chunk(b"data: [DONE]\n\n")
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client closed the stream before the end
+                    self.close_connection = True
+                finally:
+                    chunks.close()
+
+            def _write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m src.fake_openai", description="Local fake OpenAI endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds of latency per answer")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds of latency per word of an answer")
+    parser.add_argument("--failures", type=int, default=0, help="answer this many first requests with an error")
+    parser.add_argument("--failure-status", type=int, default=500)
+    parser.add_argument("--reply", default=DEFAULT_REPLY, help="completion text returned for every request")
+    parser.add_argument("--bulk", action="store_true", help="answer packed prompts from `python -m src.batch classify`")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(reply=bulk_reply if args.bulk else args.reply, delay=args.delay, failures=args.failures,
+                              failure_status=args.failure_status, host=args.host, port=args.port,
+                              token_delay=args.token_delay)
+    print(f"Fake OpenAI endpoint listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,35 @@
 import base64
+import json
+import os
 from functools import lru_cache
 
+THUMBNAIL_MANIFEST = "data/thumbs/manifest.json"
+IMAGE_DIR = "data/ref_imgs"
+
 @lru_cache(maxsize=32)
 def get_image_base64(image_path):
     """Convert image to base64 for embedding in HTML with caching"""
     with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode() 
\ No newline at end of file
+        return base64.b64encode(image_file.read()).decode()
+
+@lru_cache(maxsize=1)
+def load_thumbnail_manifest(manifest_path=THUMBNAIL_MANIFEST):
+    """Read the manifest written by `python -m src.optimize_images`, or an empty one if it wasn't built"""
+    if not os.path.exists(manifest_path):
+        return {"names": {}, "images": {}}
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+# Unbounded on purpose: one entry per referenced asset, each a few KB once thumbnailed
+@lru_cache(maxsize=None)
+def get_image_data_uri(name):
+    """Data URI for a reference image, using its thumbnail when one has been built"""
+    manifest = load_thumbnail_manifest()
+    content_hash = manifest["names"].get(name)
+    thumbnail = manifest["images"].get(content_hash) if content_hash else None
+    if thumbnail and os.path.exists(thumbnail["file"]):
+        with open(thumbnail["file"], "rb") as image_file:
+            encoded = base64.b64encode(image_file.read()).decode()
+        return f"data:{thumbnail['mime']};base64,{encoded}"
+    # Fall back to the full-size original
+    return f"data:image/jpeg;base64,{get_image_base64(os.path.join(IMAGE_DIR, f'{name}.jpeg'))}"
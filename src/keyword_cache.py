@@ -0,0 +1,150 @@
+import hashlib
+import os
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from src.phrase_matcher import KeywordPhraseMatcher
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get("PERSONA_KEYWORD_CACHE_SIZE", 4096))
+
+# Segments are hashed as written: casing and spacing change how spaCy parses them
+def segment_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class SegmentKeywords:
+    '''
+    Keyword extraction result for one segment (the bio or a single post).
+
+    lemmas holds one (word, lemma) pair per unique word, as keywords_from_doc
+    would return it; surface and lemma_words are the word sequences phrase
+    keywords are matched against, kept so that a changed persona set doesn't
+    require parsing the segment again.
+    '''
+    __slots__ = ("lemmas", "surface", "lemma_words")
+
+    def __init__(self, lemmas: Tuple[Tuple[str, str], ...], surface: Tuple[str, ...], lemma_words: Tuple[str, ...]):
+        self.lemmas = lemmas
+        self.surface = surface
+        self.lemma_words = lemma_words
+
+    def phrases(self, matcher: KeywordPhraseMatcher) -> List[str]:
+        return matcher.find_in_words(self.surface, self.lemma_words)
+
+class KeywordCache:
+    '''
+    Bounded in-memory LRU of SegmentKeywords by segment content hash.
+    Safe to share across Streamlit sessions.
+    '''
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[SegmentKeywords]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key: str, entry: SegmentKeywords):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": size,
+        }
+
+class KeywordAggregate:
+    '''
+    Running keyword totals for one user's segments.
+
+    update() is given the current segments on every prediction and only
+    touches the ones that were added or removed since the last call, so
+    unchanged posts cost nothing. tokens() is the union of the segments'
+    keywords: what keywords_from_doc returns for each segment parsed as its
+    own document, merged.
+    '''
+
+    def __init__(self):
+        self._segments = Counter()
+        self._entries = {}
+        self._lemmas = Counter()
+        self._phrases = Counter()
+        self._matcher = None
+
+    def missing(self, keys: Iterable[str]) -> List[str]:
+        '''
+        Keys this aggregate holds no extraction result for.
+        '''
+        return [key for key in dict.fromkeys(keys) if key not in self._entries]
+
+    def update(self, keys: Sequence[str], entries: Dict[str, SegmentKeywords]) -> Tuple[int, int]:
+        '''
+        Makes the aggregate cover exactly the segments in keys. entries must
+        hold a result for every key returned by missing(keys). Returns the
+        number of segments added and removed.
+        '''
+        current = Counter(keys)
+        added = current - self._segments
+        removed = self._segments - current
+        for key, count in removed.items():
+            self._apply(self._entries[key], -count)
+            if key not in current:
+                del self._entries[key]
+        for key, count in added.items():
+            entry = self._entries.setdefault(key, entries.get(key))
+            self._apply(entry, count)
+        # Drop keywords whose count fell to zero
+        self._lemmas = +self._lemmas
+        self._phrases = +self._phrases
+        self._segments = current
+        return sum(added.values()), sum(removed.values())
+
+    def _apply(self, entry: SegmentKeywords, count: int):
+        self._lemmas.update({pair: count for pair in entry.lemmas})
+        if self._matcher is not None:
+            self._phrases.update({phrase: count for phrase in entry.phrases(self._matcher)})
+
+    def tokens(self, phrases: Optional[KeywordPhraseMatcher] = None) -> List[str]:
+        if phrases is not self._matcher:
+            # A different persona set: phrase hits are recomputed from the stored word sequences
+            self._matcher = phrases
+            self._phrases = Counter()
+            if phrases is not None:
+                for key, count in self._segments.items():
+                    self._phrases.update({phrase: count for phrase in self._entries[key].phrases(phrases)})
+        return [lemma for _, lemma in self._lemmas] + list(self._phrases)
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+# Process-wide cache shared by every session
+def get_keyword_cache() -> KeywordCache:
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = KeywordCache()
+        return _default_cache
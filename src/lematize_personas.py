@@ -1,40 +1,179 @@
-# this script was only used once to lemmatize the personas.yaml file
+'''
+Build step that normalizes persona keywords the same way the runtime does.
+
+Usage (from the repository root):
+    python -m src.lematize_personas [--check] [--personas data/personas/personas.yaml]
+
+Every keyword and negative keyword is lemmatized with the runtime model and
+lemmatizer (`persona_predictor.lemmatize_words`, one batched nlp.pipe pass) and
+lower-cased, because scoring compares extracted lemmas with `kw.lower()`.
+Multi-word and hyphenated keywords keep their separators and get each word
+lemmatized, matching what the phrase matcher sees. Duplicates are dropped.
+
+Only personas whose keyword lists changed since the last run are processed;
+their hashes are kept in .cache/lemmatize_state.json. The build fails (exit
+status 1, nothing written) if any keyword can never match at runtime. With
+--check nothing is written and the exit status is 1 if the file isn't
+already normalized.
+'''
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from typing import Dict, List, Tuple
+
 import yaml
-import spacy
-
-# Load spaCy English model
-nlp = spacy.load("en_core_web_trf")
-
-# Load the YAML file
-with open("personas.yaml", "r") as f:
-    data = yaml.safe_load(f)
-
-# Function to lemmatize list of words
-def lemmatize_list(words):
-    lemmatized = []
-    for word in words:
-        doc = nlp(word)
-        lemmas = [token.lemma_ for token in doc]
-        lemmatized.append(" ".join(lemmas))
-    return list(set(lemmatized)) # set list to remove duplicates
-
-for persona in data:
-    print(f"persona : {persona['persona_name']}")
-    
-    if "keywords" in persona:
-        print(f"keywords : {persona['keywords']}")
-        persona["keywords"] = lemmatize_list(persona["keywords"])
-        print(f"keywords : {persona['keywords']}")
-
-    if "negative_keywords" in persona:
-        print(f"negative_keywords : {persona['negative_keywords']}")
-        persona["negative_keywords"] = lemmatize_list(persona["negative_keywords"])
-        print(f"negative_keywords : {persona['negative_keywords']}")
-
-    print("-"*100)
-
-# Save the updated YAML
-with open("personas_lemmatized.yaml", "w") as f:
-    yaml.dump(data, f, allow_unicode=True)
-
-print("Lemmatization complete. Output saved to personas_lemmatized.yaml")
+
+from src.persona_predictor import SPACY_MODEL, get_nlp, lemmatize_words
+from src.phrase_matcher import is_phrase
+
+DEFAULT_PERSONAS_PATH = "data/personas/personas.yaml"
+DEFAULT_STATE_PATH = ".cache/lemmatize_state.json"
+KEYWORD_FIELDS = ("keywords", "negative_keywords")
+# Splits a phrase keyword into words and the separators between them
+PHRASE_PARTS = re.compile(r"([\s\-]+)")
+
+def keyword_lists_hash(persona: Dict) -> str:
+    '''
+    Hash of a persona's keyword lists and the model that normalizes them.
+    '''
+    payload = json.dumps({
+        "model": SPACY_MODEL,
+        **{field: persona.get(field, []) or [] for field in KEYWORD_FIELDS},
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def keyword_words(keyword: str) -> List[str]:
+    return [part for part in PHRASE_PARTS.split(keyword.lower()) if part and not PHRASE_PARTS.fullmatch(part)]
+
+def normalize_keyword(keyword: str, lemmas: Dict[str, str]) -> str:
+    parts = PHRASE_PARTS.split(keyword.strip().lower())
+    return "".join(part if PHRASE_PARTS.fullmatch(part) else lemmas.get(part, part).lower() for part in parts)
+
+def unmatchable_reason(keyword: str, relemmas: Dict[str, str]) -> str:
+    '''
+    Why a normalized keyword can never match at runtime, or "" if it can.
+    relemmas maps each normalized single-word keyword to its own lemma.
+    '''
+    if not any(ch.isalnum() for ch in keyword):
+        return "has no letters or digits"
+    if is_phrase(keyword):
+        return ""
+    doc = get_nlp().make_doc(keyword)
+    if len(doc) != 1:
+        return f"is split into tokens {[t.text for t in doc]}, so it is never a single extracted lemma"
+    lemma = relemmas.get(keyword, keyword).lower()
+    if lemma != keyword:
+        return f"lemmatizes to '{lemma}', which is what the runtime extracts instead"
+    return ""
+
+def normalize_personas(personas: List[Dict], state: Dict) -> Tuple[Dict[str, Dict], List[str], int]:
+    '''
+    Returns (new state, errors, number of personas processed). Personas whose
+    keyword lists match a previous input or output hash reuse the stored result.
+    '''
+    new_state = {}
+    pending = []
+    for persona in personas:
+        name = persona["persona_name"]
+        current_hash = keyword_lists_hash(persona)
+        previous = state.get(name)
+        if previous and current_hash in (previous["input_hash"], previous["output_hash"]):
+            new_state[name] = previous
+        else:
+            pending.append(persona)
+
+    # One batched pass over every word of every changed persona
+    words = [
+        word
+        for persona in pending
+        for field in KEYWORD_FIELDS
+        for keyword in persona.get(field, []) or []
+        for word in keyword_words(keyword)
+    ]
+    lemmas = lemmatize_words(words) if words else {}
+    normalized = {
+        keyword: normalize_keyword(keyword, lemmas)
+        for persona in pending
+        for field in KEYWORD_FIELDS
+        for keyword in persona.get(field, []) or []
+    }
+    # A single-word keyword only matches if it is its own lemma; check them in a second batched pass
+    singles = [result for result in normalized.values() if not is_phrase(result)]
+    relemmas = lemmatize_words(singles) if singles else {}
+
+    errors = []
+    for persona in pending:
+        output = {}
+        for field in KEYWORD_FIELDS:
+            results = []
+            for keyword in persona.get(field, []) or []:
+                result = normalized[keyword]
+                reason = unmatchable_reason(result, relemmas)
+                if reason:
+                    errors.append(f"{persona['persona_name']}.{field}: '{keyword}' -> '{result}' {reason}")
+                results.append(result)
+            output[field] = list(dict.fromkeys(results))
+        new_state[persona["persona_name"]] = {
+            "input_hash": keyword_lists_hash(persona),
+            "output_hash": keyword_lists_hash(output),
+            **output,
+        }
+    return new_state, errors, len(pending)
+
+def load_state(path: str) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.lematize_personas", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--personas", default=DEFAULT_PERSONAS_PATH, help="persona YAML to normalize in place")
+    parser.add_argument("--output", help="write here instead of overwriting --personas")
+    parser.add_argument("--state", default=DEFAULT_STATE_PATH, help="incremental build state")
+    parser.add_argument("--check", action="store_true", help="only report; fail if the file is not normalized")
+    args = parser.parse_args(argv)
+
+    with open(args.personas, "r") as f:
+        personas = yaml.safe_load(f) or []
+
+    state, errors, processed = normalize_personas(personas, load_state(args.state))
+    print(f"Lemmatized {processed} of {len(personas)} personas ({len(personas) - processed} unchanged)")
+    if errors:
+        print(f"{len(errors)} keyword(s) can never match at runtime:", file=sys.stderr)
+        for error in errors:
+            print(f"  {error}", file=sys.stderr)
+        return 1
+
+    changed = []
+    for persona in personas:
+        result = state[persona["persona_name"]]
+        for field in KEYWORD_FIELDS:
+            if field in persona and persona[field] != result[field]:
+                changed.append(f"{persona['persona_name']}.{field}")
+                persona[field] = result[field]
+
+    if args.check:
+        for field in changed:
+            print(f"Not normalized: {field}")
+        return 1 if changed else 0
+
+    output_path = args.output or args.personas
+    if changed or output_path != args.personas:
+        with open(output_path, "w") as f:
+            yaml.dump(personas, f, sort_keys=False)
+        print(f"Updated {', '.join(changed) or 'nothing'}; saved to {output_path}")
+    else:
+        print("All keywords already normalized")
+
+    os.makedirs(os.path.dirname(args.state) or ".", exist_ok=True)
+    with open(args.state, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+import re
+from typing import Dict, Iterable, List, Optional
+from src.keyword_cache import SegmentKeywords
+from src.phrase_matcher import KeywordPhraseMatcher, phrase_words
+
+DEFAULT_COMMON_LEMMAS_PATH = "data/common_lemmas.txt"
+
+# Words only: apostrophes are dropped ("don't" -> "dont"), every other non-alphanumeric character separates words
+APOSTROPHES = re.compile(r"['’]")
+NON_WORD = re.compile(r"[^a-z0-9]+")
+
+VOWELS = set("aeiou")
+
+def tokenize(text: str) -> List[str]:
+    return NON_WORD.split(APOSTROPHES.sub("", text.lower()))
+
+def load_common_lemmas(path: str = DEFAULT_COMMON_LEMMAS_PATH) -> Dict[str, str]:
+    '''
+    Reads the "form lemma" pairs of irregular words, skipping comments.
+    '''
+    lemmas = {}
+    with open(path, "r") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                form, lemma = line.split()
+                lemmas[form] = lemma
+    return lemmas
+
+def inflections(word: str) -> List[str]:
+    '''
+    Regular plural, third-person, -ing and -ed forms of a base word.
+    '''
+    if len(word) < 3 or not word.isalpha():
+        return []
+    forms = []
+    if word.endswith(("s", "x", "z", "ch", "sh")):
+        forms.append(word + "es")
+    elif word.endswith("y") and word[-2] not in VOWELS:
+        forms += [word[:-1] + "ies", word[:-1] + "ied"]
+    else:
+        forms.append(word + "s")
+    if word.endswith("e") and not word.endswith("ee"):
+        forms += [word[:-1] + "ing", word + "d"]
+    else:
+        forms += [word + "ing", word + "ed"]
+        # run -> running, shop -> shopped
+        if word[-1] not in VOWELS | set("wxy") and word[-2] in VOWELS and word[-3] not in VOWELS:
+            forms += [word + word[-1] + "ing", word + word[-1] + "ed"]
+    return forms
+
+def build_lemma_table(vocabulary: Iterable[str], spacy_lemmas: Optional[Dict[str, str]] = None,
+                      common: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    '''
+    Word -> lemma for every word of the persona vocabulary and its regular
+    inflections, plus the common irregular forms. Lemmas the persona bundle
+    computed with spaCy take precedence, so a keyword resolves to the same
+    lemma it would in full mode.
+    '''
+    spacy_lemmas = spacy_lemmas or {}
+    table = dict(common or {})
+    for keyword in vocabulary:
+        for word in phrase_words(keyword):
+            lemma = spacy_lemmas.get(word, word).lower()
+            table[word] = lemma
+            for form in inflections(lemma):
+                table.setdefault(form, lemma)
+    table.update((word, lemma.lower()) for word, lemma in spacy_lemmas.items())
+    return table
+
+class LiteExtractor:
+    '''
+    Keyword extraction without spaCy: a regex tokenizer and a lemma lookup
+    table. Returns one lemma per unique non-stop word, like keywords_from_doc,
+    but has no entities or noun chunks and leaves unknown words as written.
+    '''
+
+    def __init__(self, common: Dict[str, str], stopwords: Iterable[str] = ()):
+        # common holds the irregular forms; lemmas grows with each persona vocabulary added
+        self.common = common
+        self.lemmas = dict(common)
+        self.stopwords = frozenset(stopwords)
+
+    def segment_keywords(self, text: str) -> SegmentKeywords:
+        surface = tuple(word for word in tokenize(text) if word)
+        lemma_words = tuple(self.lemmas.get(word, word) for word in surface)
+        pairs = {word: lemma for word, lemma in zip(surface, lemma_words) if word not in self.stopwords}
+        return SegmentKeywords(tuple(pairs.items()), surface, lemma_words)
+
+    def keywords(self, text: str, phrases: Optional[KeywordPhraseMatcher] = None) -> List[str]:
+        segment = self.segment_keywords(text)
+        keywords = [lemma for _, lemma in segment.lemmas]
+        if phrases is not None:
+            keywords.extend(segment.phrases(phrases))
+        return keywords
@@ -0,0 +1,418 @@
+'''
+Lightweight in-process metrics for the prediction pipeline.
+
+Stages are timed with `timer("stage")` or the `@timed("stage")` decorator,
+events are counted with `inc(...)`. Everything lives in one registry
+(`get_metrics()`), which keeps wall time, CPU time and a rolling window of
+samples per stage for p50/p95/p99, plus counters and gauges. A snapshot can be
+exported to any number of sinks: a Prometheus text file, a JSON file or a
+`/metrics` HTTP endpoint.
+
+Environment:
+    PERSONA_METRICS=0                  disable collection (timers become no-ops)
+    PERSONA_METRICS_FILE=path          export periodically; .json for JSON, anything else Prometheus text
+    PERSONA_METRICS_PORT=9100          serve /metrics (Prometheus) and /metrics.json
+    PERSONA_METRICS_INTERVAL=15        seconds between file exports
+    PERSONA_PROFILE=cprofile           profile requests with cProfile (or "pyinstrument")
+    PERSONA_PROFILE_LIMIT=1            number of requests to profile
+    PERSONA_PROFILE_DIR=.cache/profiles
+'''
+import atexit
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+METRICS_ENABLED = os.environ.get("PERSONA_METRICS", "1") != "0"
+METRICS_FILE = os.environ.get("PERSONA_METRICS_FILE", "")
+METRICS_PORT = int(os.environ.get("PERSONA_METRICS_PORT", 0))
+METRICS_INTERVAL = float(os.environ.get("PERSONA_METRICS_INTERVAL", 15))
+# Samples kept per histogram for percentiles
+METRICS_WINDOW = 4096
+METRIC_PREFIX = "persona_"
+QUANTILES = (0.5, 0.95, 0.99)
+
+PROFILER = os.environ.get("PERSONA_PROFILE", "").lower()
+PROFILE_LIMIT = int(os.environ.get("PERSONA_PROFILE_LIMIT", 1))
+PROFILE_DIR = os.environ.get("PERSONA_PROFILE_DIR", ".cache/profiles")
+
+_NULL_CONTEXT = nullcontext()
+
+def _label_key(labels: Dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+class Histogram:
+    '''
+    Count and sum of every observation, percentiles over the last METRICS_WINDOW.
+    '''
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def summary(self) -> Dict:
+        values = sorted(self.samples)
+        result = {"count": self.count, "sum": self.sum}
+        for q in QUANTILES:
+            result[f"p{int(q * 100)}"] = percentile(values, q)
+        return result
+
+class _StageTimer:
+    __slots__ = ("registry", "stage", "wall", "cpu", "paused_wall", "paused_cpu")
+
+    def __init__(self, registry, stage: str):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        self.paused_wall = self.paused_cpu = 0.0
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.record_stage(self.stage, time.perf_counter() - self.wall - self.paused_wall,
+                                   time.thread_time() - self.cpu - self.paused_cpu)
+        return False
+
+    @contextmanager
+    def paused(self):
+        '''
+        Leaves the block out of the stage, e.g. a generator's yield, where the time is its consumer's.
+        '''
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.paused_wall += time.perf_counter() - wall
+            self.paused_cpu += time.thread_time() - cpu
+
+class _NullStageTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def paused(self):
+        return _NULL_CONTEXT
+
+_NULL_TIMER = _NullStageTimer()
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self.sinks = []
+        self.collectors = []
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def record_stage(self, stage: str, wall: float, cpu: float):
+        key = (("stage", stage),)
+        with self._lock:
+            histogram = self._histograms.get(("stage_seconds", key))
+            if histogram is None:
+                histogram = self._histograms[("stage_seconds", key)] = Histogram()
+            histogram.observe(wall)
+            cpu_key = ("stage_cpu_seconds_total", key)
+            self._counters[cpu_key] = self._counters.get(cpu_key, 0) + cpu
+
+    def timer(self, stage: str):
+        '''
+        Context manager recording wall time (histogram) and CPU time (counter)
+        of a stage; time spent in its paused() blocks is left out.
+        '''
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, stage)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def add_collector(self, collector):
+        '''
+        Registers a callable run on every snapshot, for gauges that are cheaper
+        to read on export than to update on every request.
+        '''
+        self.collectors.append(collector)
+
+    def snapshot(self) -> Dict:
+        self.set_gauge("process_max_rss_bytes", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+        for collector in self.collectors:
+            collector(self)
+        with self._lock:
+            histograms = [(name, labels, h.summary()) for (name, labels), h in self._histograms.items()]
+            counters = list(self._counters.items())
+            gauges = list(self._gauges.items())
+        return {
+            "timestamp": time.time(),
+            "histograms": [{"name": name, "labels": dict(labels), **summary} for name, labels, summary in histograms],
+            "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in counters],
+            "gauges": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in gauges],
+        }
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def flush(self):
+        '''
+        Push the current snapshot to every sink.
+        '''
+        if not self.sinks:
+            return
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            sink.export(snapshot)
+
+def _format_labels(labels: Dict, **extra) -> str:
+    items = {**labels, **extra}
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in items.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(items, escaped)) + "}"
+
+def _format_value(value) -> str:
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+def to_prometheus(snapshot: Dict) -> str:
+    '''
+    Prometheus text exposition format; histograms are exported as summaries.
+    '''
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for h in sorted(snapshot["histograms"], key=lambda h: h["name"]):
+        name = METRIC_PREFIX + h["name"]
+        declare(name, "summary")
+        for q in QUANTILES:
+            lines.append(f"{name}{_format_labels(h['labels'], quantile=q)} {_format_value(h[f'p{int(q * 100)}'])}")
+        lines.append(f"{name}_sum{_format_labels(h['labels'])} {_format_value(h['sum'])}")
+        lines.append(f"{name}_count{_format_labels(h['labels'])} {h['count']}")
+    for kind, entries in (("counter", snapshot["counters"]), ("gauge", snapshot["gauges"])):
+        for entry in sorted(entries, key=lambda e: e["name"]):
+            name = METRIC_PREFIX + entry["name"]
+            declare(name, kind)
+            lines.append(f"{name}{_format_labels(entry['labels'])} {_format_value(entry['value'])}")
+    return "\n".join(lines) + "\n"
+
+def _write_atomic(path: str, text: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".metrics-")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+class PrometheusFileSink:
+    '''
+    Writes the Prometheus text format, e.g. for the node_exporter textfile collector.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, snapshot: Dict):
+        _write_atomic(self.path, to_prometheus(snapshot))
+
+class JsonFileSink:
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, snapshot: Dict):
+        _write_atomic(self.path, json.dumps(snapshot, indent=2))
+
+class PrometheusHTTPSink:
+    '''
+    Serves GET /metrics (Prometheus text) and /metrics.json from a daemon
+    thread. Snapshots are taken on request, so export() has nothing to do.
+    '''
+
+    def __init__(self, registry: MetricsRegistry, port: int, host: str = "0.0.0.0"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics.json"):
+                    body, content_type = json.dumps(registry.snapshot()), "application/json"
+                elif self.path.startswith("/metrics"):
+                    body, content_type = to_prometheus(registry.snapshot()), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def export(self, snapshot: Dict):
+        pass
+
+def _export_periodically(registry: MetricsRegistry, interval: float):
+    while True:
+        time.sleep(interval)
+        registry.flush()
+
+_registry = None
+_registry_lock = threading.Lock()
+
+# Process-wide registry; sinks configured through the environment are attached on first use
+def get_metrics() -> MetricsRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+            if _registry.enabled and METRICS_FILE:
+                sink = JsonFileSink(METRICS_FILE) if METRICS_FILE.endswith(".json") else PrometheusFileSink(METRICS_FILE)
+                _registry.add_sink(sink)
+                threading.Thread(target=_export_periodically, args=(_registry, METRICS_INTERVAL),
+                                 name="metrics-export", daemon=True).start()
+                atexit.register(_registry.flush)
+            if _registry.enabled and METRICS_PORT:
+                _registry.add_sink(PrometheusHTTPSink(_registry, METRICS_PORT))
+        return _registry
+
+def timer(stage: str):
+    return get_metrics().timer(stage)
+
+def inc(name: str, value: float = 1, **labels):
+    get_metrics().inc(name, value, **labels)
+
+def timed(stage: str):
+    '''
+    Decorator form of timer().
+    '''
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            registry = get_metrics()
+            if not registry.enabled:
+                return fn(*args, **kwargs)
+            with _StageTimer(registry, stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_llm_usage(response, model: str):
+    '''
+    Token counters from an OpenAI chat completion response.
+    '''
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    registry = get_metrics()
+    registry.inc("llm_tokens_total", usage.prompt_tokens or 0, kind="prompt", model=model)
+    registry.inc("llm_tokens_total", usage.completion_tokens or 0, kind="completion", model=model)
+    registry.inc("llm_requests_total", model=model)
+
+_profile_lock = threading.Lock()
+_profiled = 0
+
+@contextmanager
+def _run_profiler(label: str):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    if PROFILER == "pyinstrument":
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(os.path.join(PROFILE_DIR, f"{label}-{stamp}.html"), "w") as f:
+                f.write(profiler.output_html())
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{label}-{stamp}.prof"))
+
+def profile_request(label: str = "request"):
+    '''
+    Profiles the wrapped request when PERSONA_PROFILE is set, for at most
+    PERSONA_PROFILE_LIMIT requests and one at a time. Output goes to
+    PERSONA_PROFILE_DIR (.prof for cProfile, .html for pyinstrument).
+    '''
+    global _profiled
+    if not PROFILER or _profiled >= PROFILE_LIMIT:
+        return _NULL_CONTEXT
+    if not _profile_lock.acquire(blocking=False):
+        return _NULL_CONTEXT
+    if _profiled >= PROFILE_LIMIT:
+        _profile_lock.release()
+        return _NULL_CONTEXT
+    _profiled += 1
+
+    @contextmanager
+    def profiled():
+        try:
+            with _run_profiler(label):
+                yield
+        finally:
+            _profile_lock.release()
+    return profiled()
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import threading
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import TYPE_CHECKING, Iterator, Optional
+
+# openai/httpx are imported on first use: they dominate import time and
+# the rule-based path never needs them
+if TYPE_CHECKING:
+    import openai
+
+# Defaults, overridable through the environment
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", 30))
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", 5))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", 2))
+OPENAI_MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", 8))
+
+class OpenAIClientManager:
+    '''
+    Hands out long-lived OpenAI clients so calls reuse keep-alive connections
+    instead of paying a new TCP/TLS handshake each time.
+
+    Every client gets the same timeout and retry policy (the SDK retries
+    connection errors, 429s and 5xx responses with exponential backoff), and
+    at most max_concurrency calls are in flight per process for the sync path
+    and per event loop for the async one.
+    '''
+
+    def __init__(self, timeout: float = OPENAI_TIMEOUT, connect_timeout: float = OPENAI_CONNECT_TIMEOUT,
+                 max_retries: int = OPENAI_MAX_RETRIES, max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+                 base_url: Optional[str] = None):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.base_url = base_url
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        # AsyncOpenAI clients and semaphores belong to the event loop they were created on
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_semaphores = weakref.WeakKeyDictionary()
+
+    def _http_settings(self):
+        import httpx
+        timeout = httpx.Timeout(self.timeout, connect=self.connect_timeout)
+        limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        return timeout, limits
+
+    def client(self, api_key: str) -> "openai.OpenAI":
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is None:
+                import openai
+                timeout, limits = self._http_settings()
+                client = openai.OpenAI(
+                    api_key=api_key,
+                    base_url=self.base_url,
+                    timeout=timeout,
+                    max_retries=self.max_retries,
+                    http_client=openai.DefaultHttpxClient(limits=limits, timeout=timeout),
+                )
+                self._clients[api_key] = client
+            return client
+
+    def async_client(self, api_key: str) -> "openai.AsyncOpenAI":
+        loop = asyncio.get_running_loop()
+        clients = self._async_clients.setdefault(loop, {})
+        client = clients.get(api_key)
+        if client is None:
+            import openai
+            timeout, limits = self._http_settings()
+            client = openai.AsyncOpenAI(
+                api_key=api_key,
+                base_url=self.base_url,
+                timeout=timeout,
+                max_retries=self.max_retries,
+                http_client=openai.DefaultAsyncHttpxClient(limits=limits, timeout=timeout),
+            )
+            clients[api_key] = client
+        return client
+
+    @contextmanager
+    def slot(self):
+        with self._semaphore:
+            yield
+
+    @asynccontextmanager
+    async def async_slot(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._async_semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        async with semaphore:
+            yield
+
+    def chat_completion(self, api_key: str, **kwargs):
+        with self.slot():
+            return self.client(api_key).chat.completions.create(**kwargs)
+
+    def stream_chat_completion(self, api_key: str, **kwargs) -> Iterator:
+        '''
+        Yields the chunks of a streamed chat completion. The concurrency slot
+        is held until the stream ends or the generator is closed.
+        '''
+        with self.slot():
+            stream = self.client(api_key).chat.completions.create(stream=True, **kwargs)
+            try:
+                yield from stream
+            finally:
+                stream.close()
+
+    async def achat_completion(self, api_key: str, **kwargs):
+        async with self.async_slot():
+            return await self.async_client(api_key).chat.completions.create(**kwargs)
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+# Process-wide manager shared by the app, batch jobs and the server
+def get_client_manager() -> OpenAIClientManager:
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            _default_manager = OpenAIClientManager()
+        return _default_manager
+
+def set_client_manager(manager: OpenAIClientManager):
+    '''
+    Replaces the process-wide manager, e.g. to point it at a local stub or change its limits.
+    '''
+    global _default_manager
+    with _default_manager_lock:
+        _default_manager = manager
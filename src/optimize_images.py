@@ -1,37 +1,110 @@
 from PIL import Image
+import hashlib
+import json
 import os
+import yaml
 
-def optimize_image(input_path, output_path, size=(240, 240), quality=85):
-    """Optimize an image by resizing and compressing it."""
+THUMBNAIL_DIR = "data/thumbs"
+# Images are shown at 150px; 300px keeps them sharp on high-DPI screens
+THUMBNAIL_SIZE = (300, 300)
+THUMBNAIL_FORMATS = {"WEBP": ("webp", "image/webp"), "JPEG": ("jpeg", "image/jpeg")}
+# Persona fields that name an image in data/ref_imgs
+IMAGE_FIELDS = ("notable_figures", "notable_influencers", "related_entities")
+
+def optimize_image(input_path, output_path, size=(240, 240), quality=85, format="JPEG", keep_aspect=False, verbose=True):
+    """Optimize an image by resizing and compressing it.
+
+    With keep_aspect the image is scaled down to fit inside size instead of
+    being stretched to it. Returns (original_bytes, optimized_bytes), or None on error.
+    """
     try:
         # Open the image
         with Image.open(input_path) as img:
-            # Convert to RGB if necessary (in case of RGBA)
+            # Convert to RGB if necessary (in case of RGBA or a palette with transparency)
+            if img.mode == 'P':
+                img = img.convert('RGBA')
             if img.mode in ('RGBA', 'LA'):
                 background = Image.new('RGB', img.size, (255, 255, 255))
                 background.paste(img, mask=img.split()[-1])
                 img = background
-            
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+
             # Resize the image
-            img = img.resize(size, Image.Resampling.LANCZOS)
-            
+            if keep_aspect:
+                img.thumbnail(size, Image.Resampling.LANCZOS)
+            else:
+                img = img.resize(size, Image.Resampling.LANCZOS)
+
             # Save the optimized image
-            img.save(output_path, 'JPEG', quality=quality, optimize=True)
-            
+            img.save(output_path, format, quality=quality, optimize=True)
+
             # Get file sizes
-            original_size = os.path.getsize(input_path) / 1024  # KB
-            optimized_size = os.path.getsize(output_path) / 1024  # KB
-            
-            print(f"Original size: {original_size:.1f}KB")
-            print(f"Optimized size: {optimized_size:.1f}KB")
-            print(f"Reduction: {((original_size - optimized_size) / original_size * 100):.1f}%")
-            
+            original_size = os.path.getsize(input_path)
+            optimized_size = os.path.getsize(output_path)
+
+            if verbose:
+                print(f"Original size: {original_size / 1024:.1f}KB")
+                print(f"Optimized size: {optimized_size / 1024:.1f}KB")
+                print(f"Reduction: {((original_size - optimized_size) / original_size * 100):.1f}%")
+            return original_size, optimized_size
+
     except Exception as e:
         print(f"Error optimizing image: {e}")
+        return None
+
+def referenced_images(personas_path="data/personas/personas.yaml", image_dir="data/ref_imgs"):
+    """Names of every image the UI can show: persona figures, influencers, entities and the logo"""
+    with open(personas_path, "r") as f:
+        personas = yaml.safe_load(f) or []
+    names = {"logo"}
+    for persona in personas:
+        for field in IMAGE_FIELDS:
+            names.update(persona.get(field, []) or [])
+    return sorted(name for name in names if os.path.exists(os.path.join(image_dir, f"{name}.jpeg")))
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+def build_thumbnails(personas_path="data/personas/personas.yaml", image_dir="data/ref_imgs",
+                     out_dir=THUMBNAIL_DIR, size=THUMBNAIL_SIZE, format="WEBP", quality=80):
+    """Generate a right-sized thumbnail for every referenced image and write the manifest.
+
+    Thumbnails are named after the content hash of their source, so unchanged
+    images are skipped on later runs and edited ones get a new file.
+    """
+    extension, mime = THUMBNAIL_FORMATS[format]
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {"size": list(size), "format": format, "names": {}, "images": {}}
+    total_original = total_thumbnail = 0
+
+    for name in referenced_images(personas_path, image_dir):
+        source = os.path.join(image_dir, f"{name}.jpeg")
+        content_hash = file_hash(source)
+        output = os.path.join(out_dir, f"{content_hash}.{extension}")
+        if not os.path.exists(output):
+            if optimize_image(source, output, size=size, quality=quality, format=format,
+                              keep_aspect=True, verbose=False) is None:
+                continue
+        manifest["names"][name] = content_hash
+        manifest["images"][content_hash] = {"file": output, "mime": mime, "bytes": os.path.getsize(output)}
+        total_original += os.path.getsize(source)
+        total_thumbnail += os.path.getsize(output)
+
+    # Drop thumbnails whose source no longer exists or changed
+    keep = {os.path.basename(image["file"]) for image in manifest["images"].values()}
+    for filename in os.listdir(out_dir):
+        if filename.endswith(f".{extension}") and filename not in keep:
+            os.remove(os.path.join(out_dir, filename))
+
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True, ensure_ascii=False)
+
+    print(f"{len(manifest['names'])} thumbnails in {out_dir}: "
+          f"{total_original / 1024:.1f}KB -> {total_thumbnail / 1024:.1f}KB")
+    return manifest
 
 if __name__ == "__main__":
-    # Optimize the logo
-    optimize_image(
-        "data/ref_imgs/logo.jpeg",
-        "data/ref_imgs/logo_optimized.jpeg"
-    ) 
\ No newline at end of file
+    # Build thumbnails for every image referenced by the personas
+    build_thumbnails()
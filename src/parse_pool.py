@@ -0,0 +1,246 @@
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+from src.custom_logger import forward_worker_logs, get_logger, log_to_parent
+from src.keyword_cache import SegmentKeywords
+from src.metrics import get_metrics
+
+logger = get_logger()
+
+# Defaults, overridable through the environment
+PARSE_QUEUE_SIZE = int(os.environ.get("PERSONA_PARSE_QUEUE_SIZE", 256))
+PARSE_MAX_BATCH = int(os.environ.get("PERSONA_PARSE_MAX_BATCH", 64))
+PARSE_TIMEOUT = float(os.environ.get("PERSONA_PARSE_TIMEOUT", 10))
+
+class ParsePoolFull(Exception):
+    pass
+
+class ParsePoolClosed(Exception):
+    pass
+
+# Runs in each worker process: log through the parent, load the model once and seed the persona lemma table
+def _init_worker(log_queue, lemmas: Dict[str, str]):
+    log_to_parent(log_queue)
+    from src import persona_predictor
+    persona_predictor.LEMMA_TABLE.update(lemmas)
+    persona_predictor.get_nlp()
+
+# Runs in a worker process: one nlp.pipe pass over every text of a batch
+def _analyze_batch(texts: List[str]) -> List[SegmentKeywords]:
+    from src.persona_predictor import get_nlp, segment_keywords_from_doc
+    return [segment_keywords_from_doc(doc) for doc in get_nlp().pipe(texts)]
+
+class ParsePool:
+    '''
+    Parses texts with spaCy in worker processes, so concurrent callers use
+    every core instead of taking turns on the GIL. Each worker loads the
+    model once.
+
+    Jobs (a list of texts each) wait in a queue of at most queue_size jobs. A
+    dispatcher thread hands them to the workers as soon as one is free,
+    packing the jobs queued meanwhile into a single nlp.pipe call: up to
+    max_batch texts when no other worker is idle, otherwise only a fair share
+    of the queued texts so the idle workers get the rest. A caller waits at
+    most timeout seconds: a job that can't be queued in time raises
+    ParsePoolFull, one that isn't parsed in time raises TimeoutError and is
+    dropped if it hasn't started. Jobs still queued when the pool is closed
+    fail with ParsePoolClosed.
+
+    Worker log records are written by this process. Workers start with a
+    copy of the persona lemma table; update_lemmas restarts them when it
+    grows (e.g. on a persona reload).
+    '''
+
+    def __init__(self, workers: int, queue_size: int = PARSE_QUEUE_SIZE, max_batch: int = PARSE_MAX_BATCH,
+                 timeout: float = PARSE_TIMEOUT, lemmas: Optional[Dict[str, str]] = None):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.queue_size = queue_size
+        self._lemmas = dict(lemmas or {})
+        self._queue = queue.Queue(maxsize=queue_size)
+        # One batch in flight per worker; the rest wait in the queue and batch up
+        self._free_workers = threading.Semaphore(workers)
+        self._count_lock = threading.Lock()
+        self._queued_texts = 0
+        self._busy_workers = 0
+        context = multiprocessing.get_context("spawn")
+        self._log_queue = context.Queue()
+        self._log_listener = forward_worker_logs(self._log_queue)
+        self._executor_lock = threading.Lock()
+        self._executor = self._new_executor()
+        self._metrics = get_metrics()
+        self._closed = False
+        self._thread = threading.Thread(target=self._dispatch, name="parse-pool", daemon=True)
+        self._thread.start()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn, not fork: the parent (Streamlit, the HTTP server) runs many threads
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(self._log_queue, self._lemmas))
+
+    def update_lemmas(self, lemmas: Dict[str, str]):
+        '''
+        Gives the workers a lemma table with the words added since they
+        started, by replacing them with fresh workers. Batches in progress
+        finish on the old ones.
+        '''
+        if lemmas.keys() <= self._lemmas.keys():
+            return
+        with self._executor_lock:
+            self._lemmas = dict(lemmas)
+            if self._closed:
+                return
+            old, self._executor = self._executor, self._new_executor()
+        old.shutdown(wait=False)
+        logger.info("Restarted spaCy parse workers for a lemma table of %d words", len(lemmas))
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def analyze(self, texts: List[str], timeout: Optional[float] = None) -> List[SegmentKeywords]:
+        '''
+        SegmentKeywords for each text, parsed in a worker process.
+        '''
+        if not texts:
+            return []
+        return self.result(self.submit(texts, timeout), timeout)
+
+    def submit(self, texts: List[str], timeout: Optional[float] = None) -> Future:
+        '''
+        Queues texts without waiting for them to be parsed; pass the future
+        to result. Raises ParsePoolFull if the queue has no room in time.
+        '''
+        if self._closed:
+            raise ParsePoolClosed("parse pool closed")
+        timeout = self.timeout if timeout is None else timeout
+        texts = list(texts)
+        future = Future()
+        with self._count_lock:
+            self._queued_texts += len(texts)
+        try:
+            self._queue.put((texts, future), timeout=timeout)
+        except queue.Full:
+            with self._count_lock:
+                self._queued_texts -= len(texts)
+            self._metrics.inc("parse_pool_jobs_total", result="rejected")
+            raise ParsePoolFull(f"parse queue full ({self.queue_size} jobs)")
+        return future
+
+    def result(self, future: Future, timeout: Optional[float] = None) -> List[SegmentKeywords]:
+        '''
+        The SegmentKeywords of a submitted job; raises TimeoutError and drops
+        the job if it isn't parsed within timeout seconds.
+        '''
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except TimeoutError:
+            future.cancel()
+            self._metrics.inc("parse_pool_jobs_total", result="timeout")
+            raise
+
+    def _take(self, job):
+        with self._count_lock:
+            self._queued_texts -= len(job[0])
+        return job
+
+    def _next_batch(self):
+        jobs = [self._take(self._queue.get())]
+        size = len(jobs[0][0])
+        with self._count_lock:
+            idle = self.workers - self._busy_workers - 1
+            # With other workers idle, take only this worker's share of what is queued
+            limit = self.max_batch if idle <= 0 else -(-(size + self._queued_texts) // (idle + 1))
+        while size < min(limit, self.max_batch):
+            try:
+                job = self._take(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            jobs.append(job)
+            size += len(job[0])
+        # Jobs whose caller gave up before they started are skipped
+        return [(texts, future) for texts, future in jobs if future.set_running_or_notify_cancel()]
+
+    def _dispatch(self):
+        while True:
+            self._free_workers.acquire()
+            jobs = self._next_batch()
+            if self._closed:
+                # Anything but close's wake-up job arrived too late to be drained by it
+                self._fail([job for job in jobs if job[0]], ParsePoolClosed("parse pool closed"))
+                return
+            if not jobs:
+                self._free_workers.release()
+                continue
+            with self._count_lock:
+                self._busy_workers += 1
+            texts = [text for job_texts, _ in jobs for text in job_texts]
+            self._metrics.observe("parse_pool_batch_texts", len(texts))
+            self._metrics.set_gauge("parse_pool_queue_depth", self._queue.qsize())
+            try:
+                with self._executor_lock:
+                    batch = self._executor.submit(_analyze_batch, texts)
+            except Exception as e:
+                self._release_worker()
+                self._fail(jobs, e)
+                continue
+            batch.add_done_callback(lambda done, jobs=jobs: self._finish(jobs, done))
+
+    def _release_worker(self):
+        with self._count_lock:
+            self._busy_workers -= 1
+        self._free_workers.release()
+
+    def _finish(self, jobs, batch: Future):
+        self._release_worker()
+        if batch.cancelled():
+            self._fail(jobs, ParsePoolClosed("parse pool closed"))
+            return
+        error = batch.exception()
+        if error is not None:
+            self._fail(jobs, error)
+            return
+        results = batch.result()
+        start = 0
+        for texts, future in jobs:
+            future.set_result(results[start:start + len(texts)])
+            start += len(texts)
+        self._metrics.inc("parse_pool_jobs_total", len(jobs), result="ok")
+
+    def _fail(self, jobs, error: BaseException):
+        if not jobs:
+            return
+        if isinstance(error, BrokenProcessPool):
+            # A worker died (e.g. killed for memory); later batches go to a fresh pool
+            logger.error("spaCy parse worker died, restarting the pool: %s", error)
+            with self._executor_lock:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._new_executor()
+        for _, future in jobs:
+            if not future.done():
+                future.set_exception(error)
+        self._metrics.inc("parse_pool_jobs_total", len(jobs), result="error")
+
+    def close(self):
+        self._closed = True
+        # Fail the jobs nobody will run, then wake the dispatcher so it sees the pool is closed
+        pending = []
+        while True:
+            try:
+                pending.append(self._take(self._queue.get_nowait()))
+            except queue.Empty:
+                break
+        self._fail([(texts, future) for texts, future in pending if future.set_running_or_notify_cancel()],
+                   ParsePoolClosed("parse pool closed"))
+        try:
+            self._queue.put_nowait(([], Future()))
+        except queue.Full:
+            pass
+        self._free_workers.release()
+        with self._executor_lock:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        self._log_listener.stop()
@@ -0,0 +1,116 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import yaml
+
+from src.custom_logger import get_logger
+from src.persona_index import PersonaList
+
+# Bump whenever PersonaList/PersonaIndex or the bundle layout changes shape
+BUNDLE_VERSION = 2
+BUNDLE_DIR = os.environ.get("PERSONA_BUNDLE_DIR", ".cache")
+
+logger = get_logger()
+
+# Short id of a persona YAML's content: the version attached to the personas loaded from it
+def source_version(source: bytes) -> str:
+    return hashlib.sha256(source).hexdigest()[:12]
+
+def bundle_path_for(yaml_path: str) -> str:
+    return os.path.join(BUNDLE_DIR, os.path.basename(yaml_path) + ".bundle.pkl")
+
+def persona_vocabulary(personas: Iterable[Dict]) -> list:
+    '''
+    Every keyword and negative keyword, as written in the YAML.
+    '''
+    return [
+        kw
+        for persona in personas
+        for kw in (persona.get('keywords', []) or []) + (persona.get('negative_keywords', []) or [])
+    ]
+
+def compile_bundle(source: bytes, lemmatize: Optional[Callable[[list], Dict[str, str]]] = None) -> Dict:
+    '''
+    Parses the persona YAML and builds everything derived from it: the persona
+    records with their keyword index and, if a lemmatizer is given, the lemma
+    table for the persona vocabulary.
+    '''
+    personas = PersonaList(yaml.safe_load(source) or [])
+    return {
+        "version": BUNDLE_VERSION,
+        "source_hash": hashlib.sha256(source).hexdigest(),
+        "personas": personas,
+        "lemmas": build_lemma_table(personas, lemmatize),
+    }
+
+def build_lemma_table(personas: PersonaList, lemmatize: Optional[Callable[[list], Dict[str, str]]]) -> Optional[Dict[str, str]]:
+    '''
+    Returns None when there is no lemmatizer (or no spaCy model), so a later
+    load that has one can fill the table in.
+    '''
+    if lemmatize is None:
+        return None
+    try:
+        return lemmatize(persona_vocabulary(personas))
+    except (ImportError, OSError) as e:
+        logger.warning(f"Persona bundle built without lemma table: {e}")
+        return None
+
+def load_persona_bundle(yaml_path: str, lemmatize: Optional[Callable[[list], Dict[str, str]]] = None,
+                        bundle_path: Optional[str] = None) -> Tuple[PersonaList, Dict[str, str]]:
+    '''
+    Returns (personas, lemma table) for yaml_path from the pickled bundle,
+    recompiling and rewriting the bundle only when the YAML content changed.
+    The personas carry the source_version of the YAML they came from.
+    '''
+    bundle_path = bundle_path or bundle_path_for(yaml_path)
+    with open(yaml_path, 'rb') as f:
+        source = f.read()
+    source_hash = hashlib.sha256(source).hexdigest()
+    version = source_version(source)
+
+    try:
+        with open(bundle_path, 'rb') as f:
+            bundle = pickle.load(f)
+        if bundle.get("version") == BUNDLE_VERSION and bundle.get("source_hash") == source_hash:
+            if bundle["lemmas"] is None and lemmatize is not None:
+                bundle["lemmas"] = build_lemma_table(bundle["personas"], lemmatize)
+                if bundle["lemmas"] is not None:
+                    save_bundle(bundle, bundle_path)
+            bundle["personas"].version = version
+            return bundle["personas"], bundle["lemmas"] or {}
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable persona bundle {bundle_path}: {e}")
+
+    bundle = compile_bundle(source, lemmatize)
+    save_bundle(bundle, bundle_path)
+    bundle["personas"].version = version
+    return bundle["personas"], bundle["lemmas"] or {}
+
+# The bundle is only a cache: when it can't be written (read-only deploy, unwritable .cache),
+# the personas compiled in memory are used as they are
+def save_bundle(bundle: Dict, bundle_path: str):
+    try:
+        write_bundle(bundle, bundle_path)
+    except OSError as e:
+        logger.warning(f"Could not write persona bundle {bundle_path}, using it from memory: {e}")
+
+def write_bundle(bundle: Dict, bundle_path: str):
+    '''
+    Writes the bundle atomically so concurrent workers never read a partial file.
+    '''
+    directory = os.path.dirname(bundle_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(bundle, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, bundle_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
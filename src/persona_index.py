@@ -0,0 +1,289 @@
+from collections import Counter
+from typing import Iterable, List, Dict, Tuple
+import numpy as np
+from src.phrase_matcher import KeywordPhraseMatcher
+
+# Flat penalty applied once per matched negative keyword
+NEGATIVE_KEYWORD_PENALTY = 0.3
+# Upper bound on users x personas cells scored at once by score_many
+SCORE_MANY_MAX_CELLS = 1 << 22
+
+class PersonaIndex:
+    '''
+    Inverted keyword index over a list of personas.
+
+    Every normalized (lower-cased) keyword maps to the ids of the personas that
+    list it and how many times they do, so scoring a request only touches the
+    postings of the tokens it contains instead of every persona's keyword list.
+    '''
+
+    def __init__(self, personas: List[Dict]):
+        self.personas = list(personas)
+        # keyword -> (persona ids, weights) as NumPy arrays
+        self.postings = {}
+        self.negative_postings = {}
+        # keyword -> [(persona id, position in the persona's keyword list, keyword as written)]
+        self.keyword_positions = {}
+
+        positive = {}
+        negative = {}
+        for persona_id, persona in enumerate(self.personas):
+            for position, kw in enumerate(persona.get('keywords', []) or []):
+                key = kw.lower()
+                weights = positive.setdefault(key, {})
+                weights[persona_id] = weights.get(persona_id, 0) + 1
+                self.keyword_positions.setdefault(key, []).append((persona_id, position, kw))
+            for nkw in persona.get('negative_keywords', []) or []:
+                weights = negative.setdefault(nkw.lower(), {})
+                weights[persona_id] = weights.get(persona_id, 0) + 1
+
+        self.postings = {key: self._to_arrays(weights) for key, weights in positive.items()}
+        self.negative_postings = {key: self._to_arrays(weights) for key, weights in negative.items()}
+        # Multi-word and hyphenated keywords never show up as a single extracted token,
+        # so they are found in the parsed text by this automaton instead
+        self.phrases = KeywordPhraseMatcher(list(positive) + list(negative))
+
+        # The same postings as CSR-style arrays over one vocabulary, for score_many:
+        # row v of a matrix is data[indptr[v]:indptr[v + 1]] for the personas in ids[...]
+        self.vocabulary = {key: column for column, key in enumerate(dict.fromkeys([*positive, *negative]))}
+        self.positive_matrix = self._to_csr(positive)
+        self.negative_matrix = self._to_csr(negative)
+        self.vocabulary_keys = list(self.vocabulary)
+        self.positive_columns = np.diff(self.positive_matrix[0]) > 0
+
+    def _to_csr(self, postings: Dict[str, Dict[int, int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        lengths = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        for key, weights in postings.items():
+            lengths[self.vocabulary[key] + 1] = len(weights)
+        indptr = np.cumsum(lengths)
+        ids = np.zeros(indptr[-1], dtype=np.int64)
+        data = np.zeros(indptr[-1], dtype=np.int64)
+        for key, weights in postings.items():
+            start = indptr[self.vocabulary[key]]
+            ids[start:start + len(weights)] = list(weights.keys())
+            data[start:start + len(weights)] = list(weights.values())
+        return indptr, ids, data
+
+    @staticmethod
+    def _to_arrays(weights: Dict[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+        ids = np.fromiter(weights.keys(), dtype=np.int64, count=len(weights))
+        values = np.fromiter(weights.values(), dtype=np.int64, count=len(weights))
+        return ids, values
+
+    def __len__(self):
+        return len(self.personas)
+
+    def score(self, tokens: List[str], top_n: int = 3) -> List[Tuple[Dict, int, List[str], float]]:
+        '''
+        Same contract as score_personas: (persona, score, matched_keywords, confidence)
+        tuples sorted by score, the top_n of them unless every score is 0.
+        '''
+        n_personas = len(self.personas)
+        positive_scores = np.zeros(n_personas, dtype=np.int64)
+        negative_hits = np.zeros(n_personas, dtype=np.int64)
+        matched_tokens = []
+
+        for token, count in Counter(tokens).items():
+            posting = self.postings.get(token)
+            if posting is not None:
+                ids, weights = posting
+                positive_scores[ids] += weights * count
+                matched_tokens.append(token)
+            negative_posting = self.negative_postings.get(token)
+            if negative_posting is not None:
+                ids, weights = negative_posting
+                negative_hits[ids] += weights
+
+        # Subtract the penalty one hit at a time so the floats match the loop version bit for bit
+        scores = positive_scores.astype(np.float64)
+        for hit in range(int(negative_hits.max(initial=0))):
+            scores[negative_hits > hit] -= NEGATIVE_KEYWORD_PENALTY
+
+        if scores.any():
+            top_ids = self._top_ids(scores, top_n)
+        else:
+            # if all scores are 0, return all the personas
+            top_ids = list(range(n_personas))
+        total_positive_score = sum(scores[scores > 0].tolist())
+        matched = self._matched_keywords(matched_tokens, set(top_ids))
+
+        results = []
+        for persona_id in top_ids:
+            if negative_hits[persona_id]:
+                score = float(scores[persona_id])
+            else:
+                score = int(positive_scores[persona_id])
+            normalized_score = max(0, score)
+            confidence = (normalized_score / total_positive_score * 100) if total_positive_score > 0 else 0
+            results.append((self.personas[persona_id], score, matched.get(persona_id, []), confidence))
+        return results
+
+    def score_many(self, token_lists: Iterable[List[str]], top_n: int = 3) -> List[List[Tuple[Dict, int, List[str], float]]]:
+        '''
+        score() for many users at once, with identical results. Token counts
+        form a sparse users x vocabulary matrix that is multiplied with the
+        vocabulary x personas keyword weights; negative keywords use a presence
+        matrix. Top-n selection and confidences are computed on the whole
+        users x personas score matrix from its nonzero entries, in chunks of
+        SCORE_MANY_MAX_CELLS.
+        '''
+        token_lists = list(token_lists)
+        chunk = max(1, SCORE_MANY_MAX_CELLS // max(len(self.personas), 1))
+        results = []
+        for start in range(0, len(token_lists), chunk):
+            results.extend(self._score_chunk(token_lists[start:start + chunk], top_n))
+        return results
+
+    def _score_chunk(self, token_lists: List[List[str]], top_n: int) -> List[List[Tuple[Dict, int, List[str], float]]]:
+        n_users = len(token_lists)
+        n_personas = len(self.personas)
+        if n_personas == 0:
+            return [[] for _ in token_lists]
+
+        # Sparse counts: one (user, column, count) triple per distinct vocabulary token of a user
+        columns = np.fromiter((self.vocabulary.get(token, -1) for tokens in token_lists for token in tokens),
+                              dtype=np.int64)
+        users = np.repeat(np.arange(n_users, dtype=np.int64), [len(tokens) for tokens in token_lists])
+        known = columns >= 0
+        cells, counts = np.unique(users[known] * len(self.vocabulary) + columns[known], return_counts=True)
+        cell_users, cell_columns = np.divmod(cells, max(len(self.vocabulary), 1))
+
+        positive_scores = self._multiply(self.positive_matrix, cell_users, cell_columns, counts, n_users)
+        negative_hits = self._multiply(self.negative_matrix, cell_users, cell_columns, np.ones_like(counts), n_users)
+
+        # Subtract the penalty one hit at a time so the floats match score() bit for bit
+        scores = positive_scores.astype(np.float64)
+        for hit in range(int(negative_hits.max(initial=0))):
+            scores[negative_hits > hit] -= NEGATIVE_KEYWORD_PENALTY
+
+        # Only the nonzero scores, row by row in persona order; users match a handful of personas
+        nonzero_users, nonzero_ids = np.nonzero(scores)
+        nonzero_scores = scores[nonzero_users, nonzero_ids]
+        row_starts = np.searchsorted(nonzero_users, np.arange(n_users + 1))
+        top_ids = self._top_ids_many(scores, nonzero_users, nonzero_ids, nonzero_scores, row_starts, top_n)
+        # Python's sum() over each row's positive scores, left to right, so the totals are identical
+        positive = nonzero_scores > 0
+        positive_values = nonzero_scores[positive].tolist()
+        positive_starts = np.searchsorted(nonzero_users[positive], np.arange(n_users + 1)).tolist()
+        total_positive = [sum(positive_values[positive_starts[user]:positive_starts[user + 1]])
+                          for user in range(n_users)]
+
+        matched_by_user = [[] for _ in range(n_users)]
+        is_positive = self.positive_columns[cell_columns]
+        for user, column in zip(cell_users[is_positive].tolist(), cell_columns[is_positive].tolist()):
+            matched_by_user[user].append(self.vocabulary_keys[column])
+
+        all_zero = (np.diff(row_starts) == 0).tolist()
+        results = []
+        for user in range(n_users):
+            if all_zero[user]:
+                # Every persona, each with score 0, no keywords and confidence 0
+                results.append([(persona, 0, [], 0) for persona in self.personas])
+                continue
+            ids = top_ids[user]
+            matched = self._matched_keywords(matched_by_user[user], set(ids))
+            total = total_positive[user]
+            user_results = []
+            # One gather per row, then plain Python values: indexing arrays element by element is slow
+            row = zip(ids, negative_hits[user, ids].tolist(), scores[user, ids].tolist(),
+                      positive_scores[user, ids].tolist())
+            for persona_id, hits, float_score, int_score in row:
+                score = float_score if hits else int_score
+                normalized_score = max(0, score)
+                confidence = (normalized_score / total * 100) if total > 0 else 0
+                user_results.append((self.personas[persona_id], score, matched.get(persona_id, []), confidence))
+            results.append(user_results)
+        return results
+
+    def _multiply(self, matrix, cell_users: np.ndarray, cell_columns: np.ndarray, values: np.ndarray,
+                  n_users: int) -> np.ndarray:
+        '''
+        Dense users x personas product of the sparse (user, column, value) cells with a CSR keyword matrix.
+        '''
+        indptr, ids, data = matrix
+        n_personas = len(self.personas)
+        starts = indptr[cell_columns]
+        lengths = indptr[cell_columns + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.zeros((n_users, n_personas), dtype=np.int64)
+        # Positions of every posting entry touched, expanded without a Python loop
+        offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        positions = np.repeat(starts, lengths) + offsets
+        flat = np.repeat(cell_users, lengths) * n_personas + ids[positions]
+        weights = data[positions] * np.repeat(values, lengths)
+        product = np.bincount(flat, weights=weights, minlength=n_users * n_personas)
+        return product.astype(np.int64).reshape(n_users, n_personas)
+
+    @staticmethod
+    def _top_ids_many(scores: np.ndarray, nonzero_users: np.ndarray, nonzero_ids: np.ndarray,
+                      nonzero_scores: np.ndarray, row_starts: np.ndarray, top_n: int) -> List[List[int]]:
+        '''
+        _top_ids for every row of a users x personas matrix, from its nonzero
+        entries; rows that are all zero get every persona, like score().
+        '''
+        n_users, n_personas = scores.shape
+        k = min(max(top_n, 0), n_personas)
+        # Each row's nonzero entries by score, ties by persona id: the order of a stable sort
+        order = np.lexsort((nonzero_ids, -nonzero_scores, nonzero_users))
+        ranked = nonzero_ids[order].tolist()
+        row_starts = row_starts.tolist()
+        n_positive = np.bincount(nonzero_users[nonzero_scores > 0], minlength=n_users).tolist()
+
+        everyone = list(range(n_personas))
+        top = []
+        for user in range(n_users):
+            start, end = row_starts[user], row_starts[user + 1]
+            if start == end:
+                top.append(everyone)
+            elif n_positive[user] >= k:
+                top.append(ranked[start:start + k])
+            else:
+                # Too few positive scores: zero-score personas come next in persona order, then the negatives
+                positives = ranked[start:start + n_positive[user]]
+                need = k - len(positives)
+                zeros = np.flatnonzero(scores[user] == 0)[:need].tolist()
+                negatives = ranked[start + n_positive[user]:end][:need - len(zeros)]
+                top.append(positives + zeros + negatives)
+        return top
+
+    @staticmethod
+    def _top_ids(scores: np.ndarray, top_n: int) -> List[int]:
+        '''
+        Ids of the top_n highest scores, ties broken by persona order like a stable sort.
+        '''
+        n_personas = len(scores)
+        k = min(max(top_n, 0), n_personas)
+        if k == 0:
+            return []
+        if k < n_personas:
+            partition = np.argpartition(-scores, k - 1)[:k]
+            threshold = scores[partition].min()
+            candidates = np.flatnonzero(scores >= threshold)
+        else:
+            candidates = np.arange(n_personas)
+        ordered = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return ordered[:k].tolist()
+
+    def _matched_keywords(self, matched_tokens: List[str], persona_ids: set) -> Dict[int, List[str]]:
+        '''
+        Matched keywords per persona, as written in the YAML and in the persona's keyword order.
+        '''
+        hits = {}
+        for token in matched_tokens:
+            for persona_id, position, kw in self.keyword_positions[token]:
+                if persona_id in persona_ids:
+                    hits.setdefault(persona_id, []).append((position, kw))
+        return {persona_id: [kw for _, kw in sorted(kws)] for persona_id, kws in hits.items()}
+
+class PersonaList(list):
+    '''
+    The persona dicts loaded from YAML, carrying a PersonaIndex built from them.
+    '''
+
+    # Content hash of the YAML the list was loaded from, set by load_personas
+    version = ""
+
+    def __init__(self, personas: List[Dict]):
+        super().__init__(personas)
+        self.index = PersonaIndex(self)
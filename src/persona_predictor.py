@@ -1,46 +1,298 @@
+import os
+import threading
+import time
 import yaml
 import re
-from collections import Counter
-from typing import List, Dict, Tuple
-import openai
-import spacy
-from src.custom_logger import get_logger
+from functools import lru_cache
+from itertools import islice
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Dict, Optional, Tuple, Union
+from src.custom_logger import get_logger, annotate_request, annotate_request_text
+from src.persona_bundle import load_persona_bundle, persona_vocabulary, source_version
+from src.persona_index import PersonaIndex, PersonaList
+from src.phrase_matcher import KeywordPhraseMatcher, doc_words, phrase_words
+from src.keyword_cache import KeywordAggregate, KeywordCache, SegmentKeywords, get_keyword_cache, segment_key
+from src.lite_extractor import LiteExtractor, load_common_lemmas, build_lemma_table as build_lite_lemma_table
+from src.openai_client import get_client_manager
+from src.prompt_budget import MAX_POST_TOKENS, PROMPT_TOKEN_BUDGET, estimate_tokens, fit_posts
+from src.metrics import get_metrics, record_llm_usage, timed, timer
+from src.response_cache import ResponseCache, get_response_cache, make_cache_key
+from src.single_flight import LeaderAbandoned, SingleFlight
+
+if TYPE_CHECKING:
+    from src.parse_pool import ParsePool
 
 # Initialize logger
 logger = get_logger()
-nlp = spacy.load("en_core_web_sm")
 STOPWORDS = set(['the', 'and', 'is', 'in', 'to', 'of', 'a', 'for', 'on', 'with', 'at', 'by', 'an', 'be', 'this', 'that', 'it'])
 
-# Load personas from YAML
-def load_personas(yaml_path: str) -> List[Dict]:
-    with open(yaml_path, 'r') as f:
-        return yaml.safe_load(f)
+SPACY_MODEL = "en_core_web_sm"
+# senter is disabled in en_core_web_sm anyway (the parser sets sentences), so don't load it at all
+SPACY_EXCLUDE = ["senter"]
+# Components needed to lemmatize a lone word; the parser and NER don't affect lemmas
+LEMMA_DISABLE = ["parser", "ner"]
+# Set PERSONA_BUNDLE=0 to always parse personas.yaml instead of using the compiled bundle
+USE_PERSONA_BUNDLE = os.environ.get("PERSONA_BUNDLE", "1") != "0"
+# "full" parses with the spaCy pipeline; "lite" tokenizes with a regex and looks lemmas up
+# in tables built from the persona vocabulary, without importing spaCy at all
+EXTRACTION_MODE = os.environ.get("PERSONA_EXTRACTION_MODE", "full").lower()
+LITE_MODE = EXTRACTION_MODE == "lite"
+
+# Opt-in: parse in this many worker processes (src/parse_pool.py) instead of on the
+# calling thread, so concurrent sessions aren't serialized on the GIL. Full mode only
+PARSE_WORKERS = int(os.environ.get("PERSONA_PARSE_WORKERS", 0))
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+# Load the spaCy pipeline on first use rather than at import
+def get_nlp():
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                import spacy
+                _nlp = spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDE)
+    return _nlp
+
+# Word -> lemma table precomputed for the persona vocabulary by the persona bundle
+LEMMA_TABLE: Dict[str, str] = {}
+
+# Lemmatize many lone words in one nlp.pipe pass, skipping the parser and NER
+def lemmatize_words(words: Iterable[str]) -> Dict[str, str]:
+    words = list(dict.fromkeys(words))
+    docs = get_nlp().pipe(words, disable=LEMMA_DISABLE)
+    return {word: doc[0].lemma_ for word, doc in zip(words, docs) if len(doc)}
+
+# Load personas from YAML, along with the keyword index used for scoring
+@timed("load_personas")
+def load_personas(yaml_path: str) -> PersonaList:
+    '''
+    Loads the compiled persona bundle, which is rebuilt only when the YAML
+    changes, and seeds the lemma table with the persona vocabulary. The
+    personas' version is the content hash of the YAML.
+    '''
+    if not USE_PERSONA_BUNDLE:
+        with open(yaml_path, 'rb') as f:
+            source = f.read()
+        personas = PersonaList(yaml.safe_load(source) or [])
+        personas.version = source_version(source)
+    else:
+        # Lite mode takes the bundle's lemma table if it has one but never builds it, as that needs spaCy
+        personas, lemmas = load_persona_bundle(yaml_path, None if LITE_MODE else lambda vocabulary: lemmatize_words(
+            word for keyword in vocabulary for word in phrase_words(keyword)
+        ))
+        LEMMA_TABLE.update(lemmas)
+        # Workers started earlier only have the table they were started with
+        if _parse_pool is not None:
+            _parse_pool.update_lemmas(LEMMA_TABLE)
+    if LITE_MODE:
+        extractor = get_lite_extractor()
+        extractor.lemmas.update(build_lite_lemma_table(persona_vocabulary(personas), LEMMA_TABLE, extractor.common))
+    return personas
+
+_lite_extractor = None
+_lite_extractor_lock = threading.Lock()
+
+# The lite mode extractor; load_personas adds every loaded persona vocabulary to its lemma table
+def get_lite_extractor() -> LiteExtractor:
+    global _lite_extractor
+    with _lite_extractor_lock:
+        if _lite_extractor is None:
+            _lite_extractor = LiteExtractor(load_common_lemmas(), STOPWORDS)
+        return _lite_extractor
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+# The worker process pool when PERSONA_PARSE_WORKERS is set, otherwise None
+def get_parse_pool() -> Optional["ParsePool"]:
+    global _parse_pool
+    if PARSE_WORKERS <= 0 or LITE_MODE:
+        return None
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            from src.parse_pool import ParsePool
+            # Workers get the persona lemma table loaded so far, so they skip lemmatizing those words
+            _parse_pool = ParsePool(PARSE_WORKERS, lemmas=LEMMA_TABLE)
+        return _parse_pool
+
+# Upper bound on the number of distinct words whose isolated lemma we remember
+LEMMA_CACHE_SIZE = 8192
+
+# Lemmatize a single word in isolation, for words the main parse did not cover
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize_word(word: str) -> str:
+    lemma = LEMMA_TABLE.get(word)
+    if lemma is None:
+        nlp = get_nlp()
+        lemma = nlp(word, disable=LEMMA_DISABLE)[0].lemma_
+    return lemma
+
+# Hit rate of the isolated-word lemma cache, read when metrics are exported
+def _lemma_cache_metrics(registry):
+    info = lemmatize_word.cache_info()
+    lookups = info.hits + info.misses
+    registry.set_gauge("lemma_cache_hit_rate", info.hits / lookups if lookups else 0.0)
+    registry.set_gauge("lemma_cache_size", info.currsize)
+
+get_metrics().add_collector(_lemma_cache_metrics)
+
+# Hit rate and size of the per-segment keyword cache shared by all sessions
+def _keyword_cache_metrics(registry):
+    stats = get_keyword_cache().stats()
+    registry.set_gauge("keyword_cache_hit_rate", stats["hit_rate"])
+    registry.set_gauge("keyword_cache_size", stats["size"])
+
+get_metrics().add_collector(_keyword_cache_metrics)
+
+# Collect keyword lemmas from an already parsed Doc
+def keywords_from_doc(doc, phrases: Optional[KeywordPhraseMatcher] = None) -> List[str]:
+    '''
+    Returns one lemma per unique word found in the entities, noun chunks and
+    content-token lemmas of the Doc. Each word is then lemmatized on its own
+    by the cached isolated lemmatizer, as the persona keywords are: its
+    lemma in the sentence can differ (e.g. with its part of speech).
+    When a phrase matcher is given, every multi-word or hyphenated persona
+    keyword found in the Doc is appended as well.
+    '''
+    keywords_lemmatized = [lemma for _, lemma in _word_lemmas(doc)]
+    if phrases is not None:
+        keywords_lemmatized.extend(phrases.find_in_doc(doc))
+    return keywords_lemmatized
+
+def _word_lemmas(doc) -> List[Tuple[str, str]]:
+    words = set()
+    for ent in doc.ents:
+        words.update(ent.text.lower().split())
+    for chunk in doc.noun_chunks:
+        words.update(chunk.text.lower().split())
+    for token in doc:
+        if not token.is_stop and not token.is_punct:
+            words.update(token.lemma_.lower().split())
+    return [(word, lemmatize_word(word)) for word in words]
+
+# Everything keyword extraction needs from one segment's parse, in a cacheable form
+def segment_keywords_from_doc(doc) -> SegmentKeywords:
+    return SegmentKeywords(tuple(_word_lemmas(doc)), *doc_words(doc))
+
+# Combine a bio and its posts into the single text the keyword extractor sees
+def join_user_input(bio: str, posts: List[str]) -> str:
+    return bio + " " + " ".join(posts)
 
 # Extract keywords/entities using spaCy
-def extract_keywords(text: str) -> List[str]:
-    doc = nlp(text)
-    keywords = set([ent.text.lower() for ent in doc.ents])
-    keywords.update(chunk.text.lower() for chunk in doc.noun_chunks)
-    keywords.update([token.lemma_.lower() for token in doc if not token.is_stop and not token.is_punct])
+@timed("extract_keywords")
+def extract_keywords(text: str, phrases: Optional[KeywordPhraseMatcher] = None) -> List[str]:
+    if LITE_MODE:
+        return get_lite_extractor().keywords(text, phrases)
+    pool = get_parse_pool()
+    if pool is not None:
+        return _segment_keyword_list(pool.analyze([text])[0], phrases)
+    return keywords_from_doc(get_nlp()(text), phrases)
+
+# The keyword list of a segment parsed by the worker pool
+def _segment_keyword_list(segment: SegmentKeywords, phrases: Optional[KeywordPhraseMatcher]) -> List[str]:
+    return [lemma for _, lemma in segment.lemmas] + (segment.phrases(phrases) if phrases is not None else [])
 
-    keywords = list(keywords)
+# Cacheable per-segment extraction results for many texts, in either extraction mode. With the worker
+# pool the texts are split into one job per worker, so they parse in parallel
+def analyze_segments(texts: List[str], **pipe_options) -> List[SegmentKeywords]:
+    if LITE_MODE:
+        extractor = get_lite_extractor()
+        return [extractor.segment_keywords(text) for text in texts]
+    pool = get_parse_pool()
+    if pool is not None:
+        size = max(1, -(-len(texts) // pool.workers))
+        jobs = [pool.submit(texts[i:i + size]) for i in range(0, len(texts), size)]
+        return [segment for job in jobs for segment in pool.result(job)]
+    return [segment_keywords_from_doc(doc) for doc in get_nlp().pipe(texts, **pipe_options)]
 
-    keywords_update = []
-    for i in range(len(keywords)):
-        # add each token in the keyword to the keywords_update
-        for token in keywords[i].split():
-            keywords_update.append(token)
+# The segments keywords are extracted from: the bio and each post, skipping empty ones
+def user_segments(bio: str, posts: List[str]) -> List[str]:
+    return [segment for segment in [bio, *posts] if segment.strip()]
 
-    keywords_update = list(set(keywords_update))
-    keywords_lemmatized = []
-    for keyword in keywords_update:
-        doc = nlp(keyword)
-        keywords_lemmatized.append(doc[0].lemma_)
-    
+# Segment entries for keys, from the cache or parsed together in one analyze_segments call.
+# Returns them with the number of segments that had to be parsed
+def _segment_entries(keys: Iterable[str], texts: Dict[str, str], cache: KeywordCache,
+                     **pipe_options) -> Tuple[Dict[str, SegmentKeywords], int]:
+    entries = {}
+    to_parse = []
+    for key in keys:
+        entry = cache.get(key)
+        if entry is None:
+            to_parse.append(key)
+        else:
+            entries[key] = entry
+    if to_parse:
+        for key, entry in zip(to_parse, analyze_segments([texts[key] for key in to_parse], **pipe_options)):
+            entries[key] = entry
+            cache.set(key, entry)
+    metrics = get_metrics()
+    metrics.inc("keyword_segments_total", len(entries) - len(to_parse), result="cached")
+    metrics.inc("keyword_segments_total", len(to_parse), result="parsed")
+    return entries, len(to_parse)
+
+# Keyword extraction per segment (the bio and each post), for reruns that change a few posts
+@timed("extract_keywords")
+def extract_segment_keywords(segments: List[str], phrases: Optional[KeywordPhraseMatcher] = None,
+                             aggregate: Optional[KeywordAggregate] = None,
+                             cache: Optional[KeywordCache] = None) -> List[str]:
+    '''
+    Each segment is parsed as its own document and its result cached by
+    content hash in the shared KeywordCache. With a KeywordAggregate kept
+    between calls (e.g. in the Streamlit session), only segments that were
+    added or changed since the previous call are looked up or parsed.
+    '''
+    if cache is None:
+        cache = get_keyword_cache()
+    if aggregate is None:
+        aggregate = KeywordAggregate()
+    segments = [segment for segment in segments if segment.strip()]
+    keys = [segment_key(segment) for segment in segments]
+    entries, parsed = _segment_entries(aggregate.missing(keys), dict(zip(keys, segments)), cache)
+    annotate_request(segments_parsed=parsed)
+    aggregate.update(keys, entries)
+    return aggregate.tokens(phrases)
 
-    return list(keywords_lemmatized)
- 
+# extract_segment_keywords for many users at once (e.g. a server micro-batch or a chunk of a batch file):
+# the segments of all of them that aren't cached are parsed together
+def extract_users_keywords(users_segments: List[List[str]], phrases: Optional[KeywordPhraseMatcher] = None,
+                           cache: Optional[KeywordCache] = None, **pipe_options) -> List[List[str]]:
+    '''
+    One keyword list per user, each equal to what extract_segment_keywords
+    (and so predict_rule_based and the app) returns for that user's
+    segments. pipe_options (batch_size, n_process) go to nlp.pipe.
+    '''
+    if cache is None:
+        cache = get_keyword_cache()
+    users_keys = []
+    texts = {}
+    for segments in users_segments:
+        keys = [segment_key(segment) for segment in segments if segment.strip()]
+        texts.update(zip(keys, (segment for segment in segments if segment.strip())))
+        users_keys.append(keys)
+    entries, _ = _segment_entries(list(texts), texts, cache, **pipe_options)
+    keyword_lists = []
+    for keys in users_keys:
+        aggregate = KeywordAggregate()
+        aggregate.update(keys, entries)
+        keyword_lists.append(aggregate.tokens(phrases))
+    return keyword_lists
 
+# extract_users_keywords over a stream of users' segment lists (or (segments, context) pairs), chunk_size users
+# at a time, so memory stays flat for any input size
+def extract_users_keywords_stream(users_segments: Iterable, phrases: Optional[KeywordPhraseMatcher] = None,
+                                  as_tuples: bool = False, chunk_size: int = 1024, **pipe_options) -> Iterator:
+    items = iter(users_segments)
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            return
+        keyword_lists = extract_users_keywords([item[0] for item in chunk] if as_tuples else chunk, phrases,
+                                               **pipe_options)
+        if as_tuples:
+            yield from zip(keyword_lists, (context for _, context in chunk))
+        else:
+            yield from keyword_lists
 
 def preprocess_text(text: str) -> List[str]:
     text = text.lower()
@@ -49,47 +301,48 @@ def preprocess_text(text: str) -> List[str]:
     return [t for t in tokens if t not in STOPWORDS]
 
 # Score personas by keyword match, return top n personas
+@timed("score_personas")
 def score_personas(personas: List[Dict], tokens: List[str], top_n: int = 3) -> List[Tuple[Dict, int, List[str], float]]:
-    scores = []
-    token_counts = Counter(tokens)
-    
-    for persona in personas:
-        score = 0
-        matched_keywords = []
-        # print(f"persona : {persona['display_name']}")
-        for kw in persona.get('keywords', []):
-            if kw.lower() in token_counts:
-                score += token_counts[kw.lower()]
-                matched_keywords.append(kw)
-                # print(f"Matched kw : {kw}")
-        for nkw in persona.get('negative_keywords', []):
-            if nkw.lower() in token_counts:
-                # score -= token_counts[nkw.lower()]
-                score -= 0.3
-                # print(f"Matched nkw : {nkw}")
-
-        scores.append((persona, score, matched_keywords))
-    
-    # Calculate total of positive scores for normalization
-    total_positive_score = sum(max(0, score) for _, score, _ in scores)
-    
-    # Add confidence percentage to each score tuple
-    scores_with_confidence = []
-    for persona, score, matched_keywords in scores:
-        # Ensure score is non-negative
-        normalized_score = max(0, score)
-        # Calculate confidence as percentage of total positive scores
-        confidence = (normalized_score / total_positive_score * 100) if total_positive_score > 0 else 0
-        scores_with_confidence.append((persona, score, matched_keywords, confidence))
-    
-    # Sort by score in descending order
-    scores_with_confidence.sort(key=lambda x: x[1], reverse=True)
-
-    # if all scores are 0, return all the personas
-    if all(score == 0 for _, score, _, _ in scores_with_confidence):
-        return scores_with_confidence
-    else:
-        return scores_with_confidence[:top_n]
+    '''
+    Uses the PersonaIndex attached by load_personas; a plain list of personas
+    gets an index built on the fly.
+    '''
+    index = getattr(personas, 'index', None)
+    if index is None:
+        index = PersonaIndex(personas)
+    return index.score(tokens, top_n=top_n)
+
+# Score many users at once, e.g. for batch jobs; same results as calling score_personas per user
+@timed("score_personas_batch")
+def score_personas_batch(personas: List[Dict], token_lists: Iterable[List[str]],
+                         top_n: int = 3) -> List[List[Tuple[Dict, int, List[str], float]]]:
+    index = getattr(personas, 'index', None)
+    if index is None:
+        index = PersonaIndex(personas)
+    return index.score_many(token_lists, top_n=top_n)
+
+# Identical predictions in progress at the same time (e.g. many visitors submitting the
+# test values at once) are computed once: keyed on the persona set and the input as
+# written, since casing and spacing change how spaCy parses it
+RULE_BASED_FLIGHT = SingleFlight("rule_based")
+
+def predict_rule_based(personas: PersonaList, bio: str, posts: List[str], top_n: int = 3,
+                       aggregate: Optional[KeywordAggregate] = None) -> List[Tuple[Dict, int, List[str], float]]:
+    '''
+    Keyword extraction (per segment, see extract_segment_keywords) and
+    scoring of a user's input. A call made while an identical one is in
+    progress waits for it and returns its result; the aggregate of such a
+    call is left as it was, so its next call parses a little more.
+    '''
+    segments = user_segments(bio, posts)
+
+    def predict():
+        return score_personas(personas, extract_segment_keywords(segments, personas.index.phrases, aggregate),
+                              top_n=top_n)
+
+    top_personas, shared = RULE_BASED_FLIGHT.do((personas.version or id(personas), top_n, *segments), predict)
+    annotate_request(rule_based_coalesced=shared)
+    return top_personas
 
 # Stub for LLM explanation (not used if classify_with_gpt is used)
 def generate_explanation(persona: Dict, matched_keywords: List[str], user_input: str) -> str:
@@ -102,48 +355,26 @@ def load_gpt_prompt_template(path: str = "data/gpt_prompt.txt") -> str:
     with open(path, "r") as f:
         return f.read()
 
-# Call OpenAI GPT model for persona classification and reasoning, using only top personas
-def classify_with_gpt(bio: str, posts: str, top_personas: List[Dict], openai_api_key: str) -> Tuple[str, str]:
+# Model parameters for the classification call; part of the response cache key
+GPT_MODEL_PARAMS = {"model": "gpt-3.5-turbo", "max_tokens": 256, "temperature": 0.3}
+
+def build_gpt_prompt(prompt_template: str, bio: str, posts: str, top_personas: List[Dict]) -> str:
     '''
-    This function uses the OpenAI GPT model to classify the user's input into a persona.
-    Args : 
-        bio : str
-        posts : str
-        top_personas : List[Dict]
-        openai_api_key : str
-    Returns :
-        persona : str
-        reasoning : str
+    Fills the GPT prompt template with the candidate personas and the user's input.
     '''
-    prompt_template = load_gpt_prompt_template()
     persona_list = ', '.join([p['persona_name'] for p in top_personas])
     persona_descriptions = '\n'.join([f"{p['persona_name']}: {p['description']}" for p in top_personas])
-    prompt = prompt_template.format(
+    return prompt_template.format(
         persona_list=persona_list,
         persona_descriptions=persona_descriptions,
         bio=bio,
         posts=posts
     )
-    
-    # Log the GPT prompt
-    logger.info("********************")
-    logger.info(f"GPT Prompt : {prompt}")
-    logger.info("********************")
-    
-    client = openai.OpenAI(api_key=openai_api_key)
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=256,
-        temperature=0.3
-    )
-    content = response.choices[0].message.content
-    
-    # Log the raw GPT response
-    logger.info("+++++++++++++++++++++++++++++++++++++")
-    logger.info(f"Raw GPT Response:\n{content}")
-    logger.info("+++++++++++++++++++++++++++++++++++++")
-    
+
+def parse_gpt_response(content: str) -> Tuple[str, str]:
+    '''
+    Extracts the persona and reasoning from the "Persona:" / "Reasoning:" lines of a GPT answer.
+    '''
     persona = ""
     reasoning = ""
     for line in content.splitlines():
@@ -151,4 +382,234 @@ def classify_with_gpt(bio: str, posts: str, top_personas: List[Dict], openai_api
             persona = line.split(":", 1)[1].strip()
         elif line.lower().startswith("reasoning:"):
             reasoning = line.split(":", 1)[1].strip()
-    return persona, reasoning 
\ No newline at end of file
+    return persona, reasoning
+
+# Bio and posts for the GPT prompt, cut down to the prompt token budget. A
+# list of posts is deduplicated, long posts are cut and many are sampled; a
+# single string is only cut at the end
+def budget_gpt_input(prompt_template: str, bio: str, posts: Union[str, List[str]], top_personas: List[Dict],
+                     token_budget: Optional[int] = None) -> Tuple[str, str]:
+    if isinstance(posts, str):
+        posts, max_post_tokens = [posts], None
+    else:
+        max_post_tokens = MAX_POST_TOKENS
+    if token_budget is None:
+        token_budget = PROMPT_TOKEN_BUDGET
+    fixed_tokens = estimate_tokens(build_gpt_prompt(prompt_template, "", "", top_personas))
+    bio, kept, stats = fit_posts(bio, posts, token_budget - fixed_tokens, max_post_tokens)
+    dropped = stats["posts"] - stats["posts_sent"]
+    annotate_request(gpt_posts_sent=stats["posts_sent"], gpt_posts_dropped=dropped,
+                     gpt_texts_truncated=stats["truncated"])
+    metrics = get_metrics()
+    metrics.inc("gpt_prompt_posts_dropped_total", stats["duplicates"], reason="duplicate")
+    metrics.inc("gpt_prompt_posts_dropped_total", dropped - stats["duplicates"], reason="budget")
+    metrics.inc("gpt_prompt_texts_truncated_total", stats["truncated"])
+    return bio, " ".join(kept)
+
+# Budget the input and resolve the cache and key for a classification;
+# returns the cache, the key, the prompt and the cached answer if there is one
+def _lookup_classification(bio: str, posts: Union[str, List[str]], top_personas: List[Dict],
+                           cache: Optional[ResponseCache]):
+    if cache is None:
+        cache = get_response_cache()
+    prompt_template = load_gpt_prompt_template()
+    bio, posts = budget_gpt_input(prompt_template, bio, posts, top_personas)
+    cache_key = make_cache_key(bio, posts, [p['persona_name'] for p in top_personas], prompt_template, GPT_MODEL_PARAMS)
+    cached = cache.get(cache_key)
+    annotate_request(gpt_cached=cached is not None)
+    metrics = get_metrics()
+    metrics.inc("gpt_cache_requests_total", result="hit" if cached is not None else "miss")
+    lookups = cache.hits + cache.misses
+    metrics.set_gauge("gpt_cache_hit_rate", cache.hits / lookups if lookups else 0.0)
+    if cached is not None:
+        logger.debug("GPT response served from cache (%s)", cache.stats())
+    return cache, cache_key, build_gpt_prompt(prompt_template, bio, posts, top_personas), cached
+
+# Identical GPT classifications in progress at the same time share one upstream request,
+# keyed like the response cache that serves them once it is done
+GPT_FLIGHT = SingleFlight("classify_with_gpt")
+
+def _gpt_messages(prompt: str) -> List[Dict]:
+    prompt_tokens = estimate_tokens(prompt)
+    get_metrics().observe("gpt_prompt_tokens", prompt_tokens)
+    annotate_request(gpt_prompt_tokens=prompt_tokens)
+
+    # Recorded on the request's log line; only sampled requests keep the full prompt
+    annotate_request_text("gpt_prompt", prompt)
+    logger.debug("GPT prompt: %s", prompt)
+    return [{"role": "user", "content": prompt}]
+
+# Time to the first token of an answer; for a call that isn't streamed that is the whole answer
+def _record_ttft(seconds: float, stream: bool):
+    get_metrics().observe("gpt_ttft_seconds", seconds, stream=str(stream).lower())
+    annotate_request(gpt_ttft_ms=round(seconds * 1000, 1))
+
+def _finish_classification(cache: ResponseCache, cache_key: str, content: str, usage_response=None) -> Tuple[str, str]:
+    if usage_response is not None:
+        record_llm_usage(usage_response, GPT_MODEL_PARAMS["model"])
+
+    annotate_request_text("gpt_raw_response", content)
+    logger.debug("Raw GPT response: %s", content)
+
+    persona, reasoning = parse_gpt_response(content)
+    # Only remember usable answers so a bad response isn't replayed
+    if persona:
+        cache.set(cache_key, persona, reasoning)
+    return persona, reasoning
+
+# One upstream classification request; the answer is parsed and cached
+def _request_classification(openai_api_key: str, cache: ResponseCache, cache_key: str, prompt: str) -> Tuple[str, str]:
+    messages = _gpt_messages(prompt)
+    start = time.perf_counter()
+    response = get_client_manager().chat_completion(openai_api_key, messages=messages, **GPT_MODEL_PARAMS)
+    _record_ttft(time.perf_counter() - start, stream=False)
+    return _finish_classification(cache, cache_key, response.choices[0].message.content, response)
+
+class StreamingAnswer:
+    '''
+    Reads a "Persona:" / "Reasoning:" answer while it streams in. The persona
+    is set once its line is complete; reasoning is the reasoning line so far.
+    '''
+
+    MARKER = "reasoning:"
+    # A marker only counts at the start of a line, as in parse_gpt_response
+    _MARKER_RE = re.compile(r"^" + re.escape(MARKER), re.IGNORECASE | re.MULTILINE)
+
+    def __init__(self):
+        self.content = ""
+        self.persona = ""
+        self.reasoning = ""
+        # Where the latest reasoning line starts (after its marker) and ends, once seen
+        self._reasoning_start = -1
+        self._reasoning_end = -1
+
+    def feed(self, delta: str):
+        # Only the new text is searched, so a long answer isn't rescanned on every token
+        scanned = len(self.content)
+        self.content += delta
+        if not self.persona:
+            end = delta.rfind("\n")
+            if end >= 0:
+                self.persona, _ = parse_gpt_response(self.content[:scanned + end])
+        # Back up far enough to catch a marker split across deltas. A later
+        # reasoning line replaces an earlier one, as in parse_gpt_response
+        for match in self._MARKER_RE.finditer(self.content, max(0, scanned - len(self.MARKER) + 1)):
+            self._reasoning_start, self._reasoning_end = match.end(), -1
+        if self._reasoning_start < 0:
+            return
+        if self._reasoning_end < 0:
+            end = self.content.find("\n", max(self._reasoning_start, scanned))
+            if end >= 0:
+                self._reasoning_end = end
+            self.reasoning = self.content[self._reasoning_start:end if end >= 0 else len(self.content)].strip()
+
+# Call OpenAI GPT model for persona classification and reasoning, using only top personas
+@timed("classify_with_gpt")
+def classify_with_gpt(bio: str, posts: Union[str, List[str]], top_personas: List[Dict], openai_api_key: str,
+                      cache: Optional[ResponseCache] = None) -> Tuple[str, str]:
+    '''
+    This function uses the OpenAI GPT model to classify the user's input into a persona.
+    Answers are cached on the normalized input, the candidate personas, the
+    prompt template and the model parameters, so a repeated submission is
+    answered without a network call. The request goes through the shared
+    client manager, which applies its timeout, retry and concurrency limits.
+    The bio and posts are first cut down to the prompt token budget (see
+    budget_gpt_input). A call made while an identical one is waiting for
+    its answer shares that answer instead of sending another request.
+    Args : 
+        bio : str
+        posts : str, or List[str] to deduplicate and sample posts individually
+        top_personas : List[Dict]
+        openai_api_key : str
+        cache : ResponseCache, defaults to the process-wide cache
+    Returns :
+        persona : str
+        reasoning : str
+    '''
+    cache, cache_key, prompt, cached = _lookup_classification(bio, posts, top_personas, cache)
+    if cached is not None:
+        return cached
+
+    answer, shared = GPT_FLIGHT.do(cache_key, lambda: _request_classification(openai_api_key, cache, cache_key, prompt))
+    annotate_request(gpt_coalesced=shared)
+    return answer
+
+# Async variant of classify_with_gpt, so batch jobs and servers can fan out with asyncio.gather
+async def classify_with_gpt_async(bio: str, posts: Union[str, List[str]], top_personas: List[Dict], openai_api_key: str,
+                                  cache: Optional[ResponseCache] = None) -> Tuple[str, str]:
+    with timer("classify_with_gpt"):
+        cache, cache_key, prompt, cached = _lookup_classification(bio, posts, top_personas, cache)
+        if cached is not None:
+            return cached
+
+        async def request():
+            messages = _gpt_messages(prompt)
+            start = time.perf_counter()
+            response = await get_client_manager().achat_completion(openai_api_key, messages=messages,
+                                                                   **GPT_MODEL_PARAMS)
+            _record_ttft(time.perf_counter() - start, stream=False)
+            return _finish_classification(cache, cache_key, response.choices[0].message.content, response)
+
+        answer, shared = await GPT_FLIGHT.do_async(cache_key, request)
+        annotate_request(gpt_coalesced=shared)
+        return answer
+
+# Streaming variant of classify_with_gpt, so the UI can show the answer while it is written
+def classify_with_gpt_stream(bio: str, posts: Union[str, List[str]], top_personas: List[Dict], openai_api_key: str,
+                             cache: Optional[ResponseCache] = None) -> Iterator[Tuple[str, str]]:
+    '''
+    Yields (persona, reasoning so far) while the answer streams in: persona
+    is "" until its line is complete, reasoning grows token by token. The
+    last pair is the final answer, parsed and cached as in classify_with_gpt;
+    a cached answer is yielded at once, and an answer that an identical call
+    is already waiting for is yielded once, when it is complete.
+    '''
+    # Time spent at yield is the caller's (e.g. rendering), not the upstream call's
+    with timer("classify_with_gpt_stream") as stage:
+        cache, cache_key, prompt, cached = _lookup_classification(bio, posts, top_personas, cache)
+        if cached is not None:
+            with stage.paused():
+                yield cached
+            return
+
+        # The same answer already on its way to another caller is yielded once it is complete
+        flight, leader = GPT_FLIGHT.begin(cache_key)
+        annotate_request(gpt_coalesced=not leader)
+        if not leader:
+            try:
+                final = flight.result()
+            except LeaderAbandoned:
+                final, _ = GPT_FLIGHT.do(cache_key,
+                                         lambda: _request_classification(openai_api_key, cache, cache_key, prompt))
+            with stage.paused():
+                yield final
+            return
+
+        try:
+            messages = _gpt_messages(prompt)
+            answer = StreamingAnswer()
+            usage_chunk = None
+            start = time.perf_counter()
+            for chunk in get_client_manager().stream_chat_completion(
+                    openai_api_key, messages=messages, stream_options={"include_usage": True}, **GPT_MODEL_PARAMS):
+                if getattr(chunk, "usage", None) is not None:
+                    usage_chunk = chunk
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                if not answer.content:
+                    _record_ttft(time.perf_counter() - start, stream=True)
+                answer.feed(delta)
+                with stage.paused():
+                    yield answer.persona, answer.reasoning
+            final = _finish_classification(cache, cache_key, answer.content, usage_chunk)
+        except Exception as e:
+            GPT_FLIGHT.fail(cache_key, flight, e)
+            raise
+        except BaseException:
+            # Closed before the end (e.g. a rerun stopped the script): waiting callers ask themselves
+            GPT_FLIGHT.abandon(cache_key, flight)
+            raise
+        GPT_FLIGHT.finish(cache_key, flight, final)
+        with stage.paused():
+            yield final
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from src.custom_logger import get_logger
+from src.keyword_cache import get_keyword_cache
+from src.metrics import get_metrics
+from src.persona_bundle import source_version
+from src.persona_index import PersonaList
+from src.persona_predictor import LITE_MODE, load_personas
+
+logger = get_logger()
+
+# Seconds between checks of the persona file; 0 turns the background watcher off
+PERSONA_RELOAD_INTERVAL = float(os.environ.get("PERSONA_RELOAD_INTERVAL", 2))
+
+def validate_personas(personas: List[Dict]):
+    '''
+    Raises ValueError unless every persona has a unique persona_name, a
+    display_name, a description and a non-empty list of string keywords
+    (negative_keywords, if given, must be a list of strings too).
+    '''
+    if not personas:
+        raise ValueError("no personas defined")
+    names = set()
+    for position, persona in enumerate(personas, 1):
+        if not isinstance(persona, dict):
+            raise ValueError(f"persona {position} is not a mapping")
+        name = persona.get("persona_name")
+        if not isinstance(name, str) or not name:
+            raise ValueError(f"persona {position} has no persona_name")
+        if name in names:
+            raise ValueError(f"persona_name {name!r} is defined twice")
+        names.add(name)
+        for field in ("display_name", "description"):
+            if not isinstance(persona.get(field), str):
+                raise ValueError(f"persona {name!r} has no {field}")
+        keywords = persona.get("keywords")
+        if not isinstance(keywords, list) or not keywords or not all(isinstance(kw, str) for kw in keywords):
+            raise ValueError(f"persona {name!r} needs a non-empty list of string keywords")
+        negative = persona.get("negative_keywords") or []
+        if not isinstance(negative, list) or not all(isinstance(kw, str) for kw in negative):
+            raise ValueError(f"persona {name!r} has negative_keywords that are not a list of strings")
+
+class PersonaRegistry:
+    '''
+    The current persona set of a YAML file, reloaded in the background
+    (every `interval` seconds) when the file changes, without a restart.
+
+    A change is noticed by the file's mtime and size and confirmed by its
+    content hash. The new set is loaded through load_personas, which
+    rebuilds the keyword index and lemma tables, and validated; only then is
+    it swapped in, as a single reference assignment. Callers take a snapshot
+    with current() once per request and use it throughout, so a request that
+    is running during a reload sees either the old set or the new one, never
+    a mix. An invalid file is logged and the previous set stays in place.
+    '''
+
+    def __init__(self, yaml_path: str, loader: Callable[[str], PersonaList] = load_personas,
+                 interval: float = PERSONA_RELOAD_INTERVAL):
+        self.yaml_path = yaml_path
+        self.loader = loader
+        self.interval = interval
+        self._reload_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stat = self._file_stat()
+        # Startup has no previous set to fall back on, so an invalid file raises here
+        personas = loader(yaml_path)
+        validate_personas(personas)
+        self._personas = personas
+        get_metrics().set_gauge("personas_loaded", len(personas))
+
+    def current(self) -> PersonaList:
+        return self._personas
+
+    @property
+    def version(self) -> str:
+        return self._personas.version
+
+    def _file_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.yaml_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self) -> bool:
+        '''
+        Reloads if the file changed since the last check. Returns True if a new persona set was swapped in.
+        '''
+        stat = self._file_stat()
+        # A missing file is treated as a transient state of an editor's save, not as an empty set
+        if stat is None or stat == self._stat:
+            return False
+        return self.reload()
+
+    def reload(self) -> bool:
+        with self._reload_lock:
+            self._stat = self._file_stat()
+            metrics = get_metrics()
+            try:
+                with open(self.yaml_path, "rb") as f:
+                    version = source_version(f.read())
+            except OSError as e:
+                logger.warning("Could not read %s to reload personas: %s", self.yaml_path, e)
+                return False
+            if version == self.version:
+                return False
+
+            start = time.perf_counter()
+            try:
+                personas = self.loader(self.yaml_path)
+                validate_personas(personas)
+            except Exception as e:
+                metrics.inc("persona_reloads_total", result="invalid")
+                logger.error("Keeping persona set %s: %s could not be loaded: %s", self.version, self.yaml_path, e)
+                return False
+            elapsed = time.perf_counter() - start
+
+            previous = self._personas
+            self._personas = personas
+            if LITE_MODE:
+                # Lite mode lemmas depend on the persona vocabulary, so cached segments may be stale
+                get_keyword_cache().clear()
+            metrics.observe("persona_reload_seconds", elapsed)
+            metrics.inc("persona_reloads_total", result="ok")
+            metrics.set_gauge("personas_loaded", len(personas))
+            logger.info("Persona set %s -> %s (%d personas) loaded in %.1f ms",
+                        previous.version, personas.version, len(personas), elapsed * 1000)
+            return True
+
+    def start(self) -> "PersonaRegistry":
+        '''
+        Starts the background watcher (unless interval is 0); returns the registry.
+        '''
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="persona-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Persona watcher check failed")
@@ -0,0 +1,114 @@
+import re
+from collections import deque
+from typing import Iterable, List, Sequence, Tuple
+
+# Hyphens and whitespace both separate the words of a phrase keyword,
+# so "open-source" and "open source" normalize to the same word sequence
+PHRASE_SEPARATOR = re.compile(r"[\s\-]+")
+
+def phrase_words(phrase: str) -> Tuple[str, ...]:
+    return tuple(word for word in PHRASE_SEPARATOR.split(phrase.lower()) if word)
+
+def is_phrase(keyword: str) -> bool:
+    return len(phrase_words(keyword)) > 1
+
+class KeywordPhraseMatcher:
+    '''
+    Aho-Corasick automaton over words, finding every multi-word or hyphenated
+    persona keyword in a word sequence in a single left-to-right pass.
+
+    Matches are reported as the lower-cased keyword, which is the key
+    PersonaIndex scores on, so hits can be appended to the extracted tokens.
+    '''
+
+    def __init__(self, phrases: Iterable[str] = ()):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._size = 0
+        for phrase in phrases:
+            self.add(phrase)
+        self.compile()
+
+    def __len__(self):
+        return self._size
+
+    def add(self, phrase: str) -> bool:
+        '''
+        Adds a keyword to the automaton; single words are ignored since the
+        keyword index already matches those directly. Call compile() afterwards.
+        '''
+        words = phrase_words(phrase)
+        if len(words) < 2:
+            return False
+        node = 0
+        for word in words:
+            next_node = self._goto[node].get(word)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[node][word] = next_node
+            node = next_node
+        key = phrase.lower()
+        if key not in self._output[node]:
+            self._output[node].append(key)
+            self._size += 1
+        return True
+
+    def compile(self):
+        '''
+        Builds the failure links breadth-first and folds each node's suffix matches into its output.
+        '''
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for word, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(word, 0)
+                for key in self._output[self._fail[child]]:
+                    if key not in self._output[child]:
+                        self._output[child].append(key)
+                queue.append(child)
+
+    def find(self, words: Sequence[str]) -> List[str]:
+        '''
+        Returns the keyword of every phrase occurrence in words, in order of where each match ends.
+        '''
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        hits = []
+        for word in words:
+            while node and word not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(word, 0)
+            if output[node]:
+                hits.extend(output[node])
+        return hits
+
+    def find_in_doc(self, doc) -> List[str]:
+        '''
+        Unique phrase keywords found in a spaCy Doc, matching either the
+        surface words or their lemmas. Hyphen tokens are skipped so that
+        "open-source" matches like "open source".
+        '''
+        return self.find_in_words(*doc_words(doc))
+
+    def find_in_words(self, surface: Sequence[str], lemmas: Sequence[str]) -> List[str]:
+        '''
+        find_in_doc on the word sequences doc_words extracted from a Doc.
+        '''
+        hits = dict.fromkeys(self.find(surface))
+        hits.update(dict.fromkeys(self.find(lemmas)))
+        return list(hits)
+
+# Lower-cased surface words and lemmas of a Doc as phrase matching sees them
+def doc_words(doc) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    words = [token for token in doc if token.text != "-" and not token.is_space]
+    return tuple(token.lower_ for token in words), tuple(token.lemma_.lower() for token in words)
@@ -0,0 +1,95 @@
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Estimated tokens of a whole GPT prompt (template, candidates, bio and posts), and of any single post or bio
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PERSONA_PROMPT_TOKEN_BUDGET", 2000))
+MAX_POST_TOKENS = int(os.environ.get("PERSONA_MAX_POST_TOKENS", 250))
+
+# Characters per token of the estimate below
+CHARS_PER_TOKEN = 4
+ELLIPSIS = "…"
+WHITESPACE = re.compile(r"\s+")
+
+# Rough token count (about four characters per token in English), enough for budgeting
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+def trim_text(text: str, max_chars: int) -> str:
+    '''
+    Cuts text to at most max_chars, at a word boundary where there is one in
+    the second half, and marks the cut with an ellipsis.
+    '''
+    if len(text) <= max_chars:
+        return text
+    if max_chars <= len(ELLIPSIS):
+        return ""
+    cut = text[:max_chars - len(ELLIPSIS)]
+    space = cut.rfind(" ")
+    if space > len(cut) // 2:
+        cut = cut[:space]
+    return cut.rstrip() + ELLIPSIS
+
+def dedupe_posts(posts: List[str]) -> List[str]:
+    '''
+    Posts in their original order without empty posts and repeats, ignoring case and whitespace.
+    '''
+    seen = set()
+    unique = []
+    for post in posts:
+        key = WHITESPACE.sub(" ", post).strip().lower()
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(post)
+    return unique
+
+# Positions of count posts spread evenly over n, always including the first and last
+def _spread(n: int, count: int) -> List[int]:
+    if count <= 1:
+        return [0][:count]
+    return [round(i * (n - 1) / (count - 1)) for i in range(count)]
+
+# Characters of the posts joined with spaces
+def _joined_length(posts: List[str]) -> int:
+    return sum(map(len, posts)) + max(0, len(posts) - 1)
+
+def fit_posts(bio: str, posts: List[str], token_budget: int,
+              max_post_tokens: Optional[int] = MAX_POST_TOKENS) -> Tuple[str, List[str], Dict[str, int]]:
+    '''
+    Cuts the bio and posts down to about token_budget estimated tokens:
+    repeated posts are dropped, the bio and posts longer than
+    max_post_tokens are cut, and if the rest is still too long an evenly
+    spaced sample of the posts is kept, in order. The last post kept is cut
+    to fill what is left. Returns the bio, the posts to send and counts of
+    the posts received, sent, duplicated and of the texts cut.
+    '''
+    unique = dedupe_posts(posts)
+    stats = {"posts": len(posts), "duplicates": len(posts) - len(unique), "truncated": 0}
+    if max_post_tokens is not None:
+        max_chars = max_post_tokens * CHARS_PER_TOKEN
+        trimmed = [trim_text(post, max_chars) for post in unique]
+        stats["truncated"] += sum(1 for post, cut in zip(unique, trimmed) if cut != post)
+        unique = trimmed
+        if len(bio) > max_chars:
+            bio = trim_text(bio, max_chars)
+            stats["truncated"] += 1
+
+    available = max(0, token_budget) * CHARS_PER_TOKEN
+    if len(bio) > available:
+        bio = trim_text(bio, available)
+        stats["truncated"] += 1
+    # A space separates the bio and the posts in the estimate
+    available -= len(bio) + 1
+
+    kept = unique
+    if _joined_length(kept) > available:
+        for count in range(len(unique) - 1, 0, -1):
+            kept = [unique[i] for i in _spread(len(unique), count)]
+            if _joined_length(kept) <= available:
+                break
+        if _joined_length(kept) > available:
+            last = trim_text(kept[-1], available - _joined_length(kept[:-1]) - 1)
+            kept = kept[:-1] + [last] if last else kept[:-1]
+            stats["truncated"] += 1
+    stats["posts_sent"] = len(kept)
+    return bio, kept, stats
@@ -0,0 +1,166 @@
+import ast
+import json
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Plain-text log of earlier versions: "2025-05-25 18:58:03 - INFO - message", messages may continue on the next lines
+TEXT_LINE = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) - ([A-Z]+) - (.*)$")
+QUERY_PREFIX = "Query received - Bio: "
+POSTS_MARKER = ", Posts: ["
+RULE_MATCH = re.compile(r"^Rule-based match - Persona: (.*), Score: ([\d.]+), Keywords: (\[.*\]), Confidence: ([\d.]+)%$",
+                        re.S)
+GPT_ANALYSIS = re.compile(r"^GPT Analysis - Selected Persona: (.*?), Reasoning: (.*)$", re.S)
+RAW_RESPONSE_PREFIX = "Raw GPT Response:"
+# Upstream processing time, from the OpenAI response headers logged by httpx at DEBUG level
+PROCESSING_MS = re.compile(r"b?'openai-processing-ms', b?'(\d+)'")
+
+# A recorded prediction: what the user sent and what the app decided
+def new_record(source: str, ts: Optional[float] = None) -> Dict:
+    return {"source": source, "ts": ts, "bio": "", "posts": [], "rule_based": [],
+            "gpt_persona": None, "gpt_reasoning": None, "gpt_response": None, "gpt_latency_ms": None}
+
+def _parse_query(message: str):
+    # Bio and posts are user text: take the first split whose remainder is a list literal
+    start = len(QUERY_PREFIX)
+    while True:
+        at = message.find(POSTS_MARKER, start)
+        if at < 0:
+            return None
+        try:
+            posts = ast.literal_eval(message[at + len(POSTS_MARKER) - 1:])
+        except (ValueError, SyntaxError):
+            start = at + 1
+            continue
+        if isinstance(posts, list) and all(isinstance(post, str) for post in posts):
+            return message[len(QUERY_PREFIX):at], posts
+        start = at + 1
+
+def _text_entries(lines: Iterable[str]) -> Iterator[tuple]:
+    # (timestamp, level, message) per entry, joining continuation lines to the entry they belong to
+    entry = None
+    for line in lines:
+        line = line.rstrip("\n")
+        match = TEXT_LINE.match(line)
+        if match:
+            if entry is not None:
+                yield entry
+            entry = [match.group(1), match.group(2), match.group(3)]
+        elif entry is not None:
+            entry[2] += "\n" + line
+    if entry is not None:
+        yield entry
+
+def _text_timestamp(value: str) -> float:
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").timestamp()
+
+def read_text_log(lines: Iterable[str], skipped: Counter) -> Iterator[Dict]:
+    '''
+    Recorded predictions of the plain-text log: one per "Query received"
+    entry, with the rule-based matches (display names, as logged), the raw
+    and parsed GPT answer and the upstream latency of the GPT call.
+    '''
+    record = None
+    sent_at = round_trip_ms = None
+    for timestamp, level, message in _text_entries(lines):
+        if message.startswith(QUERY_PREFIX):
+            if record is not None:
+                yield _with_latency(record, round_trip_ms)
+            record, sent_at, round_trip_ms = None, None, None
+            parsed = _parse_query(message)
+            if parsed is None:
+                skipped["unparseable query"] += 1
+                continue
+            record = new_record("text", _text_timestamp(timestamp))
+            record["bio"], record["posts"] = parsed
+        elif record is None:
+            continue
+        elif message.startswith("Rule-based match - "):
+            match = RULE_MATCH.match(message)
+            if match:
+                record["rule_based"].append({
+                    "persona": match.group(1), "score": float(match.group(2)),
+                    "keywords": ast.literal_eval(match.group(3)), "confidence": float(match.group(4)),
+                })
+        elif message.startswith(RAW_RESPONSE_PREFIX):
+            record["gpt_response"] = message[len(RAW_RESPONSE_PREFIX):].strip("\n")
+        elif message.startswith("GPT Analysis - "):
+            match = GPT_ANALYSIS.match(message)
+            if match:
+                record["gpt_persona"], record["gpt_reasoning"] = match.group(1), match.group(2)
+        elif message.startswith("Sending HTTP Request: POST") and message.endswith("/chat/completions"):
+            sent_at = _text_timestamp(timestamp)
+        elif sent_at is not None and message.startswith("HTTP Request: POST"):
+            round_trip_ms = (_text_timestamp(timestamp) - sent_at) * 1000
+        elif record["gpt_latency_ms"] is None:
+            processing = PROCESSING_MS.search(message)
+            if processing:
+                record["gpt_latency_ms"] = float(processing.group(1))
+    if record is not None:
+        yield _with_latency(record, round_trip_ms)
+
+# The round trip between the request and response log lines has whole seconds only,
+# so it is the fallback for logs without the processing time header
+def _with_latency(record: Dict, round_trip_ms: Optional[float]) -> Dict:
+    if record["gpt_latency_ms"] is None:
+        record["gpt_latency_ms"] = round_trip_ms
+    return record
+
+def record_from_json(entry: Dict, skipped: Counter) -> Optional[Dict]:
+    '''
+    Recorded prediction of a JSON-lines log entry, or of a corpus line
+    written by the replay harness. Only sampled requests carry the full bio
+    and posts; the rest can't be replayed and are counted in skipped.
+    '''
+    if "event" not in entry:
+        return entry if isinstance(entry.get("bio"), str) else None
+    if entry["event"] != "prediction":
+        return None
+    if "error" in entry:
+        skipped["failed request"] += 1
+        return None
+    if not isinstance(entry.get("bio"), str) or not all(isinstance(post, str) for post in entry.get("posts", [])):
+        skipped["not sampled"] += 1
+        return None
+    record = new_record("jsonl", entry.get("ts"))
+    record["bio"], record["posts"] = entry["bio"], list(entry.get("posts", []))
+    record["rule_based"] = list(entry.get("rule_based", []))
+    record["gpt_persona"], record["gpt_reasoning"] = entry.get("gpt_persona"), entry.get("gpt_reasoning")
+    if isinstance(entry.get("gpt_raw_response"), str):
+        record["gpt_response"] = entry["gpt_raw_response"]
+    # A cached answer took no upstream time; for a streamed one this is the time to its first token
+    if not entry.get("gpt_cached"):
+        record["gpt_latency_ms"] = entry.get("gpt_ttft_ms")
+    return record
+
+def read_query_log(path: str, personas: Optional[List[Dict]] = None,
+                   skipped: Optional[Counter] = None) -> Iterator[Dict]:
+    '''
+    Streams the recorded predictions of a query log, in either format (the
+    plain-text log or the JSON-lines request log, told apart by the first
+    line), or of a replay corpus.
+
+    Given the personas, rule-based matches logged under their display name
+    are mapped to the persona_name, so both formats compare alike. Requests
+    that can't be replayed are counted by reason in skipped.
+    '''
+    if skipped is None:
+        skipped = Counter()
+    display_names = {p["display_name"]: p["persona_name"] for p in personas or []}
+    with open(path, encoding="utf-8") as f:
+        first = f.readline()
+        if first.lstrip().startswith("{"):
+            records = (record_from_json(json.loads(line), skipped) for line in _chain(first, f) if line.strip())
+        else:
+            records = read_text_log(_chain(first, f), skipped)
+        for record in records:
+            if record is None:
+                continue
+            for match in record["rule_based"]:
+                match["persona"] = display_names.get(match["persona"], match["persona"])
+            yield record
+
+def _chain(first: str, rest: Iterable[str]) -> Iterator[str]:
+    yield first
+    yield from rest
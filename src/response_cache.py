@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from src.custom_logger import get_logger
+
+logger = get_logger()
+
+DEFAULT_CACHE_PATH = os.environ.get("GPT_CACHE_PATH", ".cache/gpt_responses.sqlite3")
+DEFAULT_TTL_SECONDS = int(os.environ.get("GPT_CACHE_TTL", 7 * 24 * 3600))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("GPT_CACHE_MAX_ENTRIES", 10000))
+
+# Lower-case and collapse whitespace so trivially different submissions share an entry
+def normalize_text(text: str) -> str:
+    return " ".join(text.lower().split())
+
+def make_cache_key(bio: str, posts: str, persona_names: List[str], prompt_template: str, model_params: Dict) -> str:
+    '''
+    Hash of everything that determines the GPT answer: the normalized input,
+    the candidate persona set, the prompt template and the model parameters.
+    '''
+    payload = json.dumps({
+        "bio": normalize_text(bio),
+        "posts": normalize_text(posts),
+        "personas": sorted(persona_names),
+        "prompt": hashlib.sha256(prompt_template.encode("utf-8")).hexdigest(),
+        "model": model_params,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    '''
+    Persistent (persona, reasoning) cache for GPT classifications, stored in SQLite.
+
+    Entries expire after ttl_seconds; once more than max_entries are stored the
+    least recently used ones are evicted. Safe to share across Streamlit sessions.
+    If the database can't be created (e.g. a read-only deploy), answers are
+    cached in memory for the life of the process instead.
+    '''
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        try:
+            self._conn = self._connect(path)
+        except (OSError, sqlite3.Error) as e:
+            # Only a cache: a missing or unwritable .cache must not stop classification
+            logger.warning("GPT response cache %s unavailable, caching in memory: %s", path, e)
+            self.path = ":memory:"
+            self._conn = self._connect(self.path)
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, persona TEXT, reasoning TEXT, created_at REAL, last_used REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            conn.commit()
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[str, str]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT persona, reasoning, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[2] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0], row[1]
+
+    def set(self, key: str, persona: str, reasoning: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, persona, reasoning, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, persona, reasoning, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": size,
+        }
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+# Process-wide cache used by classify_with_gpt when no cache is passed in
+def get_response_cache() -> ResponseCache:
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
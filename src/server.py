@@ -0,0 +1,409 @@
+'''
+Headless HTTP inference server.
+
+Usage (from the repository root):
+    python -m src.server [--port 8000] [--window-ms 5] [--max-batch 32] [--queue-size 1024] [--gpt-workers 8]
+
+Endpoints:
+    POST /predict        {"bio": str, "posts": [str] | str, "top_n": 3, "gpt": false}
+    POST /predict/batch  {"users": [{"id": ..., "bio": ..., "posts": ...}], "top_n": 3, "gpt": false}
+    GET  /healthz        readiness, queue depth and persona set version
+    GET  /metrics        Prometheus text format (src.metrics)
+
+Users from concurrent requests are gathered by a micro-batcher for up to
+--window-ms and their keywords extracted together, per segment (the bio and
+each post) through the shared keyword cache as in the app, so a user gets
+the same keywords and scores from every entry point. Uncached segments are
+parsed in one nlp.pipe call on the batcher thread, which keeps parsing to
+one core, or with PERSONA_PARSE_WORKERS=N split across N worker processes
+(src/parse_pool.py). The batcher queue is
+bounded: when it is full the request is
+rejected with 429 and a Retry-After header. GPT classifications (opt-in
+per request, "gpt": true) run on their own thread pool and need
+OPENAI_API_KEY or openai_api_key in .streamlit/secrets.toml.
+
+The persona file is watched (PERSONA_RELOAD_INTERVAL seconds, see
+src/persona_registry.py) and edits are swapped in without a restart; every
+result carries the "personas_version" it was scored with.
+'''
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.batch import serialize_scores
+from src.custom_logger import get_logger
+from src.metrics import get_metrics, to_prometheus
+from src.persona_registry import PersonaRegistry
+from src.response_cache import ResponseCache
+from src.persona_predictor import (
+    LITE_MODE, classify_with_gpt, extract_users_keywords, get_nlp, get_parse_pool, score_personas_batch,
+    user_segments
+)
+
+logger = get_logger()
+
+DEFAULT_PERSONAS_PATH = "data/personas/personas.yaml"
+SECRETS_PATH = ".streamlit/secrets.toml"
+# Defaults, overridable through the environment or the command line
+BATCH_WINDOW_MS = float(os.environ.get("PERSONA_BATCH_WINDOW_MS", 5))
+MAX_BATCH_SIZE = int(os.environ.get("PERSONA_MAX_BATCH_SIZE", 32))
+QUEUE_SIZE = int(os.environ.get("PERSONA_QUEUE_SIZE", 1024))
+GPT_WORKERS = int(os.environ.get("PERSONA_GPT_WORKERS", 8))
+REQUEST_TIMEOUT = float(os.environ.get("PERSONA_REQUEST_TIMEOUT", 30))
+# Largest /predict/batch request accepted (never more than the queue holds)
+MAX_USERS_PER_REQUEST = 256
+MAX_BODY_BYTES = 10 * 1024 * 1024
+RETRY_AFTER_SECONDS = 1
+
+class Overloaded(Exception):
+    pass
+
+class MicroBatcher:
+    '''
+    Collects items from many threads and hands them to process_batch in
+    groups: the first item opens a window of window_ms, and the batch closes
+    when the window ends or max_batch items are waiting. process_batch runs
+    on the batcher's own thread and returns one result per item.
+    '''
+
+    def __init__(self, process_batch: Callable[[List], List], max_batch: int = MAX_BATCH_SIZE,
+                 window_ms: float = BATCH_WINDOW_MS, queue_size: int = QUEUE_SIZE):
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self.queue_size = queue_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._submit_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit_many(self, items: List) -> List[Future]:
+        '''
+        Queues all items or none of them; raises Overloaded if they don't fit.
+        '''
+        futures = [Future() for _ in items]
+        with self._submit_lock:
+            if self._queue.qsize() + len(items) > self.queue_size:
+                raise Overloaded(f"queue full ({self._queue.qsize()}/{self.queue_size})")
+            for item, future in zip(items, futures):
+                self._queue.put_nowait((item, future))
+        return futures
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            items = [item for item, _ in batch]
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+def read_openai_api_key(secrets_path: str = SECRETS_PATH) -> Optional[str]:
+    '''
+    OPENAI_API_KEY, or the key the Streamlit app reads from its secrets file.
+    '''
+    key = os.environ.get("OPENAI_API_KEY")
+    if key or not os.path.exists(secrets_path):
+        return key
+    import tomllib
+    with open(secrets_path, "rb") as f:
+        return tomllib.load(f).get("general", {}).get("openai_api_key")
+
+class PredictionService:
+    '''
+    Rule-based scoring through the micro-batcher plus optional GPT
+    classification on a bounded thread pool.
+    '''
+
+    def __init__(self, personas_path: str = DEFAULT_PERSONAS_PATH, openai_api_key: Optional[str] = None,
+                 max_batch: int = MAX_BATCH_SIZE, window_ms: float = BATCH_WINDOW_MS,
+                 queue_size: int = QUEUE_SIZE, gpt_workers: int = GPT_WORKERS,
+                 request_timeout: float = REQUEST_TIMEOUT, cache: Optional[ResponseCache] = None):
+        # Reloaded in the background when the persona file changes; each batch scores against one snapshot
+        self.registry = PersonaRegistry(personas_path).start()
+        self.openai_api_key = openai_api_key
+        self.cache = cache
+        self.request_timeout = request_timeout
+        self.metrics = get_metrics()
+        # Load the model now so the first request doesn't pay for it
+        pool = get_parse_pool()
+        if pool is not None:
+            # Starts every worker, each loading its own copy
+            pool.analyze(["warm-up"])
+        elif not LITE_MODE:
+            get_nlp()
+        self.batcher = MicroBatcher(self._score_batch, max_batch, window_ms, queue_size)
+        self.gpt_executor = ThreadPoolExecutor(max_workers=gpt_workers, thread_name_prefix="server-gpt")
+
+    # Runs on the batcher thread: one nlp.pipe pass (or one chunk per parse worker) over the uncached segments
+    # and one vectorized scoring call per top_n in the batch. Each result is (persona set version, scores)
+    def _score_batch(self, items: List[Tuple[List[str], int]]) -> List:
+        self.metrics.observe("server_batch_size", len(items))
+        personas = self.registry.current()
+        with self.metrics.timer("server_batch"):
+            token_lists = extract_users_keywords([segments for segments, _ in items], personas.index.phrases)
+            results = [None] * len(items)
+            for top_n in {top_n for _, top_n in items}:
+                positions = [i for i, (_, n) in enumerate(items) if n == top_n]
+                scores = score_personas_batch(personas, [token_lists[i] for i in positions], top_n=top_n)
+                for i, user_scores in zip(positions, scores):
+                    results[i] = (personas.version, user_scores)
+            return results
+
+    def predict(self, users: List[Dict], top_n: int = 3, gpt: bool = False) -> List[Dict]:
+        '''
+        users are dicts with bio, posts and an optional id. Raises Overloaded
+        if the batcher queue can't take them all, TimeoutError if they aren't
+        answered within the request timeout.
+        '''
+        deadline = time.perf_counter() + self.request_timeout
+        futures = self.batcher.submit_many([(user_segments(u["bio"], u["posts"]), top_n) for u in users])
+        results = []
+        gpt_futures = []
+        for user, future in zip(users, futures):
+            version, scores = future.result(timeout=max(0, deadline - time.perf_counter()))
+            result = {"personas": serialize_scores(scores), "personas_version": version}
+            if "id" in user:
+                result = {"id": user["id"], **result}
+            results.append(result)
+            if gpt and self.openai_api_key:
+                candidates = [p[0] for p in scores if p[1] > 0 and p[2]]
+                gpt_futures.append((result, self.gpt_executor.submit(
+                    classify_with_gpt, user["bio"], user["posts"], candidates, self.openai_api_key,
+                    self.cache)))
+        for result, future in gpt_futures:
+            persona, reasoning = future.result(timeout=max(0, deadline - time.perf_counter()))
+            result["gpt"] = {"persona": persona, "reasoning": reasoning}
+        return results
+
+    def health(self) -> Dict:
+        return {
+            "status": "ok",
+            "personas": len(self.registry.current()),
+            "personas_version": self.registry.version,
+            "queue_depth": self.batcher.depth(),
+            "queue_size": self.batcher.queue_size,
+            "gpt": bool(self.openai_api_key),
+        }
+
+    def close(self):
+        self.registry.stop()
+        self.gpt_executor.shutdown(wait=False, cancel_futures=True)
+
+class BadRequest(Exception):
+    pass
+
+def parse_user(user) -> Dict:
+    if not isinstance(user, dict):
+        raise BadRequest("each user must be an object")
+    bio = user.get("bio", "")
+    posts = user.get("posts", [])
+    if isinstance(posts, str):
+        posts = [posts]
+    if not isinstance(bio, str) or not isinstance(posts, list) or not all(isinstance(p, str) for p in posts):
+        raise BadRequest("bio must be a string and posts a list of strings")
+    if not bio.strip() and not any(p.strip() for p in posts):
+        raise BadRequest("bio and posts are empty")
+    parsed = {"bio": bio, "posts": posts}
+    if "id" in user:
+        parsed["id"] = user["id"]
+    return parsed
+
+def parse_options(body: Dict) -> Tuple[int, bool]:
+    top_n = body.get("top_n", 3)
+    if not isinstance(top_n, int) or isinstance(top_n, bool) or top_n < 1:
+        raise BadRequest("top_n must be a positive integer")
+    return top_n, bool(body.get("gpt", False))
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Listen backlog; socketserver's default of 5 resets connections under bursts
+    request_queue_size = 128
+
+class PredictionServer:
+    '''
+    ThreadingHTTPServer in front of a PredictionService; start()/stop() or use as a context manager.
+    '''
+
+    def __init__(self, service: PredictionService, host: str = "127.0.0.1", port: int = 8000):
+        self.service = service
+        self.httpd = _HTTPServer((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "PredictionServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="prediction-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.service.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _make_handler(self):
+        service = self.service
+        metrics = get_metrics()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; without TCP_NODELAY small
+            # responses wait on the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if self.path == "/healthz":
+                    self._send(200, service.health())
+                elif self.path == "/metrics":
+                    self._send_text(200, to_prometheus(metrics.snapshot()))
+                else:
+                    self._send(404, {"error": f"unknown path {self.path}"})
+
+            def do_POST(self):
+                if self.path not in ("/predict", "/predict/batch"):
+                    self._discard_body()
+                    self._send(404, {"error": f"unknown path {self.path}"})
+                    return
+                status = 500
+                with metrics.timer("server_request"):
+                    try:
+                        body = self._read_json()
+                        top_n, gpt = parse_options(body)
+                        if self.path == "/predict":
+                            users = [parse_user(body)]
+                        else:
+                            users = body.get("users")
+                            if not isinstance(users, list) or not users:
+                                raise BadRequest("users must be a non-empty list")
+                            limit = min(MAX_USERS_PER_REQUEST, service.batcher.queue_size)
+                            if len(users) > limit:
+                                status = 413
+                                self._send(413, {"error": f"at most {limit} users per request"})
+                                return
+                            users = [parse_user(u) for u in users]
+                        results = service.predict(users, top_n=top_n, gpt=gpt)
+                        status = 200
+                        self._send(200, results[0] if self.path == "/predict" else {"results": results})
+                    except BadRequest as e:
+                        status = 400
+                        self._send(400, {"error": str(e)})
+                    except Overloaded as e:
+                        status = 429
+                        self._send(429, {"error": f"overloaded: {e}"}, {"Retry-After": str(RETRY_AFTER_SECONDS)})
+                    except (TimeoutError, FutureTimeout):
+                        status = 503
+                        self._send(503, {"error": "timed out"})
+                    except Exception as e:
+                        logger.exception(f"Prediction request failed: {e}")
+                        self._send(500, {"error": "internal error"})
+                    finally:
+                        metrics.inc("server_responses_total", path=self.path, status=status)
+
+            # A body that won't be read closes the connection after the reply:
+            # on keep-alive its bytes would be taken for the next request
+            def _content_length(self) -> int:
+                value = self.headers.get("Content-Length", "0").strip()
+                if not value.isdigit():
+                    self.close_connection = True
+                    raise BadRequest("invalid Content-Length header")
+                if int(value) > MAX_BODY_BYTES:
+                    self.close_connection = True
+                    raise BadRequest("request body too large")
+                return int(value)
+
+            def _discard_body(self):
+                try:
+                    self.rfile.read(self._content_length())
+                except BadRequest:
+                    pass
+
+            def _read_json(self) -> Dict:
+                length = self._content_length()
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError as e:
+                    # Also bodies that aren't UTF-8
+                    raise BadRequest(f"invalid JSON: {e}")
+                if not isinstance(body, dict):
+                    raise BadRequest("request body must be a JSON object")
+                return body
+
+            def _send(self, status, body, headers=None):
+                self._send_bytes(status, json.dumps(body, ensure_ascii=False).encode("utf-8"),
+                                 "application/json", headers)
+
+            def _send_text(self, status, text):
+                self._send_bytes(status, text.encode("utf-8"), "text/plain; version=0.0.4")
+
+            def _send_bytes(self, status, data, content_type, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.server", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--personas", default=DEFAULT_PERSONAS_PATH)
+    parser.add_argument("--window-ms", type=float, default=BATCH_WINDOW_MS, help="micro-batch gathering window")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH_SIZE, help="texts per nlp.pipe call")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="queued texts before answering 429")
+    parser.add_argument("--gpt-workers", type=int, default=GPT_WORKERS)
+    args = parser.parse_args(argv)
+
+    service = PredictionService(args.personas, read_openai_api_key(), args.max_batch, args.window_ms,
+                                args.queue_size, args.gpt_workers)
+    server = PredictionServer(service, args.host, args.port)
+    print(f"Serving on {server.url} (GPT {'enabled' if service.openai_api_key else 'disabled'})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        service.close()
+
+if __name__ == "__main__":
+    main()
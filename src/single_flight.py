@@ -0,0 +1,130 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from src.metrics import get_metrics
+
+# Set PERSONA_SINGLE_FLIGHT=0 to run every call on its own, even when an identical one is in progress
+SINGLE_FLIGHT = os.environ.get("PERSONA_SINGLE_FLIGHT", "1") != "0"
+
+class LeaderAbandoned(Exception):
+    '''
+    The call a follower was waiting on stopped without a result (its thread
+    was interrupted or its generator closed); the follower runs it itself.
+    '''
+
+class SingleFlight:
+    '''
+    Coalesces identical calls that are in progress at the same time. The
+    first caller for a key (the leader) does the work; callers arriving with
+    the same key before it is done (followers) wait for it and share its
+    result, or its exception. Nothing is kept once a call is over: a later
+    call with the same key runs again (remembering results is up to a cache).
+
+    Every call is counted in single_flight_calls_total, labelled with the
+    name as call and with whether it led or was coalesced;
+    single_flight_in_progress is the number of keys being worked on.
+    '''
+
+    def __init__(self, name: str, enabled: bool = SINGLE_FLIGHT):
+        self.name = name
+        self.enabled = enabled
+        self.leaders = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+
+    def begin(self, key: Hashable) -> Tuple[Future, bool]:
+        '''
+        Joins the call in progress for key, or starts one. Returns its future
+        and whether the caller is the leader, which must then end the call
+        with finish, fail or abandon. When disabled, every caller leads.
+        '''
+        if not self.enabled:
+            return Future(), True
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+            in_progress = len(self._calls)
+        metrics = get_metrics()
+        metrics.inc("single_flight_calls_total", call=self.name, result="leader" if leader else "coalesced")
+        metrics.set_gauge("single_flight_in_progress", in_progress, call=self.name)
+        return future, leader
+
+    def _end(self, key: Hashable, future: Future):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+            in_progress = len(self._calls)
+        get_metrics().set_gauge("single_flight_in_progress", in_progress, call=self.name)
+
+    def finish(self, key: Hashable, future: Future, result: Any):
+        self._end(key, future)
+        future.set_result(result)
+
+    def fail(self, key: Hashable, future: Future, error: BaseException):
+        self._end(key, future)
+        future.set_exception(error)
+
+    def abandon(self, key: Hashable, future: Future):
+        self.fail(key, future, LeaderAbandoned(f"{self.name} call abandoned by its leader"))
+
+    def _lead(self, key: Hashable, future: Future, fn: Callable[[], Any]) -> Any:
+        try:
+            result = fn()
+        except Exception as e:
+            self.fail(key, future, e)
+            raise
+        except BaseException:
+            self.abandon(key, future)
+            raise
+        self.finish(key, future, result)
+        return result
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        '''
+        fn() for key, run once for all concurrent callers. Returns the result
+        and whether it was shared from another caller's call.
+        '''
+        while True:
+            future, leader = self.begin(key)
+            if leader:
+                return self._lead(key, future, fn), False
+            try:
+                return future.result(), True
+            except LeaderAbandoned:
+                continue
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        '''
+        Async counterpart of do: awaits fn() once for all concurrent callers,
+        threads and coroutines alike, without blocking the event loop.
+        '''
+        while True:
+            future, leader = self.begin(key)
+            if not leader:
+                try:
+                    return await asyncio.wrap_future(future), True
+                except LeaderAbandoned:
+                    continue
+            try:
+                result = await fn()
+            except Exception as e:
+                self.fail(key, future, e)
+                raise
+            except BaseException:
+                # Cancelled: a waiting follower takes over instead of seeing the cancellation
+                self.abandon(key, future)
+                raise
+            self.finish(key, future, result)
+            return result, False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.coalesced, "in_progress": len(self._calls)}
@@ -1,5 +1,6 @@
 import streamlit as st
-from src.image_utils import get_image_base64
+from src.image_utils import get_image_base64, get_image_data_uri
+from src.metrics import timed
 import time
 
 def show_loading_animation():
@@ -26,6 +27,30 @@ def show_loading_animation():
         progress_bar.empty()
         status_text.empty()
 
+class PipelineProgress:
+    """Progress bar driven by the real prediction stages instead of timed messages"""
+
+    STAGES = {
+        "parse": "Scanning your digital footprint...",
+        "score": "Analyzing your vibe...",
+        "llm": "Decoding your persona...",
+    }
+
+    def __init__(self):
+        self.progress_bar = st.progress(0)
+        self.status_text = st.empty()
+        self.completed = 0
+
+    def stage(self, name):
+        """Mark the start of a pipeline stage"""
+        self.status_text.text(self.STAGES[name])
+        self.progress_bar.progress(self.completed / len(self.STAGES))
+        self.completed += 1
+
+    def done(self):
+        self.progress_bar.empty()
+        self.status_text.empty()
+
 def show_intro_message(sleep_time=2):
     """Show the intro message for 2 seconds"""
     intro_container = st.empty()
@@ -61,6 +86,7 @@ def display_personas_sidebar(personas):
         st.sidebar.markdown(f"{persona['description']}")
         st.sidebar.markdown("---")
 
+@timed("render_images")
 def display_persona_images(matching_persona):
     """Display the reference images for a persona"""
     st.markdown("### Notable Figures & Influencers")
@@ -85,61 +111,60 @@ def display_persona_images(matching_persona):
     """, unsafe_allow_html=True)
     
     # Notable Figures
-    figures = matching_persona.get('notable_figures', [])
-    if figures:
-        st.markdown("#### Notable Figures you can get inspired by")
-        cols = st.columns(3)
-        for i, figure in enumerate(figures):
-            col = cols[i % 3]
-            with col:
-                try:
-                    image_path = f"data/ref_imgs/{figure}.jpeg"
-                    st.markdown(f"""
-                        <div class="image-item">
-                            <img src="data:image/jpeg;base64,{get_image_base64(image_path)}" class="circular-image">
-                            <p>{figure}</p>
-                        </div>
-                    """, unsafe_allow_html=True)
-                except:
-                    st.write(f"*{figure}*")
-    
+    display_image_grid("#### Notable Figures you can get inspired by", matching_persona.get('notable_figures', []))
+
     # Notable Influencers
-    influencers = matching_persona.get('notable_influencers', [])
-    if influencers:
-        st.markdown("#### Influencers you might relate to")
-        cols = st.columns(3)
-        for i, influencer in enumerate(influencers):
-            col = cols[i % 3]
-            with col:
-                try:
-                    image_path = f"data/ref_imgs/{influencer}.jpeg"
-                    st.markdown(f"""
-                        <div class="image-item">
-                            <img src="data:image/jpeg;base64,{get_image_base64(image_path)}" class="circular-image">
-                            <p>{influencer}</p>
-                        </div>
-                    """, unsafe_allow_html=True)
-                except:
-                    st.write(f"*{influencer}*")
-    
+    display_image_grid("#### Influencers you might relate to", matching_persona.get('notable_influencers', []))
+
     # Related Entities
-    entities = matching_persona.get('related_entities', [])
-    if entities:
-        st.markdown("#### Brands & Organizations related to you")
-        cols = st.columns(3)
-        for i, entity in enumerate(entities):
-            col = cols[i % 3]
-            with col:
-                try:
-                    image_path = f"data/ref_imgs/{entity}.jpeg"
-                    st.markdown(f"""
-                        <div class="image-item">
-                            <img src="data:image/jpeg;base64,{get_image_base64(image_path)}" class="circular-image">
-                            <p>{entity}</p>
-                        </div>
-                    """, unsafe_allow_html=True)
-                except:
-                    st.write(f"*{entity}*")
+    display_image_grid("#### Brands & Organizations related to you", matching_persona.get('related_entities', []))
+
+class GptPersonaView:
+    """GPT answer shown in place: the persona as soon as GPT names it, the reasoning while it is written"""
+
+    def __init__(self, personas):
+        self.personas = personas
+        self.header = st.empty()
+        self.name = st.empty()
+        self.reasoning = st.empty()
+        self.shown_persona = ""
+        self.reasoning.caption("Asking GPT for a second opinion...")
+
+    def update(self, persona, reasoning, final=False):
+        if persona and persona != self.shown_persona:
+            matching_persona = next((p for p in self.personas if p['persona_name'] == persona), None)
+            display_name = matching_persona['display_name'] if matching_persona else persona
+            self.header.subheader(":crystal_ball: GPT-Analyzed Persona :crystal_ball:")
+            self.name.markdown(f"<div style='font-size:2rem;'>{display_name}</div>", unsafe_allow_html=True)
+            self.shown_persona = persona
+        if reasoning or final:
+            # A cursor marks reasoning that is still being written
+            cursor = "" if final else " ▌"
+            self.reasoning.markdown(f"<b>Reasoning:</b> {reasoning}{cursor}", unsafe_allow_html=True)
+
+    def clear(self):
+        self.header.empty()
+        self.name.empty()
+        self.reasoning.empty()
+
+def display_image_grid(title, names):
+    """Display a titled three-column grid of circular reference images"""
+    if not names:
+        return
+    st.markdown(title)
+    cols = st.columns(3)
+    for i, name in enumerate(names):
+        col = cols[i % 3]
+        with col:
+            try:
+                st.markdown(f"""
+                    <div class="image-item">
+                        <img src="{get_image_data_uri(name)}" class="circular-image">
+                        <p>{name}</p>
+                    </div>
+                """, unsafe_allow_html=True)
+            except:
+                st.write(f"*{name}*")
 
 def display_main_ui():
     """Display the main UI components"""